@@ -1,7 +1,7 @@
 #!/bin/sh
 
 sudo apt-get update -y
-sudo apt-get install -y make git python-dev python-setuptools
+sudo apt-get install -y make git python-dev python-setuptools zlib1g-dev
 sudo apt-get install -y python-numpy python-numpy-dev python-scipy python-matplotlib
 sudo apt-get install -y python-qt4 python-qt4-gl
 sudo apt-get install -y python-pyqt5 python-pyqt5.qtopengl python-pyqt5.qtsvg
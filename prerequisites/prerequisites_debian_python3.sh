@@ -1,7 +1,7 @@
 #!/bin/sh
 
 sudo apt-get update -y
-sudo apt-get install -y make git python3-dev python3-setuptools
+sudo apt-get install -y make git python3-dev python3-setuptools zlib1g-dev
 sudo apt-get install -y python3-numpy python3-numpy-dev python3-scipy python3-matplotlib
 sudo apt-get install -y python3-pyqt4 python3-pyqt4.qtopengl
 sudo apt-get install -y python3-pyqt5 python3-pyqt5.qtopengl python3-pyqt5.qtsvg
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-sudo zypper -n install make git gcc python-devel python-setuptools \
+sudo zypper -n install make git gcc zlib-devel python-devel python-setuptools \
     python-numpy python-numpy-devel python-scipy python-matplotlib \
     python-matplotlib-qt5 python-matplotlib-qt4 python-matplotlib-tk \
     python-qt5 python-qt4 \
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-sudo zypper -n install make git gcc python3-devel python3-setuptools \
+sudo zypper -n install make git gcc zlib-devel python3-devel python3-setuptools \
     python3-numpy python3-numpy-devel python3-scipy python3-matplotlib \
     python3-qt5 python3-qt4 \
     python3-matplotlib-qt4 \
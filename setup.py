@@ -411,6 +411,18 @@ if pyrocko.grumpy:
             with open(outfile, 'w') as f:
                 f.write(module_code)
 
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 7):
+            # uses async/await syntax, pyrocko.gf.server falls back to
+            # pyrocko.gf.server_asyncore on older versions
+            modules = [
+                (package_, module, filename)
+                for (package_, module, filename) in modules
+                if (package_, module) != ('pyrocko.gf', 'server_asyncio')]
+
+        return modules
+
     def run(self):
         make_info_module(packname, version)
         self.make_compat_modules()
@@ -664,7 +676,8 @@ setup(
         Extension(
             'autopick_ext',
             include_dirs=[get_python_inc(), numpy.get_include()],
-            extra_compile_args=['-Wextra'],
+            extra_compile_args=['-Wextra'] + omp_arg,
+            extra_link_args=[] + omp_lib,
             sources=[pjoin('src', 'ext', 'autopick_ext.c')]),
 
         Extension(
@@ -672,6 +685,7 @@ setup(
             include_dirs=[get_python_inc(), numpy.get_include()],
             extra_compile_args=['-D_FILE_OFFSET_BITS=64', '-Wextra'] + omp_arg,
             extra_link_args=[] + omp_lib,
+            libraries=['z'],
             sources=[pjoin('src', 'gf', 'ext', 'store_ext.c')]),
 
         Extension(
@@ -687,6 +701,12 @@ setup(
             extra_compile_args=['-Wextra'],
             sources=[pjoin('src', 'ext', 'ahfullgreen_ext.c')]),
 
+        Extension(
+            'spit_ext',
+            include_dirs=[get_python_inc(), numpy.get_include()],
+            extra_compile_args=['-Wextra'],
+            sources=[pjoin('src', 'ext', 'spit_ext.c')]),
+
         Extension(
             'orthodrome_ext',
             include_dirs=[get_python_inc(), numpy.get_include()],
@@ -53,7 +53,7 @@ subcommand_usages = {
     'build':         'build [store-dir] [options]',
     'stats':         'stats [store-dir] [options]',
     'check':         'check [store-dir] [options]',
-    'decimate':      'decimate [store-dir] <factor> [options]',
+    'decimate':      'decimate [store-dir] (<factor> | --pyramid) [options]',
     'redeploy':      'redeploy <source> <destination> [options]',
     'view':          'view [store-dir] ... [options]',
     'extract':       'extract [store-dir] <selection>',
@@ -371,22 +371,35 @@ def command_decimate(args):
             '--force', dest='force', action='store_true',
             help='overwrite existing files')
 
+        parser.add_option(
+            '--pyramid', dest='pyramid', action='store_true',
+            help='build decimated variants for factors 2, 4 and 8 in one '
+                 'pass, no <factor> argument is needed')
+
     parser, options, args = cl_parse('decimate', args, setup=setup)
-    try:
-        decimate = int(args.pop())
-    except Exception:
-        parser.error('cannot get <factor> argument')
+    if not options.pyramid:
+        try:
+            decimate = int(args.pop())
+        except Exception:
+            parser.error('cannot get <factor> argument')
 
     store_dir = get_store_dir(args)
 
     config = None
     if options.config_fn:
+        if options.pyramid:
+            parser.error('--config cannot be used with --pyramid')
+
         config = load_config(options.config_fn)
 
     try:
         store = gf.Store(store_dir)
-        store.make_decimated(decimate, config=config, force=options.force,
-                             show_progress=True)
+        if options.pyramid:
+            store.make_decimated_pyramid(
+                force=options.force, show_progress=True)
+        else:
+            store.make_decimated(decimate, config=config, force=options.force,
+                                 show_progress=True)
 
     except gf.StoreError as e:
         die(e)
@@ -398,7 +411,14 @@ def sindex(args):
 
 def command_redeploy(args):
 
-    parser, options, args = cl_parse('redeploy', args)
+    def setup(parser):
+        parser.add_option(
+            '--compression', dest='compression', metavar='METHOD',
+            choices=sorted(gf.store.gf_compressions.keys()),
+            help='compress traces in destination store, choices: %s' %
+                 ', '.join(sorted(gf.store.gf_compressions.keys())))
+
+    parser, options, args = cl_parse('redeploy', args, setup=setup)
 
     if not len(args) == 2:
         parser.print_help()
@@ -412,12 +432,17 @@ def command_redeploy(args):
         die(e)
 
     try:
-        gf.store.Store.create_dependants(dest_store_dir)
+        gf.store.Store.create_dependants(
+            dest_store_dir, compression=options.compression)
     except gf.StoreError:
         pass
 
     try:
         dest = gf.Store(dest_store_dir, 'w')
+        if options.compression and \
+                dest.compression != options.compression:
+            die('destination store already exists with different '
+                'compression: %s' % dest.compression)
 
     except gf.StoreError as e:
         die(e)
@@ -797,12 +822,17 @@ def command_ttt(args):
             '--force', dest='force', action='store_true',
             help='overwrite existing files')
 
+        parser.add_option(
+            '--nworkers', dest='nworkers', type='int', metavar='N',
+            default=1,
+            help='run N worker processes in parallel')
+
     parser, options, args = cl_parse('ttt', args, setup=setup)
 
     store_dir = get_store_dir(args)
     try:
         store = gf.Store(store_dir)
-        store.make_ttt(force=options.force)
+        store.make_ttt(force=options.force, nworkers=options.nworkers)
 
     except gf.StoreError as e:
         die(e)
@@ -942,10 +972,28 @@ def command_server(args):
             '--ip', dest='ip', metavar='IP', default='',
             help='serve on ip address IP')
 
+        parser.add_option(
+            '--nworkers', dest='nworkers', metavar='N', type='int',
+            help='number of worker processes for seismosizer requests '
+                 '(default: number of CPUs, 0: single background thread, '
+                 'requires Python 3.7 or later)')
+
+        parser.add_option(
+            '--max-requests', dest='max_requests', metavar='N', type='int',
+            help='maximum number of concurrently processed seismosizer '
+                 'requests (default: 16, requires Python 3.7 or later)')
+
     parser, options, args = cl_parse('server', args, setup=setup)
 
+    kwargs = {}
+    if options.nworkers is not None:
+        kwargs['nworkers'] = options.nworkers
+
+    if options.max_requests is not None:
+        kwargs['max_requests'] = options.max_requests
+
     engine = gf.LocalEngine(store_superdirs=args)
-    server.run(options.ip, options.port, engine)
+    server.run(options.ip, options.port, engine, **kwargs)
 
 
 def command_download(args):
@@ -38,3 +38,238 @@ def recursive_stalta(
         return temp
     else:
         return energytrace, temp
+
+
+stalta_trigger_dtype = num.dtype([
+    ('ichannel', num.int32),
+    ('tmin', num.float64),
+    ('tmax', num.float64),
+    ('peak', num.float32)])
+
+stalta_nstate = 6
+
+
+def _make_triggers(ichannel, ion, ioff, peak, tmin, deltat):
+    tmin = num.asarray(tmin, dtype=num.float64)
+    if tmin.ndim != 0:
+        tmin = tmin[ichannel]
+
+    triggers = num.empty(ichannel.size, dtype=stalta_trigger_dtype)
+    triggers['ichannel'] = ichannel
+    triggers['tmin'] = tmin + ion * deltat
+    triggers['tmax'] = tmin + ioff * deltat
+    triggers['peak'] = peak
+    return triggers
+
+
+def _sort_triggers(triggers):
+    triggers = num.concatenate(
+        [num.zeros(0, dtype=stalta_trigger_dtype)] + triggers)
+
+    return triggers[num.argsort(triggers['tmin'], kind='mergesort')]
+
+
+def recursive_stalta_many(
+        data, deltat, tshort, tlong, level_on, level_off=None, tmin=0.,
+        state=None, want_ratio=False, nparallel=None):
+
+    '''
+    Run recursive STA/LTA trigger on many channels at once.
+
+    Short and long term averages of the squared signal are computed with
+    exponential moving averages with time constants ``tshort`` and
+    ``tlong``. A trigger is switched on when the ratio STA/LTA reaches
+    ``level_on`` and switched off when it falls below ``level_off``. The
+    channels are processed in parallel with OpenMP.
+
+    :param data: 2D array of shape ``(nchannels, nsamples)``
+    :param deltat: sampling interval in seconds
+    :param tshort: time constant of the short term average in seconds
+    :param tlong: time constant of the long term average in seconds
+    :param level_on: trigger on level
+    :param level_off: trigger off level (defaults to ``level_on``)
+    :param tmin: start time of the data, scalar or array with one value per
+        channel
+    :param state: state array of shape ``(nchannels, stalta_nstate)`` as
+        returned by a previous call on the preceding data block, or ``None``
+        to start afresh
+    :param want_ratio: whether to return the STA/LTA ratio
+    :param nparallel: number of threads to use, defaults to the number of
+        CPUs
+
+    :returns: ``(triggers, state, ratio)``, where ``triggers`` is an array
+        of type :py:data:`stalta_trigger_dtype` with the channel index, the
+        trigger on and off times and the peak ratio of each completed trigger.
+        Triggers still active at the end of the block are carried over in
+        ``state``. ``ratio`` is ``None`` unless ``want_ratio`` is set.
+    '''
+
+    if nparallel is None:
+        import multiprocessing
+        nparallel = multiprocessing.cpu_count()
+
+    if level_off is None:
+        level_off = level_on
+
+    data = num.ascontiguousarray(data, dtype=num.float64)
+    if data.ndim == 1:
+        data = data.reshape((1, data.size))
+
+    nchannels = data.shape[0]
+    if state is None:
+        state = num.zeros((nchannels, stalta_nstate), dtype=num.float64)
+
+    if state.shape != (nchannels, stalta_nstate):
+        raise AutopickError(
+            'state given to recursive_stalta_many() must have shape '
+            '(nchannels, %i).' % stalta_nstate)
+
+    ratio = None
+    if want_ratio:
+        ratio = num.empty(data.shape, dtype=num.float64)
+
+    ichannel, ion, ioff, peak = autopick_ext.recursive_stalta_many(
+        data, state,
+        num.exp(-deltat / tshort), num.exp(-deltat / tlong),
+        level_on, level_off, ratio, nparallel)
+
+    triggers = _make_triggers(ichannel, ion, ioff, peak, tmin, deltat)
+    return _sort_triggers([triggers]), state, ratio
+
+
+class StaLtaDetector(object):
+    '''
+    Recursive STA/LTA trigger on continuous data of many channels.
+
+    Successive pieces of the data, e.g. the windows of
+    :py:meth:`pyrocko.pile.Pile.chopper`, are fed with :py:meth:`process`.
+    Traces of equal length and sampling rate are stacked into 2D blocks and
+    handed to :py:func:`recursive_stalta_many`. The STA/LTA state and active
+    triggers are kept *per channel* between the pieces. When a gap occurs,
+    an active trigger of the affected channel is closed at the last sample
+    before the gap and its state is reset.
+
+    The returned triggers are arrays of type :py:data:`stalta_trigger_dtype`.
+    The field ``ichannel`` refers to :py:attr:`nslc_ids`.
+    '''
+
+    def __init__(self, tshort, tlong, level_on, level_off=None,
+                 nparallel=None):
+
+        self._tshort = tshort
+        self._tlong = tlong
+        self._level_on = level_on
+        self._level_off = level_off
+        self._nparallel = nparallel
+        self._nslc_ids = []
+        self._ichannels = {}
+        self._state = num.zeros((0, stalta_nstate), dtype=num.float64)
+        self._tnext = []
+
+    @property
+    def nslc_ids(self):
+        return list(self._nslc_ids)
+
+    def _get_channel(self, tr):
+        k = tr.nslc_id
+        if k not in self._ichannels:
+            self._ichannels[k] = len(self._nslc_ids)
+            self._nslc_ids.append(k)
+            self._state = num.vstack(
+                (self._state, num.zeros((1, stalta_nstate))))
+            self._tnext.append(None)
+
+        return self._ichannels[k]
+
+    def _reset(self, ichannels):
+        triggers = []
+        for ich in ichannels:
+            state = self._state[ich]
+            if self._tnext[ich] is not None and state[3] != 0.0:
+                tnext, deltat = self._tnext[ich]
+                triggers.append(_make_triggers(
+                    num.array([ich], dtype=num.int32),
+                    state[4:5], num.array([-1.]), state[5:6], tnext, deltat))
+
+            self._state[ich, :] = 0.0
+            self._tnext[ich] = None
+
+        return triggers
+
+    def process(self, traces):
+        '''
+        Process next piece of data.
+
+        :param traces: list of :py:class:`pyrocko.trace.Trace` objects
+        :returns: completed triggers, sorted by on time
+        '''
+
+        groups = {}
+        nseen = {}
+        for tr in sorted(traces, key=lambda tr: tr.tmin):
+            if tr.data_len() == 0:
+                continue
+
+            ich = self._get_channel(tr)
+            iround = nseen.get(ich, 0)
+            nseen[ich] = iround + 1
+            groups.setdefault(
+                (iround, tr.deltat, tr.data_len()), []).append((ich, tr))
+
+        triggers = []
+        for k in sorted(groups.keys()):
+            _, deltat, nsamples = k
+            entries = groups[k]
+            ichannels = num.array([ich for (ich, _) in entries], dtype=num.int)
+            data = num.empty((len(entries), nsamples), dtype=num.float64)
+            tmins = num.empty(len(entries), dtype=num.float64)
+            for irow, (ich, tr) in enumerate(entries):
+                tnext = self._tnext[ich]
+                if tnext is not None and not (
+                        abs(tnext[0] - tr.tmin) < deltat / 100.
+                        and abs(tnext[1] - deltat) < deltat / 10000.):
+
+                    triggers.extend(self._reset([ich]))
+
+                data[irow] = tr.ydata
+                tmins[irow] = tr.tmin
+                self._tnext[ich] = (tr.tmin + nsamples * deltat, deltat)
+
+            block_triggers, state, _ = recursive_stalta_many(
+                data, deltat, self._tshort, self._tlong, self._level_on,
+                self._level_off, tmin=tmins, state=self._state[ichannels],
+                nparallel=self._nparallel)
+
+            self._state[ichannels] = state
+            block_triggers['ichannel'] = ichannels[block_triggers['ichannel']]
+            triggers.append(block_triggers)
+
+        return _sort_triggers(triggers)
+
+    def finish(self):
+        '''
+        Close active triggers and reset all states.
+
+        :returns: triggers which were still active, closed at the last
+            sample seen
+        '''
+
+        return _sort_triggers(self._reset(range(len(self._nslc_ids))))
+
+    def chopper(self, pile, **kwargs):
+        '''
+        Run detector on waveform archive.
+
+        Iterates over :py:meth:`pyrocko.pile.Pile.chopper` with the given
+        arguments and yields the triggers completed in each window. Active
+        triggers are closed and yielded at the end. Padding cannot be used,
+        because the windows have to be contiguous.
+        '''
+
+        if kwargs.get('tpad', 0.):
+            raise ValueError('tpad must be zero')
+
+        for traces in pile.chopper(**kwargs):
+            yield self.process(traces)
+
+        yield self.finish()
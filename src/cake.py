@@ -51,6 +51,7 @@ from builtins import range, zip, str as newstr
 import os
 import copy
 import math
+import struct
 import cmath
 import operator
 try:
@@ -2596,6 +2597,134 @@ class RayPath(object):
             return [
                 (x_, p, t, (rp, rx, rt)) for ((x_, p), (_, t)) in zip(xp, xt)]
 
+    def interpolate_x2pt_many(self, x, endgaps, refine=True):
+        '''
+        Get ray parameters and traveltimes for many distances at once.
+
+        Vectorised variant of :py:meth:`interpolate_x2pt_linear`. Results are
+        linearly interpolated on the draft (p, x, t) curve and, if
+        ``refine`` is ``True``, improved with a vectorised root finder.
+
+        :param x: array of distances [deg]
+        :param endgaps: end point adjustments as returned by
+            :py:meth:`endgaps`
+        :returns: tuple of arrays ``(ix, p, t)``, where ``ix`` holds the
+            indices into ``x`` of the solutions found (a distance may have
+            none or several solutions)
+        '''
+
+        self._analyse()
+
+        if self._is_headwave:
+            dx, dt = self.xt_endgaps(self._p, endgaps)
+            xmin = self._x[0] - dx[0]
+            tmin = self._t[0] - dt[0]
+            el = self.headwave_straight()
+            ix = num.where(x >= xmin)[0]
+            th = el.x2t_headwave(xstretch=(x[ix]-xmin)) + tmin
+            return ix, filled(self._p[0], ix.size), th
+
+        empty = num.array([], dtype=num.float)
+        if num.all(x < self._xmin) or num.all(self._xmax < x):
+            return num.array([], dtype=num.int64), empty, empty
+
+        rp, rx, rt = self.draft_pxt(endgaps)
+        if rp.size < 2:
+            return num.array([], dtype=num.int64), empty, empty
+
+        # find all draft segments containing each distance
+        iorder = num.argsort(x)
+        xs = x[iorder]
+        inc = rx[1:] > rx[:-1]
+        j0 = num.where(
+            inc,
+            num.searchsorted(xs, rx[:-1], 'left'),
+            num.searchsorted(xs, rx[1:], 'right'))
+        j1 = num.where(
+            inc,
+            num.searchsorted(xs, rx[1:], 'left'),
+            num.searchsorted(xs, rx[:-1], 'right'))
+
+        counts = num.maximum(j1 - j0, 0)
+        iseg = num.repeat(num.arange(counts.size), counts)
+        istart = num.cumsum(counts) - counts
+        ix = iorder[
+            num.arange(iseg.size) - num.repeat(istart - j0, counts)]
+
+        xv = x[ix]
+        xr = (xv - rx[iseg]) / (rx[iseg+1] - rx[iseg])
+        p = (1.-xr)*rp[iseg] + xr*rp[iseg+1]
+        t = (1.-xr)*rt[iseg] + xr*rt[iseg+1]
+
+        if rx[0] == 0.0 and rp[0] == 0.0:
+            have = num.zeros(x.size, dtype=bool)
+            have[ix] = True
+            ix0 = num.where(num.logical_and(x == 0.0, ~have))[0]
+            ix = num.concatenate((ix, ix0))
+            p = num.concatenate((p, filled(rp[0], ix0.size)))
+            t = num.concatenate((t, filled(rt[0], ix0.size)))
+            iseg = num.concatenate(
+                (iseg, filled(-1, ix0.size, dtype=num.int64)))
+
+        if refine:
+            sel = iseg >= 0
+            isel = num.where(sel)[0]
+            ok, p_ref, t_ref = self._refine_many(
+                x[ix[isel]], rp[iseg[isel]], rp[iseg[isel]+1], endgaps)
+
+            p[isel] = p_ref
+            t[isel] = t_ref
+            sel[isel[~ok]] = False
+            sel[iseg < 0] = True
+            ix, p, t = ix[sel], p[sel], t[sel]
+
+        return ix, p, t
+
+    def _refine_many(self, x, pa, pb, endgaps, xtol=1e-10, maxiter=100):
+        '''
+        Solve ``xt(p)[0] == x`` for many distances with brackets [pa, pb].
+
+        Vectorised Illinois variant of regula falsi.
+        '''
+
+        fa = x - self.xt(pa, endgaps)[0]
+        fb = x - self.xt(pb, endgaps)[0]
+        ok = num.logical_and(fa * fb <= 0., num.isfinite(fa * fb))
+
+        pa, pb, fa, fb = [v.copy() for v in (pa, pb, fa, fb)]
+        active = ok.copy()
+        for _ in range(maxiter):
+            i = num.where(active)[0]
+            if i.size == 0:
+                break
+
+            a, b, fa_, fb_ = pa[i], pb[i], fa[i], fb[i]
+            with num.errstate(divide='ignore', invalid='ignore'):
+                c = b - fb_ * (b - a) / (fb_ - fa_)
+
+            bad = ~(num.minimum(a, b) <= c) | ~(c <= num.maximum(a, b))
+            c[bad] = 0.5 * (a[bad] + b[bad])
+
+            fc = x[i] - self.xt(c, endgaps)[0]
+
+            flip = fc * fb_ < 0.
+            pa[i] = num.where(flip, b, a)
+            fa[i] = num.where(flip, fb_, 0.5 * fa_)
+            pb[i] = c
+            fb[i] = fc
+
+            done = num.logical_or(
+                num.abs(fc) <= xtol,
+                num.abs(b - a) <= 1e-15 * num.abs(c))
+
+            active[i[done]] = False
+
+        t = num.zeros(x.size)
+        if num.any(ok):
+            t[ok] = self.xt(pb[ok], endgaps)[1]
+
+        return ok, pb, t
+
     def __eq__(self, other):
         if len(self.elements) != len(other.elements):
             return False
@@ -3368,6 +3497,95 @@ class LayeredModel(object):
         arrivals.sort(key=lambda x: (x.x, x.t))
         return arrivals
 
+    def arrivals_many(
+            self,
+            distances,
+            zstarts=0.0,
+            zstops=0.0,
+            phases=PhaseDef('P'),
+            refine=True):
+
+        '''Compute traveltimes for many source-receiver configurations.
+
+        Vectorised variant of :py:meth:`arrivals`. Requests with equal
+        source and receiver depths are grouped. For each group and ray path,
+        the draft (p, x, t) curve is interpolated at all distances at once,
+        and the results are refined in bulk. No :py:class:`Ray` objects are
+        created.
+
+        :param distances: array of distances [deg]
+        :param zstarts: source depths [m], scalar or array (broadcast against
+            ``distances``)
+        :param zstops: receiver depths [m], scalar or array (broadcast against
+            ``distances``)
+        :param phases: a :py:class:`PhaseDef` object or a list of such objects.
+            Comma-separated strings and lists of such strings are also accepted
+            and are converted to :py:class:`PhaseDef` objects for convenience.
+        :param refine: bool flag, whether to use a root finder to improve
+            (p, x, t) estimated from interpolation
+        :returns: tuple of arrays ``(irequests, iphases, ps, ts)`` with one
+            entry per arrival, giving the index of the request, the index of
+            the phase definition, the ray parameter [s/rad] and the traveltime
+            [s]. Arrivals are sorted by request index and traveltime.
+        '''
+
+        distances, zstarts, zstops = [
+            a.ravel() for a in num.broadcast_arrays(
+                *[num.asarray(a, dtype=num.float)
+                  for a in (distances, zstarts, zstops)])]
+
+        phases = to_phase_defs(phases)
+
+        irequests_all = []
+        iphases_all = []
+        ps_all = []
+        ts_all = []
+
+        if distances.size != 0:
+            iorder = num.lexsort((zstops, zstarts))
+            zs = num.vstack((zstarts[iorder], zstops[iorder]))
+            ibounds = num.concatenate((
+                [0],
+                num.where(num.any(zs[:, 1:] != zs[:, :-1], axis=0))[0] + 1,
+                [iorder.size]))
+        else:
+            iorder = num.zeros(0, dtype=num.int64)
+            ibounds = num.zeros(1, dtype=num.int64)
+
+        for ilo, ihi in zip(ibounds[:-1], ibounds[1:]):
+            irequests = iorder[ilo:ihi]
+            zstart = float(zstarts[irequests[0]])
+            zstop = float(zstops[irequests[0]])
+            x = distances[irequests]
+
+            for iphase, phase in enumerate(phases):
+                for path in self.gather_paths(
+                        phase, zstart=zstart, zstop=zstop):
+
+                    endgaps = path.endgaps(zstart, zstop)
+                    ix, p, t = path.interpolate_x2pt_many(
+                        x, endgaps, refine=refine)
+
+                    irequests_all.append(irequests[ix])
+                    iphases_all.append(filled(iphase, ix.size))
+                    ps_all.append(p)
+                    ts_all.append(t)
+
+        if not irequests_all:
+            return (
+                num.zeros(0, dtype=num.int64),
+                num.zeros(0, dtype=num.int64),
+                num.zeros(0, dtype=num.float),
+                num.zeros(0, dtype=num.float))
+
+        irequests = num.concatenate(irequests_all).astype(num.int64)
+        iphases = num.concatenate(iphases_all).astype(num.int64)
+        ps = num.concatenate(ps_all)
+        ts = num.concatenate(ts_all)
+
+        iorder = num.lexsort((ts, irequests))
+        return irequests[iorder], iphases[iorder], ps[iorder], ts[iorder]
+
     @classmethod
     def from_scanlines(cls, producer):
         '''Create layer cake model from sequence of materials at depths.
@@ -3698,6 +3916,279 @@ class LayeredModel(object):
         return '\n'.join(str(element) for element in self._elements)
 
 
+class TravelTimeTable(object):
+    '''Tabulated first-arrival traveltimes for a set of phases.
+
+    Traveltimes are precomputed with :py:meth:`LayeredModel.arrivals_many`
+    on a regular grid over source depth and distance, for a fixed receiver
+    depth. The grid is refined by successive bisection until bilinear
+    interpolation reproduces the traveltimes at the cell midpoints to within
+    ``ttol``, or until the minimum grid spacings are reached. Tables can be
+    saved to and loaded from a compact binary file. Lookups are vectorised.
+
+    :param mod: :py:class:`LayeredModel` to be used
+    :param phases: a :py:class:`PhaseDef` object or a list of such objects.
+        Comma-separated strings and lists of such strings are also accepted
+        and are converted to :py:class:`PhaseDef` objects for convenience.
+    :param zbounds: ``(zmin, zmax)``, source depth range [m]
+    :param xbounds: ``(xmin, xmax)``, distance range [deg]
+    :param ttol: target accuracy of the interpolated traveltimes [s]
+    :param zdelta_min: minimum grid spacing in source depth [m]
+    :param xdelta_min: minimum grid spacing in distance [deg]
+    :param zstop: receiver depth [m]
+    :param filename: load table from file instead of computing it
+
+    Where a phase does not exist, or in grid cells where it does not exist at
+    all four corners, interpolated traveltimes are NaN. Cells containing a
+    discontinuity of the traveltime field (e.g. where a branch ends) cannot
+    be resolved and are excluded from the accuracy check. The accuracy
+    actually achieved at the cell midpoints is available as
+    :py:attr:`terr`.
+    '''
+
+    def __init__(self, mod=None, phases=None, zbounds=None, xbounds=None,
+                 ttol=0.01, zdelta_min=1*km, xdelta_min=0.01, zstop=0.0,
+                 filename=None):
+
+        if filename is None:
+            assert all(v is not None for v in (mod, phases, zbounds, xbounds))
+
+            self.phases = to_phase_defs(phases)
+            self.zbounds = tuple(float(v) for v in zbounds)
+            self.xbounds = tuple(float(v) for v in xbounds)
+            self.zstop = float(zstop)
+            self.ttol = float(ttol)
+
+            assert self.zbounds[0] < self.zbounds[1]
+            assert self.xbounds[0] < self.xbounds[1]
+
+            self._build(mod, float(zdelta_min), float(xdelta_min))
+
+        else:
+            self._load(filename)
+
+    @property
+    def nphases(self):
+        return self._data.shape[0]
+
+    @property
+    def shape(self):
+        '''Shape of the traveltime grid ``(nphases, nz, nx)``.'''
+        return self._data.shape
+
+    def _evaluate(self, mod, zs, xs):
+        zz, xx = num.meshgrid(zs, xs, indexing='ij')
+        irequests, iphases, _, ts = mod.arrivals_many(
+            xx.ravel(), zz.ravel(), self.zstop, self.phases)
+
+        t = num.empty((len(self.phases), zz.size), dtype=num.float)
+        t.fill(num.inf)
+        num.minimum.at(t, (iphases, irequests), ts)
+        t[num.logical_not(num.isfinite(t))] = num.nan
+        return t.reshape((len(self.phases), zs.size, xs.size))
+
+    def _build(self, mod, zdelta_min, xdelta_min):
+
+        # traveltime gradients are bounded by the slowest velocity in the
+        # model; larger jumps between neighboring nodes indicate a
+        # discontinuity (e.g. where a branch ends) which cannot be resolved
+        # by refinement and is therefore excluded from the error estimate
+        vs = num.concatenate(
+            [mod.profile('vp'), mod.profile('vs')])
+        smax = 1.0 / num.min(vs[vs > 0.0])
+
+        def maxerr(t_test, t_a, t_b, delta):
+            jmax = smax * delta
+            mask = num.logical_and.reduce([
+                num.isfinite(t_test), num.isfinite(t_a), num.isfinite(t_b),
+                num.abs(t_a - t_b) <= jmax,
+                num.abs(t_test - t_a) <= 0.5 * jmax,
+                num.abs(t_test - t_b) <= 0.5 * jmax])
+
+            if not num.any(mask):
+                return 0.0
+
+            return num.max(num.abs(t_test - 0.5 * (t_a + t_b))[mask])
+
+        def interleave(a, b, axis):
+            shape = list(a.shape)
+            shape[axis] += b.shape[axis]
+            c = num.empty(shape, dtype=a.dtype)
+            sl = [slice(None)] * a.ndim
+            sl[axis] = slice(0, None, 2)
+            c[tuple(sl)] = a
+            sl[axis] = slice(1, None, 2)
+            c[tuple(sl)] = b
+            return c
+
+        zs = num.linspace(self.zbounds[0], self.zbounds[1], 3)
+        xs = num.linspace(self.xbounds[0], self.xbounds[1], 3)
+        data = self._evaluate(mod, zs, xs)
+
+        while True:
+            zmids = 0.5 * (zs[1:] + zs[:-1])
+            xmids = 0.5 * (xs[1:] + xs[:-1])
+
+            data_xmids = self._evaluate(mod, zs, xmids)
+            err_x = maxerr(
+                data_xmids, data[:, :, :-1], data[:, :, 1:],
+                (xs[1] - xs[0]) * d2m)
+
+            data_zmids = self._evaluate(mod, zmids, xs)
+            err_z = maxerr(
+                data_zmids, data[:, :-1, :], data[:, 1:, :], zs[1] - zs[0])
+
+            self.terr = max(err_x, err_z)
+
+            refine_x = err_x > self.ttol and xs[1] - xs[0] >= 2. * xdelta_min
+            refine_z = err_z > self.ttol and zs[1] - zs[0] >= 2. * zdelta_min
+
+            if not (refine_x or refine_z):
+                break
+
+            if refine_x:
+                xs = interleave(xs, xmids, 0)
+                data = interleave(data, data_xmids, 2)
+
+            if refine_z:
+                if refine_x:
+                    data_zmids = self._evaluate(mod, zmids, xs)
+
+                zs = interleave(zs, zmids, 0)
+                data = interleave(data, data_zmids, 1)
+
+        self._data = data
+
+    def _iphase(self, phase):
+        if isinstance(phase, int):
+            return phase
+
+        if isinstance(phase, PhaseDef):
+            phase = phase.definition()
+
+        for iphase, pdef in enumerate(self.phases):
+            if pdef.definition() == phase:
+                return iphase
+
+        raise InvalidArguments('phase not in table: %s' % phase)
+
+    def interpolate_many(self, distances, zstarts, phase=None):
+        '''Get interpolated traveltimes.
+
+        :param distances: array of distances [deg]
+        :param zstarts: source depths [m], scalar or array (broadcast against
+            ``distances``)
+        :param phase: phase definition (:py:class:`PhaseDef`, string or index
+            into :py:attr:`phases`), or ``None`` to get traveltimes of all
+            phases
+        :returns: array of traveltimes [s], shape ``(n,)`` if ``phase`` is
+            given, else ``(nphases, n)``. Outside of the table's bounds and
+            where a phase does not exist, NaN is returned.
+        '''
+
+        x, z = num.broadcast_arrays(
+            num.asarray(distances, dtype=num.float),
+            num.asarray(zstarts, dtype=num.float))
+
+        x = x.ravel()
+        z = z.ravel()
+
+        _, nz, nx = self._data.shape
+        fz = (z - self.zbounds[0]) / (self.zbounds[1] - self.zbounds[0]) \
+            * (nz - 1)
+        fx = (x - self.xbounds[0]) / (self.xbounds[1] - self.xbounds[0]) \
+            * (nx - 1)
+
+        inside = num.logical_and(
+            num.logical_and(0.0 <= fz, fz <= nz - 1),
+            num.logical_and(0.0 <= fx, fx <= nx - 1))
+
+        iz = num.clip(num.floor(fz).astype(num.int), 0, nz - 2)
+        ix = num.clip(num.floor(fx).astype(num.int), 0, nx - 2)
+        wz = fz - iz
+        wx = fx - ix
+
+        if phase is None:
+            data = self._data
+        else:
+            iphase = self._iphase(phase)
+            data = self._data[iphase:iphase+1]
+
+        t = data[:, iz, ix] * ((1.0 - wz) * (1.0 - wx)) \
+            + data[:, iz+1, ix] * (wz * (1.0 - wx)) \
+            + data[:, iz, ix+1] * ((1.0 - wz) * wx) \
+            + data[:, iz+1, ix+1] * (wz * wx)
+
+        t[:, num.logical_not(inside)] = num.nan
+
+        if phase is None:
+            return t
+        else:
+            return t[0]
+
+    def first_arrivals(self, distances, zstarts):
+        '''Get interpolated traveltimes of the first arriving phase.
+
+        :param distances: array of distances [deg]
+        :param zstarts: source depths [m], scalar or array (broadcast against
+            ``distances``)
+        :returns: array of traveltimes [s], NaN where no phase is available
+        '''
+        return num.fmin.reduce(
+            self.interpolate_many(distances, zstarts), axis=0)
+
+    def dump(self, filename):
+        '''Save table to binary file.'''
+
+        with open(filename, 'wb') as f:
+            version = 1
+            nphases, nz, nx = self._data.shape
+            f.write(b'CAKETTT ')
+            f.write(struct.pack(
+                '<QQQQddddddd', version, nphases, nz, nx,
+                self.zbounds[0], self.zbounds[1],
+                self.xbounds[0], self.xbounds[1],
+                self.zstop, self.ttol, self.terr))
+
+            for pdef in self.phases:
+                sdef = pdef.definition().encode('utf-8')
+                f.write(struct.pack('<Q', len(sdef)))
+                f.write(sdef)
+
+            self._data.astype('<f8').tofile(f)
+
+    def _load(self, filename):
+        with open(filename, 'rb') as f:
+            header = f.read(8 + struct.calcsize('<QQQQddddddd'))
+            marker = header[:8]
+            if marker != b'CAKETTT ':
+                raise LayeredModelError(
+                    'not a traveltime table file: %s' % filename)
+
+            version, nphases, nz, nx, zmin, zmax, xmin, xmax, \
+                self.zstop, self.ttol, self.terr = struct.unpack(
+                    '<QQQQddddddd', header[8:])
+
+            if version != 1:
+                raise LayeredModelError(
+                    'unsupported traveltime table version %i: %s' % (
+                        version, filename))
+
+            self.zbounds = (zmin, zmax)
+            self.xbounds = (xmin, xmax)
+
+            self.phases = []
+            for iphase in range(nphases):
+                n, = struct.unpack('<Q', f.read(8))
+                self.phases.append(PhaseDef(f.read(n).decode('utf-8')))
+
+            offset = f.tell()
+
+        self._data = num.memmap(
+            filename, dtype='<f8', mode='r', offset=offset,
+            shape=(nphases, nz, nx))
+
+
 def read_hyposat_model(fn):
     '''Reader for HYPOSAT earth model files.
 
@@ -14,6 +14,11 @@ static struct module_state _state;
 #endif
 
 #include <math.h>
+#include <stdint.h>
+#include <stdlib.h>
+#if defined(_OPENMP)
+    # include <omp.h>
+#endif
 
 #ifndef max
    #define max( a, b ) ( ((a) > (b)) ? (a) : (b) )
@@ -162,10 +167,286 @@ static PyObject* autopick_recursive_stalta_wrapper(PyObject *module, PyObject *a
     return Py_None;
 }
 
+/* State per channel for autopick_recursive_stalta_many */
+#define STALTA_INITIALIZED 0
+#define STALTA_STA 1
+#define STALTA_LTA 2
+#define STALTA_ACTIVE 3
+#define STALTA_ION 4
+#define STALTA_PEAK 5
+#define STALTA_NSTATE 6
+
+#define CHUNKSIZE 1
+
+typedef struct {
+    size_t n;
+    size_t nalloc;
+    int64_t *ion;
+    int64_t *ioff;
+    double *peak;
+} events_t;
+
+int events_append(events_t *events, int64_t ion, int64_t ioff, double peak) {
+    size_t nalloc;
+    int64_t *ion_new, *ioff_new;
+    double *peak_new;
+
+    if (events->n == events->nalloc) {
+        nalloc = events->nalloc == 0 ? 16 : 2*events->nalloc;
+        ion_new = (int64_t*)realloc(events->ion, nalloc*sizeof(int64_t));
+        if (ion_new == NULL) return 1;
+        events->ion = ion_new;
+        ioff_new = (int64_t*)realloc(events->ioff, nalloc*sizeof(int64_t));
+        if (ioff_new == NULL) return 1;
+        events->ioff = ioff_new;
+        peak_new = (double*)realloc(events->peak, nalloc*sizeof(double));
+        if (peak_new == NULL) return 1;
+        events->peak = peak_new;
+        events->nalloc = nalloc;
+    }
+
+    events->ion[events->n] = ion;
+    events->ioff[events->n] = ioff;
+    events->peak[events->n] = peak;
+    events->n++;
+    return 0;
+}
+
+void events_free(events_t *events) {
+    free(events->ion);
+    free(events->ioff);
+    free(events->peak);
+}
+
+int stalta_channel(
+        size_t nsamples,
+        const double *data,
+        double *state,
+        double cs,
+        double cl,
+        double level_on,
+        double level_off,
+        double *ratio,
+        events_t *events) {
+
+    size_t i;
+    double e, sta, lta, r, peak;
+    int64_t ion;
+    int active;
+
+    if (nsamples == 0) return 0;
+
+    if (state[STALTA_INITIALIZED] == 0.0) {
+        e = data[0]*data[0];
+        state[STALTA_STA] = e;
+        state[STALTA_LTA] = e;
+        state[STALTA_ACTIVE] = 0.0;
+        state[STALTA_INITIALIZED] = 1.0;
+    }
+
+    sta = state[STALTA_STA];
+    lta = state[STALTA_LTA];
+    active = state[STALTA_ACTIVE] != 0.0;
+    ion = (int64_t)state[STALTA_ION];
+    peak = state[STALTA_PEAK];
+
+    for (i=0; i<nsamples; i++) {
+        e = data[i]*data[i];
+        sta = cs*sta + (1.0-cs)*e;
+        lta = cl*lta + (1.0-cl)*e;
+        r = lta > 0.0 ? sta/lta : 0.0;
+
+        if (ratio != NULL) ratio[i] = r;
+
+        if (active) {
+            if (r > peak) peak = r;
+            if (r < level_off) {
+                if (0 != events_append(events, ion, (int64_t)i, peak)) return 1;
+                active = 0;
+            }
+        } else if (r >= level_on) {
+            active = 1;
+            ion = (int64_t)i;
+            peak = r;
+        }
+    }
+
+    state[STALTA_STA] = sta;
+    state[STALTA_LTA] = lta;
+    state[STALTA_ACTIVE] = active ? 1.0 : 0.0;
+    /* keep trigger-on index relative to the start of the next block */
+    state[STALTA_ION] = active ? (double)(ion - (int64_t)nsamples) : 0.0;
+    state[STALTA_PEAK] = active ? peak : 0.0;
+    return 0;
+}
+
+int autopick_recursive_stalta_many(
+        size_t nchannels,
+        size_t nsamples,
+        const double *data,
+        double *state,
+        double cs,
+        double cl,
+        double level_on,
+        double level_off,
+        double *ratio,
+        events_t *events,
+        int nparallel) {
+
+    int ichannel, err;
+
+    err = 0;
+    (void)nparallel;
+
+    Py_BEGIN_ALLOW_THREADS
+    #if defined(_OPENMP)
+        #pragma omp parallel for schedule(dynamic, CHUNKSIZE) reduction(|:err) num_threads(nparallel)
+    #endif
+    for (ichannel=0; ichannel<(int)nchannels; ichannel++) {
+        err |= stalta_channel(
+            nsamples,
+            data + ichannel*nsamples,
+            state + ichannel*STALTA_NSTATE,
+            cs, cl, level_on, level_off,
+            ratio != NULL ? ratio + ichannel*nsamples : NULL,
+            events + ichannel);
+    }
+    Py_END_ALLOW_THREADS
+
+    return err;
+}
+
+int good_array(PyObject* o, int typenum) {
+    if (!PyArray_Check(o)) {
+        PyErr_SetString(PyExc_ValueError, "not a NumPy array" );
+        return 0;
+    }
+
+    if (PyArray_TYPE((PyArrayObject*)o) != typenum) {
+        PyErr_SetString(PyExc_ValueError, "array of unexpected type");
+        return 0;
+    }
+
+    if (!PyArray_ISCARRAY((PyArrayObject*)o)) {
+        PyErr_SetString(PyExc_ValueError, "array is not contiguous or not well behaved");
+        return 0;
+    }
+
+    return 1;
+}
+
+static PyObject* autopick_recursive_stalta_many_wrapper(PyObject *module, PyObject *args) {
+    PyObject *data_array_obj, *state_array_obj, *ratio_array_obj;
+    PyObject *ichannel_array, *ion_array, *ioff_array, *peak_array;
+    npy_intp *shape, shapeout[1];
+    size_t nchannels, nsamples, nevents, ichannel, i, j;
+    double cs, cl, level_on, level_off;
+    double *ratio;
+    int nparallel, err;
+    int32_t *cichannel;
+    int64_t *cion, *cioff;
+    double *cpeak;
+    events_t *events;
+
+    struct module_state *st = GETSTATE(module);
+    if (!PyArg_ParseTuple(args, "OOddddOi", &data_array_obj, &state_array_obj, &cs, &cl, &level_on, &level_off, &ratio_array_obj, &nparallel)) {
+        PyErr_SetString(st->error, "usage: recursive_stalta_many(data, state, cs, cl, level_on, level_off, ratio, nparallel)" );
+        return NULL;
+    }
+
+    if (!good_array(data_array_obj, NPY_DOUBLE)) return NULL;
+    if (!good_array(state_array_obj, NPY_DOUBLE)) return NULL;
+    if (ratio_array_obj != Py_None && !good_array(ratio_array_obj, NPY_DOUBLE)) return NULL;
+
+    if (PyArray_NDIM((PyArrayObject*)data_array_obj) != 2) {
+        PyErr_SetString(st->error, "data must be a 2D array");
+        return NULL;
+    }
+
+    shape = PyArray_DIMS((PyArrayObject*)data_array_obj);
+    nchannels = shape[0];
+    nsamples = shape[1];
+
+    if ((size_t)PyArray_SIZE((PyArrayObject*)state_array_obj) != nchannels*STALTA_NSTATE) {
+        PyErr_SetString(st->error, "state must have shape (nchannels, 6)");
+        return NULL;
+    }
+
+    ratio = NULL;
+    if (ratio_array_obj != Py_None) {
+        if ((size_t)PyArray_SIZE((PyArrayObject*)ratio_array_obj) != nchannels*nsamples) {
+            PyErr_SetString(st->error, "ratio must have the same shape as data");
+            return NULL;
+        }
+        ratio = PyArray_DATA((PyArrayObject*)ratio_array_obj);
+    }
+
+    events = (events_t*)calloc(nchannels > 0 ? nchannels : 1, sizeof(events_t));
+    if (events == NULL) {
+        PyErr_SetString(st->error, "cannot allocate memory");
+        return NULL;
+    }
+
+    err = autopick_recursive_stalta_many(
+        nchannels, nsamples,
+        PyArray_DATA((PyArrayObject*)data_array_obj),
+        PyArray_DATA((PyArrayObject*)state_array_obj),
+        cs, cl, level_on, level_off, ratio, events, nparallel);
+
+    if (err != 0) {
+        for (ichannel=0; ichannel<nchannels; ichannel++) events_free(events + ichannel);
+        free(events);
+        PyErr_SetString(st->error, "running STA/LTA failed (cannot allocate memory)");
+        return NULL;
+    }
+
+    nevents = 0;
+    for (ichannel=0; ichannel<nchannels; ichannel++) nevents += events[ichannel].n;
+
+    shapeout[0] = nevents;
+    ichannel_array = PyArray_SimpleNew(1, shapeout, NPY_INT32);
+    ion_array = PyArray_SimpleNew(1, shapeout, NPY_INT64);
+    ioff_array = PyArray_SimpleNew(1, shapeout, NPY_INT64);
+    peak_array = PyArray_SimpleNew(1, shapeout, NPY_DOUBLE);
+
+    if (ichannel_array == NULL || ion_array == NULL || ioff_array == NULL || peak_array == NULL) {
+        Py_XDECREF(ichannel_array);
+        Py_XDECREF(ion_array);
+        Py_XDECREF(ioff_array);
+        Py_XDECREF(peak_array);
+        for (ichannel=0; ichannel<nchannels; ichannel++) events_free(events + ichannel);
+        free(events);
+        return NULL;
+    }
+
+    cichannel = PyArray_DATA((PyArrayObject*)ichannel_array);
+    cion = PyArray_DATA((PyArrayObject*)ion_array);
+    cioff = PyArray_DATA((PyArrayObject*)ioff_array);
+    cpeak = PyArray_DATA((PyArrayObject*)peak_array);
+
+    j = 0;
+    for (ichannel=0; ichannel<nchannels; ichannel++) {
+        for (i=0; i<events[ichannel].n; i++) {
+            cichannel[j] = (int32_t)ichannel;
+            cion[j] = events[ichannel].ion[i];
+            cioff[j] = events[ichannel].ioff[i];
+            cpeak[j] = events[ichannel].peak[i];
+            j++;
+        }
+        events_free(events + ichannel);
+    }
+    free(events);
+
+    return Py_BuildValue("NNNN", ichannel_array, ion_array, ioff_array, peak_array);
+}
+
 static PyMethodDef AutoPickMethods[] = {
     {"recursive_stalta",  (PyCFunction) autopick_recursive_stalta_wrapper, METH_VARARGS,
         "Recursive STA/LTA picker." },
 
+    {"recursive_stalta_many",  (PyCFunction) autopick_recursive_stalta_many_wrapper, METH_VARARGS,
+        "Recursive STA/LTA trigger on many channels." },
+
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
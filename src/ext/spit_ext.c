@@ -0,0 +1,493 @@
+#define NPY_NO_DEPRECATED_API 7
+
+#include "Python.h"
+#include "numpy/arrayobject.h"
+
+#include <math.h>
+#include <string.h>
+#include <stdint.h>
+
+#define SPIT_NDIM_MAX 8
+
+struct module_state {
+    PyObject *error;
+};
+
+#if PY_MAJOR_VERSION >= 3
+#define GETSTATE(m) ((struct module_state*)PyModule_GetState(m))
+#else
+#define GETSTATE(m) (&_state); (void) m;
+static struct module_state _state;
+#endif
+
+typedef npy_float64 float64_t;
+
+typedef enum {
+    SUCCESS = 0,
+    NO_PARENT,
+} spit_error_t;
+
+const char* spit_error_names[] = {
+    "success",
+    "cell without parent found",
+};
+
+int good_array(PyObject *arr, int typenum, ssize_t size_want, int ndim_want, npy_intp* shape_want) {
+    int i;
+
+    if (!PyArray_Check(arr)) {
+        PyErr_SetString(PyExc_AttributeError, "not a NumPy array" );
+        return 0;
+    }
+
+    if (PyArray_TYPE((PyArrayObject*)arr) != typenum) {
+        PyErr_SetString(PyExc_AttributeError, "array of unexpected type");
+        return 0;
+    }
+
+    if (size_want != -1 && size_want != PyArray_SIZE((PyArrayObject*)arr)) {
+        PyErr_SetString(PyExc_AttributeError, "array is of unexpected size");
+        return 0;
+    }
+    if (ndim_want != -1 && ndim_want != PyArray_NDIM((PyArrayObject*)arr)) {
+        PyErr_SetString(PyExc_AttributeError, "array is of unexpected ndim");
+        return 0;
+    }
+
+    if (ndim_want != -1) {
+        for (i=0; i<ndim_want; i++) {
+            if (shape_want[i] != -1 && shape_want[i] != PyArray_DIMS((PyArrayObject*)arr)[i]) {
+                PyErr_SetString(PyExc_AttributeError, "array is of unexpected shape");
+                return 0;
+            }
+        }
+    }
+    return 1;
+}
+
+/*
+ * Cells are stored as flat records in depth-first order, exactly as in the
+ * '.phase' files: ndim int32 indices, followed by 2**ndim float64 function
+ * values at the cell corners (C order). Records are not necessarily aligned,
+ * so values are accessed via memcpy.
+ */
+
+static size_t record_size(int ndim) {
+    return 4*ndim + 8*(1<<ndim);
+}
+
+static void get_index(const uint8_t *records, size_t recsize, size_t icell, int ndim, int32_t *index) {
+    memcpy(index, records + icell*recsize, 4*ndim);
+}
+
+static void get_f(const uint8_t *records, size_t recsize, size_t icell, int ndim, float64_t *f) {
+    memcpy(f, records + icell*recsize + 4*ndim, 8*(1<<ndim));
+}
+
+static int is_parent(const int32_t *index_parent, const int32_t *index_child, int ndim) {
+    int idim;
+    for (idim=0; idim<ndim; idim++) {
+        if (index_parent[idim] == (index_child[idim] >> 1)) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+static spit_error_t spit_link(
+        const uint8_t *records,
+        size_t ncells,
+        int ndim,
+        int64_t *first_child,
+        int64_t *next_sibling) {
+
+    /* reconstruct tree links from depth-first order, mirroring
+     * SPTree._load */
+
+    size_t recsize, icell, npath;
+    int64_t *path, *last_child;
+    int32_t index[SPIT_NDIM_MAX], index_top[SPIT_NDIM_MAX];
+
+    recsize = record_size(ndim);
+
+    for (icell=0; icell<ncells; icell++) {
+        first_child[icell] = -1;
+        next_sibling[icell] = -1;
+    }
+
+    if (ncells == 0) {
+        return SUCCESS;
+    }
+
+    path = (int64_t*)malloc(sizeof(int64_t)*ncells);
+    last_child = (int64_t*)malloc(sizeof(int64_t)*ncells);
+    for (icell=0; icell<ncells; icell++) {
+        last_child[icell] = -1;
+    }
+
+    path[0] = 0;
+    npath = 1;
+    for (icell=1; icell<ncells; icell++) {
+        get_index(records, recsize, icell, ndim, index);
+        while (npath > 0) {
+            get_index(records, recsize, path[npath-1], ndim, index_top);
+            if (is_parent(index_top, index, ndim)) {
+                break;
+            }
+            npath--;
+        }
+
+        if (npath == 0) {
+            free(path);
+            free(last_child);
+            return NO_PARENT;
+        }
+
+        if (last_child[path[npath-1]] == -1) {
+            first_child[path[npath-1]] = icell;
+        } else {
+            next_sibling[last_child[path[npath-1]]] = icell;
+        }
+        last_child[path[npath-1]] = icell;
+
+        path[npath] = icell;
+        npath++;
+    }
+
+    free(path);
+    free(last_child);
+    return SUCCESS;
+}
+
+static int depth_of(int32_t index) {
+    int depth = 0;
+    while (index >>= 1) {
+        depth++;
+    }
+    return depth;
+}
+
+static void cell_bounds(
+        const float64_t *xbounds, const int32_t *index, int ndim,
+        float64_t *xmins, float64_t *xmaxs) {
+
+    /* same arithmetic as in Cell.__init__ */
+
+    int idim, depth;
+    float64_t n, delta, i;
+
+    for (idim=0; idim<ndim; idim++) {
+        depth = depth_of(index[idim]);
+        n = (float64_t)(1 << depth);
+        i = (float64_t)(index[idim] - (1 << depth));
+        delta = (xbounds[idim*2+1] - xbounds[idim*2]) / n;
+        xmins[idim] = xbounds[idim*2] + i * delta;
+        xmaxs[idim] = xbounds[idim*2] + (i+1.0) * delta;
+    }
+}
+
+static int contains(const float64_t *xmins, const float64_t *xmaxs, const float64_t *x, int ndim) {
+    int idim;
+    for (idim=0; idim<ndim; idim++) {
+        if (!(xmins[idim] <= x[idim] && x[idim] <= xmaxs[idim])) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+static float64_t interpolate_point(
+        const uint8_t *records,
+        size_t recsize,
+        const int64_t *first_child,
+        const int64_t *next_sibling,
+        const float64_t *xbounds,
+        int ndim,
+        const float64_t *x) {
+
+    int64_t icell, ichild, ifound;
+    int idim, icorner, ncorners;
+    int32_t index[SPIT_NDIM_MAX];
+    float64_t xmins[SPIT_NDIM_MAX], xmaxs[SPIT_NDIM_MAX];
+    float64_t w[SPIT_NDIM_MAX][2];
+    float64_t f[1<<SPIT_NDIM_MAX];
+    float64_t b, wn, result;
+
+    for (idim=0; idim<ndim; idim++) {
+        if (!(xbounds[idim*2] <= x[idim] && x[idim] <= xbounds[idim*2+1])) {
+            return NAN;
+        }
+    }
+
+    icell = 0;
+    while (first_child[icell] != -1) {
+        /* the last matching child wins, as in Cell.interpolate_many */
+        ifound = -1;
+        for (ichild=first_child[icell]; ichild!=-1; ichild=next_sibling[ichild]) {
+            get_index(records, recsize, ichild, ndim, index);
+            cell_bounds(xbounds, index, ndim, xmins, xmaxs);
+            if (contains(xmins, xmaxs, x, ndim)) {
+                ifound = ichild;
+            }
+        }
+
+        if (ifound == -1) {
+            return NAN;
+        }
+        icell = ifound;
+    }
+
+    ncorners = 1 << ndim;
+    get_f(records, recsize, icell, ndim, f);
+    for (icorner=0; icorner<ncorners; icorner++) {
+        if (!isfinite(f[icorner])) {
+            return NAN;
+        }
+    }
+
+    get_index(records, recsize, icell, ndim, index);
+    cell_bounds(xbounds, index, ndim, xmins, xmaxs);
+
+    for (idim=0; idim<ndim; idim++) {
+        b = xmaxs[idim] - xmins[idim];
+        if (b == 0.0) {
+            w[idim][0] = 0.5;
+            w[idim][1] = 0.5;
+        } else {
+            w[idim][0] = (x[idim] - xmaxs[idim]) / -b;
+            w[idim][1] = (x[idim] - xmins[idim]) / b;
+        }
+    }
+
+    result = 0.0;
+    for (icorner=0; icorner<ncorners; icorner++) {
+        wn = 1.0;
+        for (idim=0; idim<ndim; idim++) {
+            wn *= w[idim][(icorner >> (ndim-1-idim)) & 1];
+        }
+        result += wn * f[icorner];
+    }
+
+    return result;
+}
+
+static PyObject* w_spit_link(PyObject *m, PyObject *args) {
+    struct module_state *st = GETSTATE(m);
+
+    PyObject *records_arr;
+    PyArrayObject *c_records_arr, *first_child_arr, *next_sibling_arr;
+    int ndim;
+    npy_intp shape_want[2], size[1];
+    spit_error_t err;
+
+    if (!PyArg_ParseTuple(args, "Oi", &records_arr, &ndim)) {
+        PyErr_SetString(st->error, "usage: spit_link(records, ndim)");
+        return NULL;
+    }
+
+    if (ndim < 1 || ndim > SPIT_NDIM_MAX) {
+        PyErr_SetString(st->error, "unsupported number of dimensions");
+        return NULL;
+    }
+
+    shape_want[0] = -1;
+    shape_want[1] = record_size(ndim);
+    if (!good_array(records_arr, NPY_UINT8, -1, 2, shape_want)) {
+        return NULL;
+    }
+
+    c_records_arr = PyArray_GETCONTIGUOUS((PyArrayObject*)records_arr);
+
+    size[0] = PyArray_DIMS(c_records_arr)[0];
+    first_child_arr = (PyArrayObject*)PyArray_EMPTY(1, size, NPY_INT64, 0);
+    next_sibling_arr = (PyArrayObject*)PyArray_EMPTY(1, size, NPY_INT64, 0);
+
+    Py_BEGIN_ALLOW_THREADS
+    err = spit_link(
+        PyArray_DATA(c_records_arr), size[0], ndim,
+        PyArray_DATA(first_child_arr), PyArray_DATA(next_sibling_arr));
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(c_records_arr);
+
+    if (err != SUCCESS) {
+        Py_DECREF(first_child_arr);
+        Py_DECREF(next_sibling_arr);
+        PyErr_SetString(st->error, spit_error_names[err]);
+        return NULL;
+    }
+
+    return Py_BuildValue("NN", (PyObject*)first_child_arr, (PyObject*)next_sibling_arr);
+}
+
+static PyObject* w_spit_interpolate_many(PyObject *m, PyObject *args) {
+    struct module_state *st = GETSTATE(m);
+
+    PyObject *records_arr, *first_child_arr, *next_sibling_arr, *xbounds_arr, *x_arr;
+    PyArrayObject *c_records_arr, *c_first_child_arr, *c_next_sibling_arr, *c_xbounds_arr, *c_x_arr, *result_arr;
+    int ndim;
+    npy_intp shape_want[2], size[1], ncells, ipoint;
+    const uint8_t *records;
+    const int64_t *first_child, *next_sibling;
+    const float64_t *xbounds, *x;
+    float64_t *result;
+    size_t recsize;
+
+    if (!PyArg_ParseTuple(args, "OOOOO", &records_arr, &first_child_arr, &next_sibling_arr, &xbounds_arr, &x_arr)) {
+        PyErr_SetString(st->error, "usage: spit_interpolate_many(records, first_child, next_sibling, xbounds, x)");
+        return NULL;
+    }
+
+    shape_want[0] = -1;
+    shape_want[1] = 2;
+    if (!good_array(xbounds_arr, NPY_FLOAT64, -1, 2, shape_want)) {
+        return NULL;
+    }
+
+    ndim = PyArray_DIMS((PyArrayObject*)xbounds_arr)[0];
+    if (ndim < 1 || ndim > SPIT_NDIM_MAX) {
+        PyErr_SetString(st->error, "unsupported number of dimensions");
+        return NULL;
+    }
+
+    recsize = record_size(ndim);
+    shape_want[0] = -1;
+    shape_want[1] = recsize;
+    if (!good_array(records_arr, NPY_UINT8, -1, 2, shape_want)) {
+        return NULL;
+    }
+
+    ncells = PyArray_DIMS((PyArrayObject*)records_arr)[0];
+    if (ncells == 0) {
+        PyErr_SetString(st->error, "tree has no cells");
+        return NULL;
+    }
+
+    size[0] = ncells;
+    if (!good_array(first_child_arr, NPY_INT64, ncells, 1, size) ||
+            !good_array(next_sibling_arr, NPY_INT64, ncells, 1, size)) {
+        return NULL;
+    }
+
+    shape_want[0] = -1;
+    shape_want[1] = ndim;
+    if (!good_array(x_arr, NPY_FLOAT64, -1, 2, shape_want)) {
+        return NULL;
+    }
+
+    c_records_arr = PyArray_GETCONTIGUOUS((PyArrayObject*)records_arr);
+    c_first_child_arr = PyArray_GETCONTIGUOUS((PyArrayObject*)first_child_arr);
+    c_next_sibling_arr = PyArray_GETCONTIGUOUS((PyArrayObject*)next_sibling_arr);
+    c_xbounds_arr = PyArray_GETCONTIGUOUS((PyArrayObject*)xbounds_arr);
+    c_x_arr = PyArray_GETCONTIGUOUS((PyArrayObject*)x_arr);
+
+    size[0] = PyArray_DIMS(c_x_arr)[0];
+    result_arr = (PyArrayObject*)PyArray_EMPTY(1, size, NPY_FLOAT64, 0);
+
+    records = PyArray_DATA(c_records_arr);
+    first_child = PyArray_DATA(c_first_child_arr);
+    next_sibling = PyArray_DATA(c_next_sibling_arr);
+    xbounds = PyArray_DATA(c_xbounds_arr);
+    x = PyArray_DATA(c_x_arr);
+    result = PyArray_DATA(result_arr);
+
+    Py_BEGIN_ALLOW_THREADS
+    for (ipoint=0; ipoint<size[0]; ipoint++) {
+        result[ipoint] = interpolate_point(
+            records, recsize, first_child, next_sibling, xbounds, ndim,
+            x + ipoint*ndim);
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(c_records_arr);
+    Py_DECREF(c_first_child_arr);
+    Py_DECREF(c_next_sibling_arr);
+    Py_DECREF(c_xbounds_arr);
+    Py_DECREF(c_x_arr);
+
+    return (PyObject*)result_arr;
+}
+
+static PyMethodDef spit_ext_methods[] = {
+    {"spit_link", (PyCFunction) w_spit_link, METH_VARARGS,
+"Reconstruct tree links from flat cell records in depth-first order.\n\n\
+:param records: cell records, ``uint8`` array of shape ``(ncells, recsize)``\n\
+:param ndim: number of dimensions\n\
+:returns: tuple ``(first_child, next_sibling)`` of ``int64`` arrays, ``-1``\n\
+    marks missing links"
+    },
+
+    {"spit_interpolate_many", (PyCFunction) w_spit_interpolate_many, METH_VARARGS,
+"Interpolate at many points.\n\n\
+:param records: cell records, ``uint8`` array of shape ``(ncells, recsize)``\n\
+:param first_child: ``int64`` array, as returned by :py:func:`spit_link`\n\
+:param next_sibling: ``int64`` array, as returned by :py:func:`spit_link`\n\
+:param xbounds: bounds of the tree, ``float64`` array of shape ``(ndim, 2)``\n\
+:param x: points, ``float64`` array of shape ``(npoints, ndim)``\n\
+:returns: interpolated values, NaN where undefined or out of bounds"
+    },
+
+    {NULL, NULL, 0, NULL}        /* Sentinel */
+};
+
+#if PY_MAJOR_VERSION >= 3
+
+static int spit_ext_traverse(PyObject *m, visitproc visit, void *arg) {
+    Py_VISIT(GETSTATE(m)->error);
+    return 0;
+}
+
+static int spit_ext_clear(PyObject *m) {
+    Py_CLEAR(GETSTATE(m)->error);
+    return 0;
+}
+
+static struct PyModuleDef moduledef = {
+        PyModuleDef_HEAD_INIT,
+        "spit_ext",
+        NULL,
+        sizeof(struct module_state),
+        spit_ext_methods,
+        NULL,
+        spit_ext_traverse,
+        spit_ext_clear,
+        NULL
+};
+
+#define INITERROR return NULL
+
+PyMODINIT_FUNC
+PyInit_spit_ext(void)
+
+#else
+#define INITERROR return
+
+void
+initspit_ext(void)
+#endif
+
+{
+#if PY_MAJOR_VERSION >= 3
+    PyObject *module = PyModule_Create(&moduledef);
+#else
+    PyObject *module = Py_InitModule("spit_ext", spit_ext_methods);
+#endif
+    import_array();
+
+    if (module == NULL)
+        INITERROR;
+    struct module_state *st = GETSTATE(module);
+
+    st->error = PyErr_NewException("pyrocko.spit_ext.SpitExtError", NULL, NULL);
+    if (st->error == NULL) {
+        Py_DECREF(module);
+        INITERROR;
+    }
+
+    Py_INCREF(st->error);
+    PyModule_AddObject(module, "SpitExtError", st->error);
+
+#if PY_MAJOR_VERSION >= 3
+    return module;
+#endif
+}
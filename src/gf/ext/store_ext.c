@@ -26,6 +26,8 @@
 #include <unistd.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
+#include <zlib.h>
 #if defined(_OPENMP)
     #include <omp.h>
 #endif
@@ -113,6 +115,7 @@ typedef enum {
     MMAP_TRACES_FAILED,
     INDEX_OUT_OF_BOUNDS,
     NTARGETS_OUT_OF_BOUNDS,
+    DECOMPRESSION_FAILED,
 } store_error_t;
 
 const char* store_error_names[] = {
@@ -132,6 +135,7 @@ const char* store_error_names[] = {
     "MMAP_TRACES_FAILED",
     "INDEX_OUT_OF_BOUNDS",
     "NTARGETS_OUT_OF_BOUNDS",
+    "DECOMPRESSION_FAILED",
 };
 
 #define NDIMS_CONTINUOUS_MAX 4
@@ -215,8 +219,48 @@ typedef struct {
     gf_dtype **memdata;
     const mapping_scheme_t *mapping_scheme;
     mapping_t *mapping;
+    int codec;
+    int deflate;
+    uint64_t id;
 } store_t;
 
+/* compressed stores
+ *
+ * Compressed stores are marked in the header of the traces file with the
+ * magic bytes "PGFZ", a version byte, the codec id and a deflate flag. Each
+ * record then starts with the number of stored bytes and the number of bytes
+ * after inflating (little-endian uint32). For the lossy codecs, the samples
+ * are encoded in blocks, each with a float32 scale factor. If deflate is
+ * used, the bytes of the sample values are shuffled before compression. */
+
+#define GF_TRACES_HEADER_SIZE 32
+#define GF_RECORD_HEADER_SIZE 8
+#define GF_COMPRESSION_BLOCK_SIZE 256
+
+typedef enum {
+    CODEC_NONE = 0,
+    CODEC_FLOAT32,
+    CODEC_FLOAT16,
+    CODEC_INT16,
+    UNDEFINED_CODEC,
+} codec_id;
+
+static const size_t codec_value_size[] = {4, 4, 2, 2};
+
+/* per-thread cache of decompressed records, direct-mapped */
+
+#define ZCACHE_NSLOTS 1024
+
+typedef struct {
+    uint64_t store_id;
+    uint64_t irecord;
+    int32_t nalloc;
+    gf_dtype *data;
+} zcache_slot_t;
+
+static uint64_t store_id_counter = 0;
+static __thread zcache_slot_t *zcache = NULL;
+
 typedef struct {
     int is_zero;
     int32_t itmin;
@@ -366,7 +410,7 @@ int good_array(PyObject* o, int typenum_want, npy_intp size_want, int ndim_want,
 }
 
 static const trace_t ZERO_TRACE = { 1, 0, 0, 0.0, 0.0, NULL };
-static const store_t ZERO_STORE = { 0, 0, 0, 0, 0.0, NULL, NULL, NULL, NULL, NULL };
+static const store_t ZERO_STORE = { 0, 0, 0, 0, 0.0, NULL, NULL, NULL, NULL, NULL, CODEC_NONE, 0, 0 };
 
 static store_error_t store_get_span(const store_t *store, uint64_t irecord,
                              int32_t *itmin, int32_t *nsamples, int *is_zero) {
@@ -408,6 +452,204 @@ static store_error_t store_read(
     return SUCCESS;
 }
 
+static uint32_t get_le32(const uint8_t *p) {
+    return (uint32_t)p[0] | ((uint32_t)p[1] << 8) |
+           ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static uint16_t get_le16(const uint8_t *p) {
+    return (uint16_t)((uint16_t)p[0] | ((uint16_t)p[1] << 8));
+}
+
+static float32_t get_le32_float(const uint8_t *p) {
+    uint32_t u;
+    float32_t f;
+    u = get_le32(p);
+    memcpy(&f, &u, 4);
+    return f;
+}
+
+static float32_t half_to_float(uint16_t h) {
+    uint32_t exponent, mantissa;
+    float32_t f;
+
+    exponent = (h >> 10) & 0x1f;
+    mantissa = h & 0x3ff;
+    if (exponent == 0) {
+        f = ldexpf((float32_t)mantissa, -24);
+    } else if (exponent == 31) {
+        f = mantissa ? NAN : INFINITY;
+    } else {
+        f = ldexpf((float32_t)(mantissa | 0x400), (int)exponent - 25);
+    }
+
+    return (h & 0x8000) ? -f : f;
+}
+
+static store_error_t store_decode(
+        const store_t *store,
+        const uint8_t *raw,
+        size_t nraw,
+        int32_t nsamples,
+        gf_dtype *out) {
+
+    size_t es, nscales, k, b, n;
+    const uint8_t *scales, *values;
+    uint8_t v[4];
+    float32_t x;
+
+    n = (size_t)nsamples;
+    es = codec_value_size[store->codec];
+    nscales = (CODEC_FLOAT32 == store->codec) ? 0 :
+        (n + GF_COMPRESSION_BLOCK_SIZE - 1) / GF_COMPRESSION_BLOCK_SIZE;
+
+    if (nraw != nscales*4 + n*es) {
+        return BAD_RECORD;
+    }
+
+    scales = raw;
+    values = raw + nscales*4;
+
+    for (k=0; k<n; k++) {
+        for (b=0; b<es; b++) {
+            v[b] = store->deflate ? values[b*n + k] : values[k*es + b];
+        }
+
+        switch (store->codec) {
+            case CODEC_FLOAT32:
+                x = get_le32_float(v);
+                break;
+            case CODEC_FLOAT16:
+                x = half_to_float(get_le16(v)) *
+                    get_le32_float(scales + 4*(k/GF_COMPRESSION_BLOCK_SIZE));
+                break;
+            case CODEC_INT16:
+                x = (float32_t)(int16_t)get_le16(v) *
+                    get_le32_float(scales + 4*(k/GF_COMPRESSION_BLOCK_SIZE));
+                break;
+            default:
+                return BAD_STORE;
+        }
+
+        /* keep store byte order, as for uncompressed stores */
+        out[k] = fe32toh(x);
+    }
+
+    return SUCCESS;
+}
+
+static store_error_t store_get_compressed(
+        const store_t *store,
+        uint64_t irecord,
+        const record_t *record,
+        uint64_t data_offset,
+        int32_t nsamples,
+        gf_dtype **data) {
+
+    zcache_slot_t *slot;
+    uint8_t head[GF_RECORD_HEADER_SIZE];
+    uint32_t nstored, nraw;
+    uint8_t *stored = NULL, *raw = NULL;
+    const uint8_t *p;
+    uLongf nraw_out;
+    store_error_t err = SUCCESS;
+
+    if (NULL == zcache) {
+        zcache = (zcache_slot_t*)calloc(ZCACHE_NSLOTS, sizeof(zcache_slot_t));
+        if (NULL == zcache) {
+            return ALLOC_FAILED;
+        }
+    }
+
+    slot = &zcache[(irecord + store->id * 7919) % ZCACHE_NSLOTS];
+    if (NULL != slot->data && slot->store_id == store->id &&
+            slot->irecord == irecord) {
+
+        *data = slot->data;
+        return SUCCESS;
+    }
+
+    if (data_offset + GF_RECORD_HEADER_SIZE > store->data_size) {
+        return BAD_DATA_OFFSET;
+    }
+
+    if (NULL != store->data) {
+        memcpy(head, (const uint8_t*)store->data + data_offset,
+               GF_RECORD_HEADER_SIZE);
+    } else {
+        err = store_read(store, data_offset, GF_RECORD_HEADER_SIZE, head);
+        if (SUCCESS != err) {
+            return err;
+        }
+    }
+
+    nstored = get_le32(head);
+    nraw = get_le32(head+4);
+
+    if (data_offset + GF_RECORD_HEADER_SIZE + nstored > store->data_size) {
+        return BAD_DATA_OFFSET;
+    }
+
+    if (NULL != store->data) {
+        p = (const uint8_t*)store->data + data_offset + GF_RECORD_HEADER_SIZE;
+    } else {
+        stored = (uint8_t*)malloc(max(nstored, 1u));
+        if (NULL == stored) {
+            return ALLOC_FAILED;
+        }
+        err = store_read(
+            store, data_offset + GF_RECORD_HEADER_SIZE, nstored, stored);
+        p = stored;
+    }
+
+    if (SUCCESS == err && store->deflate) {
+        raw = (uint8_t*)malloc(max(nraw, 1u));
+        nraw_out = nraw;
+        if (NULL == raw) {
+            err = ALLOC_FAILED;
+        } else if (Z_OK != uncompress(raw, &nraw_out, p, nstored) ||
+                   nraw_out != nraw) {
+            err = DECOMPRESSION_FAILED;
+        } else {
+            p = raw;
+        }
+    } else if (SUCCESS == err && nstored != nraw) {
+        err = BAD_RECORD;
+    }
+
+    if (SUCCESS == err && slot->nalloc < nsamples) {
+        free(slot->data);
+        slot->nalloc = 0;
+        slot->data = (gf_dtype*)malloc(nsamples * sizeof(gf_dtype));
+        if (NULL == slot->data) {
+            err = ALLOC_FAILED;
+        } else {
+            slot->nalloc = nsamples;
+        }
+    }
+
+    if (SUCCESS == err) {
+        err = store_decode(store, p, nraw, nsamples, slot->data);
+    }
+
+    free(stored);
+    free(raw);
+
+    if (SUCCESS != err) {
+        slot->store_id = 0;
+        return err;
+    }
+
+    /* end points are exact, also for the lossy codecs */
+    slot->data[0] = record->begin_value;
+    slot->data[nsamples-1] = record->end_value;
+
+    slot->store_id = store->id;
+    slot->irecord = irecord;
+    *data = slot->data;
+    return SUCCESS;
+}
+
 static store_error_t store_get(
         const store_t *store,
         uint64_t irecord,
@@ -448,13 +690,23 @@ static store_error_t store_get(
 
     trace->is_zero = 0;
 
-    if (data_offset + trace->nsamples*sizeof(gf_dtype) > store->data_size) {
+    if (CODEC_NONE == store->codec &&
+            data_offset + trace->nsamples*sizeof(gf_dtype) > store->data_size) {
         *trace = ZERO_TRACE;
         return BAD_DATA_OFFSET;
     }
 
     if (REC_SHORT == data_offset) {
         trace->data = &record->begin_value;
+    } else if (CODEC_NONE != store->codec) {
+        err = store_get_compressed(
+            store, irecord, record, data_offset, trace->nsamples,
+            &trace->data);
+
+        if (SUCCESS != err) {
+            *trace = ZERO_TRACE;
+            return err;
+        }
     } else {
         if (NULL != store->data) {
             trace->data = &store->data[data_offset/sizeof(gf_dtype)];
@@ -764,11 +1016,62 @@ static store_error_t store_sum_static(
     return SUCCESS;
 }
 
+static store_error_t store_sum_many(
+        const store_t *store,
+        const uint64_t *irecords,
+        const float32_t *delays,
+        const float32_t *weights,
+        const uint64_t *offsets,
+        size_t nstacks,
+        int32_t itmin,
+        int32_t nsamples,
+        int32_t nthreads,
+        gf_dtype *out) {
+
+    size_t istack;
+    trace_t result;
+    store_error_t err = SUCCESS;
+    (void) nthreads;
+
+    #if defined(_OPENMP)
+        if (nthreads == 0)
+            nthreads = omp_get_num_procs();
+
+        #pragma omp parallel \
+            shared (store, irecords, delays, weights, offsets, nstacks, \
+                    itmin, nsamples, out) \
+            private (istack, result) \
+            reduction (+: err) \
+            num_threads (nthreads)
+        {
+        #pragma omp for schedule (dynamic)
+    #endif
+        for (istack=0; istack<nstacks; istack++) {
+            result.itmin = itmin;
+            result.nsamples = nsamples;
+            result.data = out + istack*(size_t)nsamples;
+            err += store_sum(
+                store,
+                irecords + offsets[istack],
+                delays + offsets[istack],
+                weights + offsets[istack],
+                (int)(offsets[istack+1] - offsets[istack]),
+                &result);
+        }
+    #if defined(_OPENMP)
+        }
+    #endif
+    if (err != SUCCESS)
+        return BAD_REQUEST;
+    return SUCCESS;
+}
+
 static store_error_t store_init(int f_index, int f_data, store_t *store) {
     void *p;
     struct stat st;
     size_t mmap_index_size;
     int use_mmap;
+    uint8_t header[GF_TRACES_HEADER_SIZE];
 
     use_mmap = 0;
 
@@ -802,6 +1105,25 @@ static store_error_t store_init(int f_index, int f_data, store_t *store) {
         return BAD_STORE;
     }
 
+    store->id = ++store_id_counter;
+    store->codec = CODEC_NONE;
+    store->deflate = 0;
+    if (store->data_size >= GF_TRACES_HEADER_SIZE) {
+        if (GF_TRACES_HEADER_SIZE != pread(
+                store->f_data, header, GF_TRACES_HEADER_SIZE, 0)) {
+            return READ_DATA_FAILED;
+        }
+
+        if (0 == memcmp(header, "PGFZ", 4)) {
+            if (1 != header[4] || CODEC_NONE == header[5] ||
+                    UNDEFINED_CODEC <= header[5]) {
+                return BAD_STORE;
+            }
+            store->codec = header[5];
+            store->deflate = header[6] != 0;
+        }
+    }
+
     mmap_index_size = sizeof(record_t) * store->nrecords + GF_STORE_HEADER_SIZE;
     if (mmap_index_size >= SIZE_MAX) {
         return MMAP_INDEX_FAILED;
@@ -1803,6 +2125,108 @@ static PyObject* w_store_sum_static(PyObject *m, PyObject *args) {
 }
 
 
+static PyObject* w_store_sum_many(PyObject *m, PyObject *args) {
+    PyObject *capsule, *irecords_arr, *delays_arr, *weights_arr, *offsets_arr;
+    PyArrayObject *array = NULL;
+    store_t *store;
+    npy_intp array_dims[2] = {0, 0};
+    uint64_t *irecords, *offsets;
+    float32_t *delays, *weights;
+    npy_intp n_, noffsets;
+    size_t istack, nstacks;
+    int itmin_, nsamples_, nthreads;
+    int32_t itmin, nsamples;
+    store_error_t err;
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "OOOOOiii", &capsule, &irecords_arr,
+                          &delays_arr, &weights_arr, &offsets_arr, &itmin_,
+                          &nsamples_, &nthreads)) {
+        PyErr_SetString(st->error,
+            "usage: store_sum_many(cstore, irecords, delays, weights, offsets, itmin, nsamples, nthreads)");
+
+        return NULL;
+    }
+
+    store = get_store_from_capsule(capsule);
+    if (store == NULL) return NULL;
+
+    if (!good_array(irecords_arr, NPY_UINT64, -1, 1, NULL)) return NULL;
+    n_ = PyArray_SIZE((PyArrayObject*)irecords_arr);
+    if (!inposlimits(n_)) {
+        PyErr_SetString(st->error,
+            "store_sum_many: invalid number of entries in arrays");
+        return NULL;
+    }
+
+    if (!good_array(delays_arr, NPY_FLOAT32, n_, 1, NULL)) return NULL;
+    if (!good_array(weights_arr, NPY_FLOAT32, n_, 1, NULL)) return NULL;
+    if (!good_array(offsets_arr, NPY_UINT64, -1, 1, NULL)) return NULL;
+
+    noffsets = PyArray_SIZE((PyArrayObject*)offsets_arr);
+    if (noffsets < 1) {
+        PyErr_SetString(st->error,
+            "store_sum_many: offsets array must have at least one entry");
+        return NULL;
+    }
+    nstacks = noffsets - 1;
+
+    irecords = PyArray_DATA((PyArrayObject*)irecords_arr);
+    delays = PyArray_DATA((PyArrayObject*)delays_arr);
+    weights = PyArray_DATA((PyArrayObject*)weights_arr);
+    offsets = PyArray_DATA((PyArrayObject*)offsets_arr);
+
+    for (istack=0; istack<nstacks; istack++) {
+        if (offsets[istack] > offsets[istack+1] ||
+                offsets[istack+1] > (uint64_t)n_) {
+            PyErr_SetString(st->error,
+                "store_sum_many: invalid offsets array");
+            return NULL;
+        }
+    }
+
+    if (!inlimits(itmin_)) {
+        PyErr_SetString(st->error, "store_sum_many: invalid itmin argument");
+        return NULL;
+    }
+    itmin = itmin_;
+
+    if (!(inposlimits(nsamples_) || -1 == nsamples_)) {
+        PyErr_SetString(st->error,
+            "store_sum_many: invalid nsamples argument");
+        return NULL;
+    }
+    nsamples = nsamples_;
+
+    if (nsamples == -1) {
+        err = store_sum_extent(
+            store, irecords, delays, (int)n_, &nsamples, &itmin);
+        if (SUCCESS != err) {
+            PyErr_SetString(st->error, store_error_names[err]);
+            return NULL;
+        }
+    }
+
+    array_dims[0] = nstacks;
+    array_dims[1] = nsamples;
+    array = (PyArrayObject*)PyArray_ZEROS(2, array_dims, NPY_GFDTYPE, 0);
+
+    Py_BEGIN_ALLOW_THREADS
+    err = store_sum_many(
+        store, irecords, delays, weights, offsets, nstacks, itmin, nsamples,
+        nthreads, (gf_dtype*)PyArray_DATA(array));
+    Py_END_ALLOW_THREADS
+
+    if (SUCCESS != err) {
+        Py_DECREF(array);
+        PyErr_SetString(st->error, store_error_names[err]);
+        return NULL;
+    }
+
+    return Py_BuildValue("Ni", array, itmin);
+}
+
 static PyObject* w_make_sum_params(PyObject *m, PyObject *args) {
     PyObject *capsule, *source_coords_arr, *receiver_coords_arr, *ms_arr;
     float64_t *source_coords, *receiver_coords, *ms;
@@ -1936,6 +2360,9 @@ static PyMethodDef store_ext_methods[] = {
     {"store_sum_static", w_store_sum_static, METH_VARARGS,
         "Get weight-and-delay-sum of GF samples for static displacement." },
 
+    {"store_sum_many", w_store_sum_many, METH_VARARGS,
+        "Get several weight-and-delay-sums of GF traces in one go." },
+
     {"make_sum_params", w_make_sum_params, METH_VARARGS,
         "Prepare parameters for weight-and-delay-sum." },
 
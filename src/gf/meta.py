@@ -2066,7 +2066,8 @@ class ConfigTypeC(Config):
             (num.arange(self.ncomponents),)
         self.nreceiver_depths, self.nsource_depths, self.ndistances = self.ns
 
-        self._distances_cache = {}
+        self._ireceiver_cache = {}
+        self._receiver_index = None
 
     def _make_index_functions(self):
 
@@ -2194,24 +2195,109 @@ class ConfigTypeC(Config):
         self._vicinity_function = vicinity_function
         self._vicinities_function = vicinities_function
 
-    def lookup_ireceiver(self, receiver):
-        k = (receiver.lat, receiver.lon,
-             receiver.north_shift, receiver.east_shift)
+    def _receiver_index_coordinates(self, locations):
+        latlons = num.array(
+            [loc.effective_latlon for loc in locations], dtype=num.float)
+        depths = num.array([loc.depth for loc in locations], dtype=num.float)
+
+        dh = min(self.source_north_shift_delta, self.source_east_shift_delta)
+        dv = self.source_depth_delta
+
+        coords = num.empty((len(locations), 4), dtype=num.float)
+        if len(locations) != 0:
+            x, y, z = orthodrome.geodetic_to_ecef(
+                latlons[:, 0], latlons[:, 1], 0.0)
+
+            coords[:, 0] = x / dh
+            coords[:, 1] = y / dh
+            coords[:, 2] = z / dh
+            coords[:, 3] = depths / dv
+
+        return coords
+
+    def _get_receiver_index(self):
+        if self._receiver_index is None:
+            from scipy.spatial import cKDTree
+            self._receiver_index = cKDTree(
+                self._receiver_index_coordinates(self.receivers))
+
+        return self._receiver_index
+
+    def _receiver_match(self, receiver, irecs):
         dh = min(self.source_north_shift_delta, self.source_east_shift_delta)
         dv = self.source_depth_delta
 
-        for irec, rec in enumerate(self.receivers):
-            if (k, irec) not in self._distances_cache:
-                self._distances_cache[k, irec] = math.sqrt(
-                    (receiver.distance_to(rec)/dh)**2 +
-                    ((rec.depth - receiver.depth)/dv)**2)
+        for irec in sorted(irecs):
+            rec = self.receivers[irec]
+            d = math.sqrt(
+                (receiver.distance_to(rec)/dh)**2 +
+                ((rec.depth - receiver.depth)/dv)**2)
 
-            if self._distances_cache[k, irec] < 0.1:
+            if d < 0.1:
                 return irec
 
-        raise OutOfBounds(
-            reason='No GFs available for receiver at (%g, %g).' %
-            receiver.effective_latlon)
+        return None
+
+    def lookup_ireceiver(self, receiver):
+        '''
+        Get index of the store receiver matching a given receiver location.
+
+        Candidates are preselected through a KD-tree on ECEF coordinates,
+        built once on first use, and then checked with the exact distance
+        criterion.
+
+        :param receiver: receiver location
+        :type receiver: :py:class:`~pyrocko.model.location.Location`
+        :returns: receiver index
+        :raises: :py:exc:`OutOfBounds` if no receiver is within tolerance
+        '''
+
+        return int(self.lookup_ireceivers([receiver])[0])
+
+    def lookup_ireceivers(self, receivers):
+        '''
+        Get indices of the store receivers matching many receiver locations.
+
+        :param receivers: receiver locations
+        :type receivers: list of :py:class:`~pyrocko.model.location.Location`
+        :returns: receiver indices
+        :rtype: :py:class:`numpy.ndarray` of ``int``
+        :raises: :py:exc:`OutOfBounds` if any receiver is not matched
+        '''
+
+        ireceivers = num.empty(len(receivers), dtype=num.int)
+
+        todo = []
+        for i, receiver in enumerate(receivers):
+            k = (receiver.lat, receiver.lon,
+                 receiver.north_shift, receiver.east_shift, receiver.depth)
+
+            irec = self._ireceiver_cache.get(k, None)
+            if irec is None:
+                todo.append((i, k))
+            else:
+                ireceivers[i] = irec
+
+        if todo:
+            index = self._get_receiver_index()
+            coords = self._receiver_index_coordinates(
+                [receivers[i] for (i, _) in todo])
+
+            # the doubled radius leaves room for the differences between
+            # chord, geodesic and local cartesian distances
+            candidates = index.query_ball_point(coords, r=0.2)
+
+            for (i, k), irecs in zip(todo, candidates):
+                irec = self._receiver_match(receivers[i], irecs)
+                if irec is None:
+                    raise OutOfBounds(
+                        reason='No GFs available for receiver at (%g, %g).' %
+                        receivers[i].effective_latlon)
+
+                self._ireceiver_cache[k] = irec
+                ireceivers[i] = irec
+
+        return ireceivers
 
     def make_indexing_args(self, source, receiver, icomponents):
         nc = icomponents.size
@@ -6,12 +6,14 @@ from __future__ import absolute_import, division
 from builtins import range, map, zip
 from past.builtins import cmp
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from functools import cmp_to_key
 import time
 import math
 import os
 import re
+import json
+import struct
 import logging
 import resource
 
@@ -25,6 +27,7 @@ from pyrocko.guts_array import Array
 from pyrocko import moment_tensor as mt
 from pyrocko import trace, util, config, model
 from pyrocko.orthodrome import ne_to_latlon
+from pyrocko.parimap import parimap
 from pyrocko.model import Location
 
 from . import meta, store, ws
@@ -227,7 +230,7 @@ def discretize_rect_source(deltas, deltat, north, east, depth,
 
     points = num.dot(rotmat.T, points.T).T
 
-    xtau, amplitudes = stf.discretize_t(deltat, tref)
+    xtau, amplitudes = stf.discretize_t_cached(deltat, tref)
     nt = xtau.size
 
     points2 = num.repeat(points, nt, axis=0)
@@ -636,12 +639,83 @@ class STF(Object, Cloneable):
                 num.array([tl, th], dtype=num.float),
                 num.array([th - tref, tref - tl], dtype=num.float) / deltat)
 
+    def discretize_t_cached(self, deltat, tref):
+        '''
+        Memoized version of :py:meth:`discretize_t`.
+
+        The STF is discretized for the sub-sample part of ``tref`` only and
+        shifted by the remaining integer number of samples, so that results
+        can be reused for all reference times with the same sub-sample
+        shift.
+        '''
+
+        ishift = math.floor(tref / deltat)
+        tfrac = tref - ishift * deltat
+
+        key = (type(self).__name__,) + tuple(
+            v for (_, v) in self.T.inamevals(self)) + (deltat, tfrac)
+
+        try:
+            times, amplitudes = g_stf_cache.pop(key)
+        except KeyError:
+            times, amplitudes = self.discretize_t(deltat, tfrac)
+            while len(g_stf_cache) >= g_stf_cache_size:
+                g_stf_cache.popitem(last=False)
+
+        g_stf_cache[key] = times, amplitudes
+
+        return times + ishift * deltat, amplitudes.copy()
+
     def base_key(self):
         return (type(self).__name__,)
 
 
 g_unit_pulse = STF()
 
+g_stf_cache = OrderedDict()
+g_stf_cache_size = 1000
+
+# minimum number of STF samples for which FFT is used in the convolution
+g_stf_fft_min_nsamples = 512
+
+
+def convolve_stf(amplitudes, data):
+    '''
+    Convolve seismograms with a discretized STF.
+
+    The end point of the data is repeated to prevent boundary effects.
+    Direct convolution is used for short STFs, FFT for long ones.
+
+    :param amplitudes: discretized STF as returned by
+        :py:meth:`STF.discretize_t`
+    :param data: seismogram(s) as array with time along the last axis
+    :returns: array with ``amplitudes.size - 1`` more samples than ``data``
+        along the last axis
+    '''
+
+    n = data.shape[-1]
+    nout = n + amplitudes.size - 1
+
+    padded_data = num.empty(data.shape[:-1] + (nout,), dtype=num.float)
+    padded_data[..., :n] = data
+    padded_data[..., n:] = data[..., -1:]
+
+    if amplitudes.size >= g_stf_fft_min_nsamples:
+        nfft = trace.nextpow2(nout + amplitudes.size - 1)
+        return num.fft.irfft(
+            num.fft.rfft(padded_data, nfft) * num.fft.rfft(amplitudes, nfft),
+            nfft)[..., :nout]
+
+    elif padded_data.ndim == 1:
+        return num.convolve(amplitudes, padded_data)[:nout]
+
+    else:
+        out = num.zeros_like(padded_data)
+        for i, amplitude in enumerate(amplitudes):
+            out[..., i:] += amplitude * padded_data[..., :nout-i]
+
+        return out
+
 
 def sshift(times, amplitudes, tshift, deltat):
 
@@ -2409,6 +2483,188 @@ class Response(Object):
 
         trace.snuffle(self.pyrocko_traces(), **kwargs)
 
+    def dump_binary(self, stream):
+        '''
+        Write response to stream in compact binary format.
+
+        The results are written as a sequence of frames, see
+        :py:func:`iload_response_binary`. Trace samples are written as raw
+        little-endian float32 arrays. The request is not included, the
+        receiving side is expected to know it.
+        '''
+
+        dump_binary_start(stream)
+        dump_binary_results(stream, self.results_list)
+        dump_binary_end(stream, self.stats)
+
+
+def dump_binary_start(stream):
+    '''
+    Write start of response in binary format.
+
+    Together with :py:func:`dump_binary_results` and
+    :py:func:`dump_binary_end`, this allows to write a response piece by
+    piece, e.g. while the results of parts of the request are computed.
+    '''
+
+    stream.write(g_binary_response_magic)
+
+
+def dump_binary_results(stream, results_list, isource_offset=0,
+                        itarget_offset=0):
+    '''
+    Write result frames of response in binary format.
+
+    :param results_list: results, indexed by source and target
+    :param isource_offset: index of the first source in the complete request
+    :param itarget_offset: index of the first target in the complete request
+    '''
+
+    for isource, results in enumerate(results_list):
+        for itarget, result in enumerate(results):
+            header = dict(
+                isource=isource_offset + isource,
+                itarget=itarget_offset + itarget)
+
+            if type(result) is meta.Result and result.trace is not None:
+                tr = result.trace
+                header.update(
+                    codes=list(tr.codes),
+                    deltat=tr.deltat,
+                    tmin=tr.tmin,
+                    n_records_stacked=result.n_records_stacked,
+                    t_stack=result.t_stack,
+                    n_shared_stacking=result.n_shared_stacking,
+                    t_optimize=result.t_optimize)
+
+                data = num.ascontiguousarray(tr.data, dtype='<f4')
+                _write_binary_frame(stream, b'T', header, data)
+
+            else:
+                _write_binary_frame(
+                    stream, b'Y', header, result.dump().encode('utf-8'))
+
+
+def dump_binary_end(stream, stats):
+    '''
+    Write processing statistics and end of response in binary format.
+    '''
+
+    _write_binary_frame(stream, b'S', {}, stats.dump().encode('utf-8'))
+    _write_binary_frame(stream, b'E', {}, b'')
+
+
+binary_response_mimetype = 'application/x-pyrocko-gf-response'
+
+g_binary_response_magic = b'PGFR\x01'
+g_binary_frame_header = struct.Struct('<cII')
+
+
+def _write_binary_frame(stream, kind, header, payload):
+    header = json.dumps(header).encode('utf-8')
+    stream.write(g_binary_frame_header.pack(
+        kind, len(header), memoryview(payload).nbytes))
+    stream.write(header)
+    stream.write(payload)
+
+
+def _read_exact(stream, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        nread = stream.readinto(view[pos:])
+        if not nread:
+            raise SeismosizerError('Unexpected end of binary response.')
+
+        pos += nread
+
+    return buf
+
+
+def iload_response_binary(stream):
+    '''
+    Read response in binary format incrementally.
+
+    A response starts with the magic bytes ``PGFR`` and a version byte,
+    followed by frames. Each frame is made of a type code (one byte), the
+    header and payload sizes (little-endian uint32), a JSON header and the
+    payload. Frame types are ``T`` (:py:class:`~pyrocko.gf.meta.Result`
+    with trace, payload are the float32 samples), ``Y`` (any other result,
+    payload is YAML), ``S`` (:py:class:`ProcessingStats` as YAML) and ``E``
+    (end of response).
+
+    :param stream: file-like object, supporting ``readinto``
+    :returns: generator yielding ``(isource, itarget, result)`` tuples as
+        results arrive, and ``(None, None, stats)`` for the processing
+        statistics
+    '''
+
+    magic = bytes(_read_exact(stream, len(g_binary_response_magic)))
+    if magic != g_binary_response_magic:
+        raise SeismosizerError('Invalid binary response.')
+
+    while True:
+        kind, nheader, npayload = g_binary_frame_header.unpack(
+            bytes(_read_exact(stream, g_binary_frame_header.size)))
+
+        header = json.loads(_read_exact(stream, nheader).decode('utf-8'))
+        payload = _read_exact(stream, npayload)
+
+        if kind == b'T':
+            result = meta.Result(
+                trace=meta.SeismosizerTrace(
+                    codes=tuple(header['codes']),
+                    deltat=header['deltat'],
+                    tmin=header['tmin'],
+                    data=num.frombuffer(payload, dtype='<f4').astype(
+                        num.float32, copy=False)),
+                n_records_stacked=header['n_records_stacked'],
+                t_stack=header['t_stack'],
+                n_shared_stacking=header['n_shared_stacking'],
+                t_optimize=header['t_optimize'])
+
+            yield header['isource'], header['itarget'], result
+
+        elif kind == b'Y':
+            yield header['isource'], header['itarget'], \
+                meta.load(string=payload.decode('utf-8'))
+
+        elif kind == b'S':
+            yield None, None, meta.load(string=payload.decode('utf-8'))
+
+        elif kind == b'E':
+            break
+
+        else:
+            raise SeismosizerError(
+                'Invalid frame type in binary response: %r' % kind)
+
+
+def load_response_binary(stream, request):
+    '''
+    Read response in binary format.
+
+    :param stream: file-like object, supporting ``readinto``
+    :param request: the :py:class:`Request` the response belongs to
+    :returns: :py:class:`Response` object
+    '''
+
+    results_list = [
+        [None] * len(request.targets) for _ in range(len(request.sources))]
+
+    stats = None
+    for isource, itarget, result in iload_response_binary(stream):
+        if isource is None:
+            stats = result
+        else:
+            results_list[isource][itarget] = result
+
+    return Response(
+        request=request,
+        results_list=results_list,
+        stats=stats or ProcessingStats())
+
 
 class Engine(Object):
     '''
@@ -2519,10 +2775,20 @@ class StaticDisplacement(Rule):
     def apply_(self, target, base_statics):
         if isinstance(target, SatelliteTarget):
             los_fac = target.get_los_factors()
-            base_statics['displacement.los'] =\
-                (los_fac[:, 0] * -base_statics['displacement.d'] +
-                 los_fac[:, 1] * base_statics['displacement.e'] +
-                 los_fac[:, 2] * base_statics['displacement.n'])
+
+            # project in place, with a single scratch array, large scenes
+            # would otherwise create several full-size temporaries
+            los = num.multiply(los_fac[:, 0], base_statics['displacement.d'])
+            num.negative(los, out=los)
+            tmp = num.empty_like(los)
+            num.multiply(los_fac[:, 1], base_statics['displacement.e'],
+                         out=tmp)
+            los += tmp
+            num.multiply(los_fac[:, 2], base_statics['displacement.n'],
+                         out=tmp)
+            los += tmp
+            base_statics['displacement.los'] = los
+
         return base_statics
 
 
@@ -2546,6 +2812,79 @@ class OutOfBoundsContext(Object):
     components = List.T(String.T())
 
 
+def _discretize_key(source, target):
+    '''
+    Get key to identify equivalent source discretizations.
+
+    All parameters of the source except the origin time enter the key, as
+    some source models include the amplitude in the discretization.
+    '''
+
+    values = [type(source).__name__]
+    for name, value in source.T.inamevals(source):
+        if name == 'time':
+            continue
+
+        if isinstance(value, STF):
+            value = value.base_key()
+        elif isinstance(value, num.ndarray):
+            value = (value.shape, value.tobytes())
+
+        values.append(value)
+
+    if target is not None:
+        values.append(target.interpolation)
+
+    return tuple(values)
+
+
+class DiscretizedSourceCache(object):
+    '''
+    Bounded least-recently-used cache for discretized sources.
+
+    :param max_entries: maximum number of discretized sources to keep
+    '''
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, key):
+        try:
+            value = self._entries.pop(key)
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+        except KeyError:
+            self.misses += 1
+            return None
+
+    def __setitem__(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            nentries=len(self._entries),
+            max_entries=self.max_entries)
+
+
 def process_subrequest_dynamic(work, pshared=None):
     engine = pshared['engine']
     _, _, isources, itargets = work
@@ -2558,52 +2897,62 @@ def process_subrequest_dynamic(work, pshared=None):
         rule = engine.get_rule(sources[0], target)
         components.update(rule.required_components(target))
 
-    try:
-        base_seismogram, tcounters = engine.base_seismogram(
-            sources[0],
-            targets[0],
-            components,
-            pshared['dsource_cache'])
-
-    except meta.OutOfBounds as e:
-        e.context = OutOfBoundsContext(
-            source=sources[0],
-            target=targets[0],
-            distance=sources[0].distance_to(targets[0]),
-            components=components)
-        raise
-
-    n_records_stacked = 0
-    t_optimize = 0.0
-    t_stack = 0.0
-    for _, tr in base_seismogram.items():
-        n_records_stacked += tr.n_records_stacked
-        t_optimize += tr.t_optimize
-        t_stack += tr.t_stack
-
-    results = []
+    # sources with equal base_key may still differ in their discretization,
+    # e.g. in amplitude
+    groups = defaultdict(list)
     for isource, source in zip(isources, sources):
-        for itarget, target in zip(itargets, targets):
-            try:
-                result = engine._post_process_dynamic(
-                    base_seismogram, source, target)
-                result.n_records_stacked = n_records_stacked
-                result.n_shared_stacking = len(sources) * len(targets)
-                result.t_optimize = t_optimize
-                result.t_stack = t_stack
+        groups[_discretize_key(source, targets[0])].append((isource, source))
 
-            except SeismosizerError as e:
-                result = e
+    results = []
+    tdiffs = 0.0
+    for group in groups.values():
+        source0 = group[0][1]
+        try:
+            base_seismogram, tcounters = engine.base_seismogram(
+                source0,
+                targets[0],
+                components,
+                pshared['dsource_cache'],
+                pshared.get('nthreads', 1))
+
+        except meta.OutOfBounds as e:
+            e.context = OutOfBoundsContext(
+                source=source0,
+                target=targets[0],
+                distance=source0.distance_to(targets[0]),
+                components=components)
+            raise
+
+        n_records_stacked = 0
+        t_optimize = 0.0
+        t_stack = 0.0
+        for _, tr in base_seismogram.items():
+            n_records_stacked += tr.n_records_stacked
+            t_optimize += tr.t_optimize
+            t_stack += tr.t_stack
+
+        for isource, source in group:
+            for itarget, result in zip(
+                    itargets,
+                    engine._post_process_dynamic_many(
+                        base_seismogram, source, targets)):
+
+                if not isinstance(result, SeismosizerError):
+                    result.n_records_stacked = n_records_stacked
+                    result.n_shared_stacking = len(group) * len(targets)
+                    result.t_optimize = t_optimize
+                    result.t_stack = t_stack
 
-            results.append((isource, itarget, result))
+                results.append((isource, itarget, result))
 
-    tcounters.append(xtime())
+        tcounters.append(xtime())
+        tdiffs = tdiffs + num.diff(tcounters)
 
-    return results, tcounters
+    return results, num.concatenate(([0.0], num.cumsum(tdiffs)))
 
 
 def process_dynamic(work, psources, ptargets, engine, nthreads=0):
-    dsource_cache = {}
+    dsource_cache = None
 
     for w in work:
         _, _, isources, itargets = w
@@ -2611,47 +2960,52 @@ def process_dynamic(work, psources, ptargets, engine, nthreads=0):
         sources = [psources[isource] for isource in isources]
         targets = [ptargets[itarget] for itarget in itargets]
 
+        if not targets:
+            continue
+
         components = set()
         for target in targets:
             rule = engine.get_rule(sources[0], target)
             components.update(rule.required_components(target))
 
+        # all targets of a subrequest share the base seismogram
         for isource, source in zip(isources, sources):
-            for itarget, target in zip(itargets, targets):
-
-                try:
-                    base_seismogram, tcounters = engine.base_seismogram(
-                        source, target, components, dsource_cache, nthreads)
-                except meta.OutOfBounds as e:
-                    e.context = OutOfBoundsContext(
-                        source=sources[0],
-                        target=targets[0],
-                        distance=sources[0].distance_to(targets[0]),
-                        components=components)
-                    raise
-
-                n_records_stacked = 0
-                t_optimize = 0.0
-                t_stack = 0.0
-
-                for _, tr in base_seismogram.items():
-                    n_records_stacked += tr.n_records_stacked
-                    t_optimize += tr.t_optimize
-                    t_stack += tr.t_stack
-
-                try:
-                    result = engine._post_process_dynamic(
-                        base_seismogram, source, target)
+            try:
+                base_seismogram, tcounters = engine.base_seismogram(
+                    source, targets[0], components, dsource_cache, nthreads)
+            except meta.OutOfBounds as e:
+                e.context = OutOfBoundsContext(
+                    source=source,
+                    target=targets[0],
+                    distance=source.distance_to(targets[0]),
+                    components=components)
+                raise
+
+            n_records_stacked = 0
+            t_optimize = 0.0
+            t_stack = 0.0
+
+            for _, tr in base_seismogram.items():
+                n_records_stacked += tr.n_records_stacked
+                t_optimize += tr.t_optimize
+                t_stack += tr.t_stack
+
+            results = []
+            for itarget, result in zip(
+                    itargets,
+                    engine._post_process_dynamic_many(
+                        base_seismogram, source, targets)):
+
+                if not isinstance(result, SeismosizerError):
                     result.n_records_stacked = n_records_stacked
-                    result.n_shared_stacking = len(sources) *\
-                        len(targets)
+                    result.n_shared_stacking = len(targets)
                     result.t_optimize = t_optimize
                     result.t_stack = t_stack
-                except SeismosizerError as e:
-                    result = e
 
-                tcounters.append(xtime())
-                yield (isource, itarget, result), tcounters
+                results.append((isource, itarget, result))
+
+            tcounters.append(xtime())
+            yield results, tcounters
 
 
 def process_static(work, psources, ptargets, engine, nthreads=0):
@@ -2692,6 +3046,8 @@ class LocalEngine(Engine):
         GF_STORE_SUPERDIRS AND GF_STORE_DIRS
     :param use_config: if ``True``, fill :py:attr:`store_superdirs` and
         :py:attr:`store_dirs` with paths set in the user's config file.
+    :param dsource_cache_size: maximum number of discretized sources kept
+        between calls to :py:meth:`process` (default: 1000)
     '''
 
     store_superdirs = List.T(
@@ -2710,6 +3066,7 @@ class LocalEngine(Engine):
     def __init__(self, **kwargs):
         use_env = kwargs.pop('use_env', False)
         use_config = kwargs.pop('use_config', False)
+        dsource_cache_size = kwargs.pop('dsource_cache_size', 1000)
         Engine.__init__(self, **kwargs)
         if use_env:
             env_store_superdirs = os.environ.get('GF_STORE_SUPERDIRS', '')
@@ -2729,6 +3086,7 @@ class LocalEngine(Engine):
         self._id_to_store_dir = {}
         self._open_stores = {}
         self._effective_default_store_id = None
+        self._dsource_cache = DiscretizedSourceCache(dsource_cache_size)
 
     def _check_store_dirs_type(self):
         for sdir in ['store_dirs', 'store_superdirs']:
@@ -2877,10 +3235,35 @@ class LocalEngine(Engine):
                 source.__class__.__name__))
 
     def _cached_discretize_basesource(self, source, store, cache, target):
-        if (source, store) not in cache:
-            cache[source, store] = source.discretize_basesource(store, target)
+        if cache is None:
+            cache = self._dsource_cache
+
+        key = (store.config.id,) + _discretize_key(source, target)
+        dsource = cache.get(key)
+        if dsource is None:
+            dsource = source.discretize_basesource(store, target)
+            cache[key] = dsource
+
+        return dsource
+
+    def dsource_cache_stats(self):
+        '''
+        Get statistics of the cache for discretized sources.
+
+        Discretized sources are kept across calls to :py:meth:`process`.
+
+        :returns: dict with entries ``hits``, ``misses``, ``nentries`` and
+            ``max_entries``
+        '''
+
+        return self._dsource_cache.stats()
 
-        return cache[source, store]
+    def clear_dsource_cache(self):
+        '''
+        Remove all entries from the cache for discretized sources.
+        '''
+
+        self._dsource_cache.clear()
 
     def base_seismogram(self, source, target, components, dsource_cache,
                         nthreads):
@@ -2937,7 +3320,8 @@ class LocalEngine(Engine):
             itsnapshot = 1
         tcounters.append(xtime())
 
-        base_source = source.discretize_basesource(store_, target=target)
+        base_source = self._cached_discretize_basesource(
+            source, store_, None, target)
 
         tcounters.append(xtime())
 
@@ -2967,25 +3351,75 @@ class LocalEngine(Engine):
 
         stf = source.effective_stf_post()
 
-        times, amplitudes = stf.discretize_t(
+        times, amplitudes = stf.discretize_t_cached(
             deltat, source.get_timeshift())
 
-        # repeat end point to prevent boundary effects
-        padded_data = num.empty(data.size + amplitudes.size, dtype=num.float)
-        padded_data[:data.size] = data
-        padded_data[data.size:] = data[-1]
-        data = num.convolve(amplitudes, padded_data)
+        data = convolve_stf(amplitudes, data)
 
         tmin = itmin * deltat + times[0]
 
         tr = meta.SeismosizerTrace(
             codes=target.codes,
-            data=data[:-amplitudes.size],
+            data=data,
             deltat=deltat,
             tmin=tmin)
 
         return target.post_process(self, source, tr)
 
+    def _post_process_dynamic_many(self, base_seismogram, source, targets):
+        '''
+        Post-process a base seismogram for several targets at once.
+
+        Same as :py:meth:`_post_process_dynamic` but the STF convolution is
+        done for all targets in a single batch. Errors are returned in place
+        of the results.
+        '''
+
+        deltat = list(base_seismogram.values())[0].deltat
+        itmin = list(base_seismogram.values())[0].itmin
+
+        results = [None] * len(targets)
+        itargets = []
+        datas = []
+        for itarget, target in enumerate(targets):
+            try:
+                rule = self.get_rule(source, target)
+                data = rule.apply_(target, base_seismogram)
+
+            except SeismosizerError as e:
+                results[itarget] = e
+                continue
+
+            factor = source.get_factor() * target.get_factor()
+            itargets.append(itarget)
+            datas.append(data * factor)
+
+        if not datas:
+            return results
+
+        stf = source.effective_stf_post()
+        times, amplitudes = stf.discretize_t_cached(
+            deltat, source.get_timeshift())
+
+        datas = convolve_stf(amplitudes, num.vstack(datas))
+
+        tmin = itmin * deltat + times[0]
+
+        for itarget, data in zip(itargets, datas):
+            target = targets[itarget]
+            tr = meta.SeismosizerTrace(
+                codes=target.codes,
+                data=data,
+                deltat=deltat,
+                tmin=tmin)
+
+            try:
+                results[itarget] = target.post_process(self, source, tr)
+            except SeismosizerError as e:
+                results[itarget] = e
+
+        return results
+
     def _post_process_statics(self, base_statics, source, starget):
         rule = self.get_rule(source, starget)
         data = rule.apply_(starget, base_statics)
@@ -2997,6 +3431,144 @@ class LocalEngine(Engine):
 
         return starget.post_process(self, source, base_statics)
 
+    def process_array(self, sources, targets, nthreads=0):
+        '''
+        Calculate synthetic seismograms for many sources as a single array.
+
+        Batched alternative to :py:meth:`process` for e.g. grid searches: all
+        GF stacks are computed with a single call to the store's C extension
+        and the post-processing (component rules, scaling and STF
+        convolution) is vectorised. No :py:class:`SeismosizerTrace` or
+        :py:class:`Response` objects are created.
+
+        All targets must use the same GF store, sampling rate, interpolation
+        method and time window, and they must not have a custom
+        ``post_process`` method. All sources must discretize to the same
+        type of point sources.
+
+        :param sources: List of :py:class:`Source` objects
+        :param targets: List of :py:class:`Target` objects
+        :param nthreads: Number of threads to use in the C extension, ``0``
+            means all available
+        :returns: Tuple ``(tmins, deltat, data)``, where ``data`` has shape
+            ``(len(sources), len(targets), nsamples)`` and the seismograms of
+            source ``i`` start at time ``tmins[i]``.
+        '''
+
+        sources = list(sources)
+        targets = list(targets)
+
+        if not sources or not targets:
+            raise BadRequest('no sources or targets given')
+
+        for target in targets:
+            if isinstance(target, StaticTarget) or \
+                    type(target).post_process is not Target.post_process:
+
+                raise BadRequest(
+                    'process_array only supports dynamic targets without '
+                    'custom post-processing')
+
+        target0 = targets[0]
+        if len(set(
+                (target.store_id, target.sample_rate, target.interpolation,
+                 target.tmin, target.tmax) for target in targets)) != 1:
+
+            raise BadRequest(
+                'process_array requires all targets to share store_id, '
+                'sample_rate, interpolation, tmin and tmax')
+
+        store_ = self.get_store(target0.store_id)
+
+        if target0.tmin and target0.tmax is not None:
+            n_f = store_.config.sample_rate
+            itmin = int(num.floor(target0.tmin * n_f))
+            nsamples = int(num.ceil((target0.tmax - target0.tmin) * n_f))
+        else:
+            itmin = None
+            nsamples = None
+
+        if target0.sample_rate is not None:
+            deltat = 1./target0.sample_rate
+        else:
+            deltat = None
+
+        base_sources = [
+            self._cached_discretize_basesource(
+                source, store_, None, target0)
+            for source in sources]
+
+        if len(set(type(base_source) for base_source in base_sources)) != 1:
+            raise BadRequest(
+                'process_array requires all sources to discretize to the '
+                'same type of point sources')
+
+        rules = [self.get_rule(sources[0], target) for target in targets]
+        components = set()
+        for rule, target in zip(rules, targets):
+            components.update(rule.required_components(target))
+
+        receivers = [target.receiver(store_) for target in targets]
+        itmin, base_seismograms = store_.seismograms(
+            base_sources, receivers, components,
+            deltat=deltat,
+            itmin=itmin, nsamples=nsamples,
+            interpolation=target0.interpolation,
+            nthreads=nthreads)
+
+        if deltat is None:
+            deltat = store_.config.deltat
+        else:
+            deltat = store_.config.deltat * int(
+                round(deltat / store_.config.deltat))
+
+        nsources = len(sources)
+        ntargets = len(targets)
+        nsamples = list(base_seismograms.values())[0].shape[-1]
+
+        data = num.empty((nsources, ntargets, nsamples), dtype=num.float)
+        for itarget, (rule, target) in enumerate(zip(rules, targets)):
+            base_seismogram = dict(
+                (comp, store.GFTrace(
+                    data=base_seismograms[comp][:, itarget, :],
+                    itmin=itmin, deltat=deltat))
+                for comp in rule.required_components(target))
+
+            data[:, itarget, :] = rule.apply_(target, base_seismogram)
+
+        data *= num.outer(
+            [source.get_factor() for source in sources],
+            [target.get_factor() for target in targets])[:, :, num.newaxis]
+
+        tmins = num.zeros(nsources)
+        groups = defaultdict(list)
+        for isource, source in enumerate(sources):
+            stf = source.effective_stf_post()
+            times, amplitudes = stf.discretize_t_cached(
+                deltat, source.get_timeshift())
+
+            tmins[isource] = itmin * deltat + times[0]
+            groups[amplitudes.tobytes()].append(isource)
+
+        namplitudes_max = max(
+            len(k) for k in groups.keys()) // num.dtype(num.float).itemsize
+
+        if nsamples == 0:
+            return tmins, deltat, data
+
+        # shorter results are padded with their end values
+        nout = nsamples + namplitudes_max - 1
+        out = num.empty((nsources, ntargets, nout), dtype=num.float)
+        for k, isources in groups.items():
+            amplitudes = num.frombuffer(k, dtype=num.float)
+            isources = num.array(isources)
+            data_conv = convolve_stf(amplitudes, data[isources])
+            nconv = data_conv.shape[-1]
+            out[isources, :, :nconv] = data_conv
+            out[isources, :, nconv:] = data_conv[:, :, -1:]
+
+        return tmins, deltat, out
+
     def process(self, *args, **kwargs):
         '''
         Process a request.
@@ -3010,6 +3582,17 @@ class LocalEngine(Engine):
         The request can be given a a :py:class:`Request` object, or such an
         object is created using ``Request(**kwargs)`` for convenience.
 
+        :param nthreads: Number of threads used in the C extension for GF
+            stacking, ``0`` means all available, defaults to 1
+        :param nworkers: Number of worker processes. If not 1, the
+            subrequests of dynamic targets are partitioned over a pool of
+            worker processes (created with ``fork()``, sharing the already
+            opened and memory-mapped GF stores). Subrequests group sources
+            and targets with common geometry, so that the GF stacking is done
+            only once per group. ``None`` means one worker per CPU, defaults
+            to 1.
+        :param status_callback: Function called as
+            ``status_callback(i, n)`` with progress information.
         :returns: :py:class:`Response` object
         '''
 
@@ -3030,6 +3613,8 @@ class LocalEngine(Engine):
         if nprocs:
             nthreads = nprocs
 
+        nworkers = kwargs.pop('nworkers', 1)
+
         if request is None:
             request = Request(**kwargs)
 
@@ -3040,7 +3625,7 @@ class LocalEngine(Engine):
         # make sure stores are open before fork()
         store_ids = set(target.store_id for target in request.targets)
         for store_id in store_ids:
-            self.get_store(store_id)
+            self.get_store(store_id).open()
 
         source_index = dict((x, i) for (i, x) in
                             enumerate(request.sources))
@@ -3070,18 +3655,42 @@ class LocalEngine(Engine):
                   if not isinstance(target, StaticTarget)])
                 for (i, k) in enumerate(skeys)]
 
-            for ii_results, tcounters_dyn in process_dynamic(
-              work_dynamic, request.sources, request.targets, self,
-              nthreads=nthreads):
+            if nworkers == 1:
+                for ii_results_list, tcounters_dyn in process_dynamic(
+                  work_dynamic, request.sources, request.targets, self,
+                  nthreads=nthreads):
 
-                tcounters_dyn_list.append(num.diff(tcounters_dyn))
-                isource, itarget, result = ii_results
-                results_list[isource][itarget] = result
+                    tcounters_dyn_list.append(num.diff(tcounters_dyn))
+                    for isource, itarget, result in ii_results_list:
+                        results_list[isource][itarget] = result
 
-                if status_callback:
-                    status_callback(isub, nsub)
+                    if status_callback:
+                        status_callback(isub, nsub)
 
-                isub += 1
+                    isub += 1
+
+            else:
+                pshared = dict(
+                    engine=self,
+                    sources=request.sources,
+                    targets=request.targets,
+                    dsource_cache=None,
+                    nthreads=nthreads)
+
+                work_dynamic = [w for w in work_dynamic if w[3]]
+
+                for ii_results_list, tcounters_dyn in parimap(
+                        process_subrequest_dynamic, work_dynamic,
+                        pshared=pshared, nprocs=nworkers):
+
+                    tcounters_dyn_list.append(num.diff(tcounters_dyn))
+                    for isource, itarget, result in ii_results_list:
+                        results_list[isource][itarget] = result
+
+                    if status_callback:
+                        status_callback(isub, nsub)
+
+                    isub += 1
 
         # Processing static targets through process_static
         if request.has_statics:
@@ -3287,6 +3896,12 @@ STFMode
 Request
 ProcessingStats
 Response
+binary_response_mimetype
+dump_binary_start
+dump_binary_results
+dump_binary_end
+iload_response_binary
+load_response_binary
 Engine
 LocalEngine
 RemoteEngine
@@ -0,0 +1,941 @@
+# http://pyrocko.org - GPLv3
+#
+# The Pyrocko Developers, 21st Century
+# ---|P------/S----------~Lg----------
+'''
+Asynchronous HTTP server for Green's function stores and seismosizer requests.
+
+The server runs on an :py:mod:`asyncio` event loop. Store files are streamed
+to the clients with :py:meth:`asyncio.AbstractEventLoop.sendfile`, which uses
+zero-copy ``sendfile()`` where the platform supports it. Seismosizer requests
+are handed to a pool of worker processes, so that a heavy computation does
+not block other clients. For clients accepting the binary response format,
+requests are processed in parts and the response is streamed with chunked
+transfer encoding as the parts complete, so that the memory needed does not
+grow with the size of the response. The number of concurrently processed
+seismosizer requests is limited and per-request latencies are collected in a
+:py:class:`LatencyStats` object, available through ``/gfws/metrics``.
+
+Requires Python 3.7 or later, use it through :py:mod:`pyrocko.gf.server`,
+which falls back to :py:mod:`pyrocko.gf.server_asyncore` on older versions.
+'''
+from __future__ import absolute_import
+
+import asyncio
+import concurrent.futures
+import functools
+import html
+import http.client
+import logging
+import mimetypes
+import multiprocessing
+import os
+import posixpath
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from email.utils import formatdate
+from io import BytesIO
+
+import numpy as num
+
+from pyrocko import gf
+
+logger = logging.getLogger('pyrocko.gf.server')
+
+__version__ = '2.0'
+
+g_engine = None
+
+
+def enc(s):
+    try:
+        return s.encode('utf-8')
+    except Exception:
+        return s
+
+
+def _init_worker(engine):
+    global g_engine
+    g_engine = engine
+
+
+def _process_request(request_str, engine=None):
+    if engine is None:
+        engine = g_engine
+
+    try:
+        request = gf.load(string=request_str)
+        resp = engine.process(request=request)
+    except (gf.BadRequest, gf.StoreError) as e:
+        return 400, str(e)
+
+    return 200, enc(resp.dump())
+
+
+def _process_request_part(
+        request_str, isource_offset, itarget_offset, engine=None):
+
+    if engine is None:
+        engine = g_engine
+
+    try:
+        request = gf.load(string=request_str)
+        resp = engine.process(request=request)
+    except (gf.BadRequest, gf.StoreError) as e:
+        return 400, str(e), None
+
+    f = BytesIO()
+    gf.dump_binary_results(
+        f, resp.results_list, isource_offset, itarget_offset)
+
+    return 200, f.getvalue(), resp.stats.dump()
+
+
+def _merge_stats(stats_list):
+    '''
+    Combine processing statistics of sequentially processed request parts.
+    '''
+
+    merged = gf.ProcessingStats()
+    t_wallclock = sum(stats.t_wallclock for stats in stats_list)
+    for name in merged.T.propnames:
+        values = [getattr(stats, name) for stats in stats_list]
+        if not values:
+            continue
+
+        if name.startswith('t_perc_'):
+            if t_wallclock > 0.0:
+                value = sum(
+                    value * stats.t_wallclock
+                    for (value, stats) in zip(values, stats_list)) \
+                    / t_wallclock
+            else:
+                value = values[-1]
+
+        elif name == 'n_stores':
+            value = max(values)
+
+        else:
+            value = sum(values)
+
+        setattr(merged, name, value)
+
+    return merged
+
+
+class BadHTTPRequest(Exception):
+    pass
+
+
+class StreamAborted(ConnectionError):
+    pass
+
+
+class LatencyStats(object):
+    '''
+    Per-request latency statistics, grouped by kind of request.
+
+    Counts, errors and min/mean/max durations are kept for all requests,
+    percentiles are computed from the most recent ``nrecent`` requests of
+    each kind.
+    '''
+
+    def __init__(self, nrecent=1000):
+        self._nrecent = nrecent
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, kind, status, duration):
+        with self._lock:
+            if kind not in self._stats:
+                self._stats[kind] = dict(
+                    count=0,
+                    errors=0,
+                    total=0.0,
+                    min=None,
+                    max=None,
+                    recent=deque(maxlen=self._nrecent))
+
+            st = self._stats[kind]
+            st['count'] += 1
+            if status >= 400:
+                st['errors'] += 1
+
+            st['total'] += duration
+            st['min'] = duration if st['min'] is None \
+                else min(st['min'], duration)
+            st['max'] = duration if st['max'] is None \
+                else max(st['max'], duration)
+            st['recent'].append(duration)
+
+    def kinds(self):
+        with self._lock:
+            return sorted(self._stats.keys())
+
+    def get(self, kind):
+        '''
+        Get latency summary for a kind of request.
+
+        :returns: dict with keys ``count``, ``errors``, ``mean``, ``min``,
+            ``max``, ``p50``, ``p90`` and ``p99`` (durations in [s])
+        '''
+
+        with self._lock:
+            st = self._stats[kind]
+            recent = num.array(st['recent'], dtype=num.float)
+            p50, p90, p99 = num.percentile(recent, [50., 90., 99.])
+            return dict(
+                count=st['count'],
+                errors=st['errors'],
+                mean=st['total'] / st['count'],
+                min=st['min'],
+                max=st['max'],
+                p50=p50,
+                p90=p90,
+                p99=p99)
+
+    def __str__(self):
+        lines = []
+        for kind in self.kinds():
+            d = self.get(kind)
+            lines.append(
+                '%-10s %8i %6i %10.4f %10.4f %10.4f %10.4f %10.4f %10.4f' % (
+                    kind, d['count'], d['errors'], d['mean'], d['min'],
+                    d['p50'], d['p90'], d['p99'], d['max']))
+
+        header = '%-10s %8s %6s %10s %10s %10s %10s %10s %10s' % (
+            'kind', 'count', 'errors', 'mean', 'min', 'p50', 'p90', 'p99',
+            'max')
+
+        return '\n'.join([header] + lines) + '\n'
+
+
+class Request(object):
+    '''
+    Parsed HTTP request.
+    '''
+
+    def __init__(self, command, path, version, headers, body):
+        self.command = command
+        self.version = version
+        self.headers = headers
+
+        qspos = path.find('?')
+        if qspos >= 0:
+            self.query = urllib.parse.parse_qs(
+                path[qspos+1:], keep_blank_values=True)
+            self.path = path[:qspos]
+        else:
+            self.query = {}
+            self.path = path
+
+        self.body = dict(self.query)
+        ctype = headers.get('content-type', '').split(';')[0].strip()
+        if command == 'POST' and ctype == 'application/x-www-form-urlencoded':
+            self.body.update(urllib.parse.parse_qs(
+                body.decode('utf-8'), keep_blank_values=True))
+
+    @property
+    def keep_alive(self):
+        conn = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return conn == 'keep-alive'
+        else:
+            return conn != 'close'
+
+
+class Response(object):
+    '''
+    HTTP response, with the body given either as bytes, as open file or as
+    asynchronous iterator over chunks of bytes.
+
+    Chunks are sent with chunked transfer encoding as they are produced.
+    '''
+
+    def __init__(self, code, headers=None, data=b'', file=None, size=None,
+                 chunks=None):
+        self.code = code
+        self.headers = headers or []
+        self.data = data
+        self.file = file
+        self.chunks = chunks
+        self.size = size if size is not None else len(data)
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+
+class RequestHandler(object):
+    '''
+    Serves files and directory listings, to be subclassed.
+
+    One handler is created per client connection.
+    '''
+
+    server_version = 'Seismosizer/' + __version__
+    max_header_size = 65536
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.client_address = writer.get_extra_info('peername')
+
+    async def handle_connection(self):
+        try:
+            while True:
+                try:
+                    request = await self.read_request()
+                except BadHTTPRequest as e:
+                    await self.send(self.error_response(400, str(e)), None)
+                    break
+
+                if request is None:
+                    break
+
+                tstart = time.perf_counter()
+                kind = self.request_kind(request)
+                try:
+                    resp = await self.handle_request(request)
+                except Exception as e:
+                    logger.exception(e)
+                    resp = self.error_response(500, 'Internal server error')
+
+                await self.send(resp, request)
+
+                duration = time.perf_counter() - tstart
+                self.server.stats.add(kind, resp.code, duration)
+                self.log_request(request, resp, duration)
+
+                if not request.keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            self.writer.close()
+
+    async def read_request(self):
+        try:
+            head = await self.reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise BadHTTPRequest('Request header too large')
+
+        lines = head.decode('iso-8859-1').split('\r\n')
+        try:
+            command, path, version = lines[0].split()
+        except ValueError:
+            raise BadHTTPRequest('Bad request line: %r' % lines[0])
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                k, _, v = line.partition(':')
+                headers[k.strip().lower()] = v.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise BadHTTPRequest('Bad content length')
+
+        body = await self.reader.readexactly(length) if length else b''
+
+        return Request(command, path, version, headers, body)
+
+    async def send(self, resp, request):
+        chunked = resp.chunks is not None
+        if chunked and (request is None or request.version == 'HTTP/1.0'):
+            # no chunked transfer encoding, collect the complete body
+            resp.data = b''.join([chunk async for chunk in resp.chunks])
+            resp.size = len(resp.data)
+            resp.chunks = None
+            chunked = False
+
+        head = ['HTTP/1.1 %i %s' % (
+            resp.code, http.client.responses.get(resp.code, ''))]
+
+        headers = [
+            ('Server', self.server_version),
+            ('Date', formatdate(usegmt=True))]
+
+        if chunked:
+            headers.append(('Transfer-Encoding', 'chunked'))
+        else:
+            headers.append(('Content-Length', str(resp.size)))
+
+        if request is None or not request.keep_alive:
+            headers.append(('Connection', 'close'))
+
+        for k, v in headers + resp.headers:
+            head.append('%s: %s' % (k, v))
+
+        try:
+            self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode(
+                'iso-8859-1'))
+
+            if request is not None and request.command == 'HEAD':
+                pass
+
+            elif resp.file is not None:
+                await self.writer.drain()
+                await asyncio.get_event_loop().sendfile(
+                    self.writer.transport, resp.file, count=resp.size)
+
+            elif chunked:
+                await self.send_chunks(resp.chunks)
+
+            else:
+                self.writer.write(resp.data)
+
+            await self.writer.drain()
+
+        finally:
+            resp.close()
+
+    async def send_chunks(self, chunks):
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    self.writer.write(b'%x\r\n' % len(chunk))
+                    self.writer.write(chunk)
+                    self.writer.write(b'\r\n')
+                    await self.writer.drain()
+
+        except ConnectionError:
+            raise
+
+        except Exception as e:
+            # the status has already been sent, the client notices the
+            # missing final chunk
+            logger.exception(e)
+            raise StreamAborted('Response aborted')
+
+        self.writer.write(b'0\r\n\r\n')
+
+    def request_kind(self, request):
+        return 'other'
+
+    async def handle_request(self, request):
+        if request.command not in ('GET', 'HEAD', 'POST'):
+            return self.error_response(
+                501, 'Unsupported method (%s)' % request.command)
+
+        return self.send_head(request)
+
+    def error_response(self, code, message):
+        data = enc('Error %i: %s\n' % (code, message))
+        return Response(
+            code,
+            [('Content-Type', 'text/plain; charset=utf-8')],
+            data=data)
+
+    def log_request(self, request, resp, duration):
+        logger.info('%s - - "%s %s %s" %i %i %.4fs "%s"' % (
+            self.client_address[0] if self.client_address else '-',
+            request.command,
+            request.path,
+            request.version,
+            resp.code,
+            resp.size,
+            duration,
+            request.headers.get('user-agent', '')))
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def list_directory(self, request, path):
+        '''
+        Produce a directory listing (absent index.html).
+        '''
+
+        try:
+            list = self.listdir(path)
+        except os.error:
+            return self.error_response(404, 'No permission to list directory')
+
+        list.sort(key=lambda a: a.lower())
+        displaypath = html.escape(urllib.parse.unquote(request.path))
+        r = []
+        r.append('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">')
+        r.append('<html>\n<title>Directory listing for %s</title>\n'
+                 % displaypath)
+        r.append('<body>\n<h2>Directory listing for %s</h2>\n' % displaypath)
+        r.append('<hr>\n<ul>\n')
+        for name in list:
+            fullname = os.path.join(path, name)
+            displayname = linkname = name
+            # Append / for directories or @ for symbolic links
+            if os.path.isdir(fullname):
+                displayname = name + '/'
+                linkname = name + '/'
+            if os.path.islink(fullname):
+                displayname = name + '@'
+                # Note: a link to a directory displays with @ and links with /
+            r.append('<li><a href="%s">%s</a>\n' % (
+                urllib.parse.quote(linkname), html.escape(displayname)))
+        r.append('</ul>\n<hr>\n</body>\n</html>\n')
+
+        encoding = sys.getfilesystemencoding()
+        return Response(
+            200,
+            [('Content-Type', 'text/html; charset=%s' % encoding)],
+            data=''.join(r).encode(encoding, 'surrogateescape'))
+
+    def redirect(self, path):
+        return Response(301, [('Location', path)])
+
+    def guess_type(self, path):
+        return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def translate_path(self, path):
+        raise NotImplementedError
+
+    def send_head(self, request):
+        '''
+        Common code for GET and HEAD commands.
+
+        Returns a :py:class:`Response`, with an open file for regular files,
+        so that the data can be sent without being read into memory.
+        '''
+
+        path = self.translate_path(request.path)
+        if path is None:
+            return self.error_response(404, 'File not found')
+
+        if os.path.isdir(path):
+            if not request.path.endswith('/'):
+                # redirect browser - doing basically what apache does
+                return self.redirect(request.path + '/')
+            else:
+                return self.list_directory(request, path)
+
+        try:
+            # Always read in binary mode. Opening files in text mode may cause
+            # newline translations, making the actual size of the content
+            # transmitted *less* than the content-length!
+            f = open(path, 'rb')
+        except IOError:
+            return self.error_response(404, 'File not found')
+
+        fs = os.fstat(f.fileno())
+        return Response(
+            200,
+            [('Last-Modified', formatdate(fs.st_mtime, usegmt=True)),
+             ('Content-Type', self.guess_type(path)),
+             ('Content-Disposition', 'attachment')],
+            file=f,
+            size=fs.st_size)
+
+
+class SeismosizerHandler(RequestHandler):
+
+    stores_path = '/gfws/static/stores/'
+    process_path = '/gfws/seismosizer/1/query'
+    metrics_path = '/gfws/metrics'
+
+    # maximum number of results per part of a streamed binary response
+    nresults_part = 1000
+
+    def request_kind(self, request):
+        if request.path == self.process_path:
+            return 'process'
+        elif request.path.startswith(self.stores_path):
+            return 'static'
+        elif request.path == self.metrics_path:
+            return 'metrics'
+        else:
+            return 'other'
+
+    async def handle_request(self, request):
+        if request.command not in ('GET', 'HEAD', 'POST'):
+            return self.error_response(
+                501, 'Unsupported method (%s)' % request.command)
+
+        S = self.stores_path
+        P = self.process_path
+
+        if re.match(r'^' + S[:-1] + '$', request.path):
+            return self.redirect(S)
+
+        if re.match(r'^' + S + gf.StringID.pattern[1:-1], request.path):
+            return self.send_head(request)
+
+        elif re.match(r'^' + S + '$', request.path):
+            return self.list_stores(request)
+
+        elif re.match(r'^' + P + '$', request.path):
+            return await self.process(request)
+
+        elif request.path == self.metrics_path:
+            return Response(
+                200,
+                [('Content-Type', 'text/plain; charset=utf-8')],
+                data=enc(str(self.server.stats)))
+
+        else:
+            return self.error_response(404, 'File not found')
+
+    def translate_path(self, path):
+        path = path.split('?', 1)[0]
+        path = path.split('#', 1)[0]
+        path = posixpath.normpath(urllib.parse.unquote(path))
+        words = path.split('/')
+        words = [_f for _f in words if _f]
+
+        path = '/'
+        if words[:3] == self.stores_path.split('/')[1:-1] and len(words) > 3:
+            engine = self.server.engine
+            if words[3] not in engine.get_store_ids():
+                return None
+            else:
+                path = engine.get_store_dir(words[3])
+                words = words[4:]
+        else:
+            return None
+
+        for word in words:
+            drive, word = os.path.splitdrive(word)
+            head, word = os.path.split(word)
+            if word in (os.curdir, os.pardir):
+                continue
+            path = os.path.join(path, word)
+
+        return path
+
+    def list_stores(self, request):
+        '''Create listing of stores.'''
+        from jinja2 import Template
+
+        engine = self.server.engine
+
+        store_ids = list(engine.get_store_ids())
+        store_ids.sort(key=lambda x: x.lower())
+
+        stores = [engine.get_store(store_id) for store_id in store_ids]
+
+        templates = {
+            'html': Template('''
+<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">
+<html>
+<title>{{ title }}</title>
+<body>
+<h2>{{ title }}</h2>
+<hr>
+<table>
+    <tr>
+        <th style="text-align:left">Store ID</th>
+        <th style="text-align:center">Type</th>
+        <th style="text-align:center">Extent</th>
+        <th style="text-align:center">Sample-rate</th>
+        <th style="text-align:center">Size (index + traces)</th>
+    </tr>
+{% for store in stores %}
+    <tr>
+        <td><a href="{{ store.config.id }}/">{{ store.config.id|e }}/</a></td>
+        <td style="text-align:center">{{ store.config.short_type }}</td>
+        <td style="text-align:right">{{ store.config.short_extent }} km</td>
+        <td style="text-align:right">{{ store.config.sample_rate }} Hz</td>
+        <td style="text-align:right">{{ store.size_index_and_data_human }}</td>
+    </tr>
+{% endfor %}
+</table>
+</hr>
+</body>
+</html>
+'''.lstrip()),
+            'text': Template('''
+{% for store in stores %}{#
+#}{{ store.config.id.ljust(25) }} {#
+#}{{ store.config.short_type.center(5) }} {#
+#}{{ store.config.short_extent.rjust(30) }} km {#
+#}{{ "%10.2g"|format(store.config.sample_rate) }} Hz {#
+#}{{ store.size_index_and_data_human.rjust(8) }}
+{% endfor %}'''.lstrip())}
+
+        format = request.body.get('format', ['html'])[0]
+        if format not in ('html', 'text'):
+            format = 'html'
+
+        title = "Green's function stores listing"
+        s = templates[format].render(stores=stores, title=title).encode('utf8')
+        return Response(
+            200,
+            [('Content-Type', 'text/html; charset=utf-8')],
+            data=s)
+
+    async def process(self, request):
+        try:
+            request_str = request.body['request'][0]
+        except KeyError:
+            return self.error_response(400, 'No request given')
+
+        # binary responses only for clients asking for them
+        if gf.binary_response_mimetype in request.headers.get('accept', ''):
+            return await self.process_binary(request_str)
+
+        code, result = await self.server.run_in_worker(
+            _process_request, request_str)
+
+        if code != 200:
+            return self.error_response(code, result)
+
+        return Response(
+            200, [('Content-Type', 'text/html; charset=utf-8')], data=result)
+
+    def split_request(self, request):
+        '''
+        Split seismosizer request into parts of limited number of results.
+
+        :returns: list of tuples ``(isource_offset, itarget_offset, part)``
+        '''
+
+        sources = request.sources
+        targets = request.targets
+        ntargets_part = max(1, min(len(targets), self.nresults_part))
+        nsources_part = max(1, self.nresults_part // ntargets_part)
+
+        parts = []
+        for isource in range(0, len(sources), nsources_part):
+            for itarget in range(0, len(targets), ntargets_part):
+                parts.append((isource, itarget, gf.Request(
+                    sources=sources[isource:isource+nsources_part],
+                    targets=targets[itarget:itarget+ntargets_part])))
+
+        return parts
+
+    async def process_binary(self, request_str):
+        '''
+        Process request part by part and stream the binary response.
+
+        Only the results of the part being sent and of the next one, which
+        is computed in the meantime, are held in memory.
+        '''
+
+        try:
+            request = gf.load(string=request_str)
+        except Exception as e:
+            return self.error_response(400, str(e))
+
+        if not isinstance(request, gf.Request):
+            return self.error_response(400, 'Invalid request')
+
+        def start(part):
+            isource, itarget, subrequest = part
+            return asyncio.ensure_future(self.server.run_in_worker(
+                _process_request_part, subrequest.dump(), isource, itarget))
+
+        parts = self.split_request(request)
+
+        # errors in the first part can still be reported with the status
+        first = None
+        if parts:
+            code, data, stats = await start(parts[0])
+            if code != 200:
+                return self.error_response(code, data)
+
+            first = data, stats
+
+        async def chunks():
+            f = BytesIO()
+            gf.dump_binary_start(f)
+            yield f.getvalue()
+
+            stats_list = []
+            pending = start(parts[1]) if len(parts) > 1 else None
+            try:
+                if first is not None:
+                    data, stats = first
+                    stats_list.append(gf.load(string=stats))
+                    yield data
+
+                for ipart in range(2, len(parts) + 1):
+                    code, data, stats = await pending
+                    pending = start(parts[ipart]) \
+                        if ipart < len(parts) else None
+
+                    if code != 200:
+                        raise gf.BadRequest(data)
+
+                    stats_list.append(gf.load(string=stats))
+                    yield data
+
+            finally:
+                if pending is not None:
+                    pending.cancel()
+
+            f = BytesIO()
+            gf.dump_binary_end(f, _merge_stats(stats_list))
+            yield f.getvalue()
+
+        return Response(
+            200, [('Content-Type', gf.binary_response_mimetype)],
+            chunks=chunks())
+
+    def guess_type(self, path):
+        bn = os.path.basename
+        dn = os.path.dirname
+        if bn(path) == 'config':
+            return 'text/plain'
+
+        if bn(dn(path)) == 'extra':
+            return 'text/plain'
+
+        else:
+            return mimetypes.guess_type(path)[0] or 'application/x-octet'
+
+
+class Server(object):
+    '''
+    Asynchronous GF server.
+
+    :param ip: IP address to serve on, ``''`` for all interfaces
+    :param port: port to serve on
+    :param handler: request handler class, subclass of
+        :py:class:`RequestHandler`
+    :param engine: :py:class:`~pyrocko.gf.seismosizer.LocalEngine` used to
+        serve stores and to process seismosizer requests
+    :param nworkers: number of worker processes for seismosizer requests.
+        ``None`` means one per CPU, ``0`` runs the requests in a single
+        background thread.
+    :param max_requests: maximum number of seismosizer requests processed
+        at the same time, further requests wait until a slot is free. Store
+        downloads and other file requests are not limited.
+
+    Use :py:meth:`run` to serve until :py:meth:`stop` is called, possibly
+    from another thread.
+    '''
+
+    def __init__(self, ip, port, handler, engine, nworkers=None,
+                 max_requests=16):
+
+        if not (isinstance(handler, type)
+                and issubclass(handler, RequestHandler)):
+            raise TypeError(
+                'Server(ip, port, handler, engine, ...): handler must be a '
+                'subclass of RequestHandler, got %r' % (handler,))
+
+        self.ip = ip
+        self.port = port
+        self.engine = engine
+        self.nworkers = nworkers
+        self.max_requests = max_requests
+        self.handler = handler
+        self.stats = LatencyStats()
+        self.ready = threading.Event()
+
+        self.request_slots = None
+        self._loop = None
+        self._server = None
+        self._executor = None
+        self._connections = set()
+
+    def _make_executor(self):
+        if self.nworkers == 0:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        # with fork(), the workers share the engine's already opened stores
+        if 'fork' in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context('fork')
+        else:
+            mp_context = None
+
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.nworkers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(self.engine,))
+
+    async def run_in_worker(self, func, *args):
+        # only the computations are limited, file downloads are not held up
+        # by busy workers
+        async with self.request_slots:
+            if self.nworkers == 0:
+                func = functools.partial(func, engine=self.engine)
+
+            return await self._loop.run_in_executor(
+                self._executor, func, *args)
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            await self.handler(self, reader, writer).handle_connection()
+        except asyncio.CancelledError:
+            # cancelled by close(), the handler has closed the connection
+            pass
+        finally:
+            self._connections.discard(task)
+
+    async def start(self):
+        self._loop = asyncio.get_event_loop()
+        self.request_slots = asyncio.Semaphore(self.max_requests)
+        self._executor = self._make_executor()
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.ip or None, self.port,
+            limit=self.handler.max_header_size, reuse_address=True)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+
+        # keep-alive connections would otherwise stay pending until the
+        # loop is closed
+        tasks = list(self._connections)
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def run(self):
+        '''
+        Serve until :py:meth:`stop` is called.
+        '''
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.start())
+            self.ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self.close())
+        finally:
+            self.ready.clear()
+            loop.close()
+
+    def stop(self):
+        '''
+        Stop the server, can be called from any thread.
+        '''
+
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def run(ip, port, engine, nworkers=None, max_requests=16):
+    s = Server(
+        ip, port, SeismosizerHandler, engine,
+        nworkers=nworkers, max_requests=max_requests)
+    try:
+        s.run()
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = [
+    'LatencyStats', 'RequestHandler', 'SeismosizerHandler', 'Server', 'run']
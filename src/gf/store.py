@@ -15,6 +15,7 @@ import fcntl
 import copy
 import logging
 import re
+import zlib
 
 import numpy as num
 from scipy import signal
@@ -22,6 +23,7 @@ from scipy import signal
 from . import meta
 from . import store_ext
 from pyrocko import util, spit
+from pyrocko.parimap import parimap
 
 logger = logging.getLogger('pyrocko.gf.store')
 
@@ -49,6 +51,36 @@ gf_record_dtype = num.dtype([
     ('end_value', E + 'f4'),
 ])
 
+gf_traces_header_size = 32
+
+# compressed stores are marked in the header of the traces file, see
+# store_ext.c for a description of the format
+gf_compression_magic = b'PGFZ'
+gf_compression_version = 1
+gf_compression_block_size = 256
+gf_compression_record_header_fmt = E + 'II'
+gf_compression_record_header_size = struct.calcsize(
+    gf_compression_record_header_fmt)
+
+CODEC_FLOAT32, CODEC_FLOAT16, CODEC_INT16 = 1, 2, 3
+
+gf_compressions = {
+    'deflate': (CODEC_FLOAT32, True),
+    'float16': (CODEC_FLOAT16, False),
+    'float16-deflate': (CODEC_FLOAT16, True),
+    'int16': (CODEC_INT16, False),
+    'int16-deflate': (CODEC_INT16, True),
+}
+
+gf_codec_dtypes = {
+    CODEC_FLOAT32: num.dtype(E + 'f4'),
+    CODEC_FLOAT16: num.dtype(E + 'f2'),
+    CODEC_INT16: num.dtype(E + 'i2'),
+}
+
+# max number of source element/target pairs processed at once in statics()
+statics_max_pairs = 2**19
+
 
 def valid_string_id(s):
     return re.match(meta.StringID.pattern, s)
@@ -274,6 +306,197 @@ def get_extra_path(store_dir, key):
     return os.path.join(store_dir, 'extra', key)
 
 
+def make_traces_header(compression=None):
+    '''
+    Get header of the traces file for given compression method.
+    '''
+
+    header = bytearray(gf_traces_header_size)
+    if compression is not None:
+        if compression not in gf_compressions:
+            raise StoreError(
+                'unsupported compression: %s (available: %s)' % (
+                    compression, ', '.join(sorted(gf_compressions.keys()))))
+
+        codec, deflate = gf_compressions[compression]
+        header[:4] = gf_compression_magic
+        header[4] = gf_compression_version
+        header[5] = codec
+        header[6] = int(deflate)
+
+    return bytes(header)
+
+
+def get_traces_compression(header):
+    '''
+    Get compression method from header of the traces file.
+
+    :returns: name of the compression method or ``None`` for uncompressed
+        stores
+    '''
+
+    if len(header) < gf_traces_header_size \
+            or header[:4] != gf_compression_magic:
+        return None
+
+    version, codec, deflate = bytearray(header[4:7])
+    for compression, (codec_, deflate_) in gf_compressions.items():
+        if version == gf_compression_version \
+                and (codec, bool(deflate)) == (codec_, deflate_):
+            return compression
+
+    raise StoreError('unsupported compressed store format')
+
+
+def encode_record(data, codec, deflate):
+    '''
+    Encode trace samples for storage in a compressed GF store.
+
+    The lossy codecs scale the samples in blocks of
+    ``gf_compression_block_size`` samples by the maximum absolute value of the
+    block, so that the error is bounded relative to the local amplitude. With
+    ``deflate``, the bytes of the samples are shuffled, so that zlib sees the
+    more compressible high bytes grouped together.
+    '''
+
+    data = num.asarray(data, dtype=gf_dtype)
+    n = data.size
+    bs = gf_compression_block_size
+    if codec == CODEC_FLOAT32:
+        scales = num.empty(0, dtype=gf_dtype)
+        values = data
+    else:
+        nblocks = (n + bs - 1) // bs
+        padded = num.zeros(nblocks * bs, dtype=gf_dtype)
+        padded[:n] = data
+        scales = num.abs(padded).reshape(nblocks, bs).max(axis=1)
+        if codec == CODEC_INT16:
+            scales /= num.float32(32767.)
+
+        scales_safe = num.where(scales > 0., scales, num.float32(1.))
+        values = data / num.repeat(scales_safe, bs)[:n]
+        if codec == CODEC_INT16:
+            values = num.clip(num.round(values), -32767., 32767.)
+
+    dtype = gf_codec_dtypes[codec]
+    values = values.astype(dtype)
+    if deflate:
+        values_raw = values.view(num.uint8).reshape(n, dtype.itemsize) \
+            .T.tobytes()
+    else:
+        values_raw = values.tobytes()
+
+    raw = scales.astype(E + 'f4').tobytes() + values_raw
+    stored = zlib.compress(raw) if deflate else raw
+    return struct.pack(
+        gf_compression_record_header_fmt, len(stored), len(raw)) + stored
+
+
+def decode_record(raw, nsamples, codec, deflate):
+    '''
+    Decode trace samples from a (decompressed) record of a compressed store.
+
+    Inverse of :py:func:`encode_record`, after inflating. The computation is
+    done in single precision, so that the result is identical to the one of
+    the C implementation.
+    '''
+
+    n = nsamples
+    bs = gf_compression_block_size
+    dtype = gf_codec_dtypes[codec]
+    nscales = 0 if codec == CODEC_FLOAT32 else (n + bs - 1) // bs
+    if len(raw) != nscales * 4 + n * dtype.itemsize:
+        raise StoreError('bad record in compressed store')
+
+    scales = num.frombuffer(raw, dtype=E + 'f4', count=nscales)
+    if deflate:
+        values = num.frombuffer(
+            raw, dtype=num.uint8, offset=nscales * 4).reshape(
+                dtype.itemsize, n).T.copy().view(dtype).ravel()
+    else:
+        values = num.frombuffer(raw, dtype=dtype, count=n, offset=nscales * 4)
+
+    data = values.astype(gf_dtype)
+    if nscales:
+        data *= num.repeat(scales.astype(gf_dtype), bs)[:n]
+
+    return data
+
+
+def _decimate_record(get_data, itmin_data, nsamples_data, begin_value,
+                     end_value, itmin, itmax, deltat, decimate):
+    '''
+    Decimate part of a GF record.
+
+    ``get_data(ilo, ihi)`` must return the samples ``ilo:ihi`` of the record,
+    which has ``nsamples_data`` samples starting at ``itmin_data``. The
+    decimated trace covers the sample range ``itmin`` to ``itmax``.
+    '''
+
+    itmax_data = itmin_data + nsamples_data - 1
+
+    # put begin and end to multiples of new sampling rate
+    itmin_ext = (max(itmin, itmin_data)//decimate) * decimate
+    itmax_ext = -((-min(itmax, itmax_data))//decimate) * decimate
+    nsamples_ext = itmax_ext - itmin_ext + 1
+
+    # add some padding for the aa filter
+    order = 30
+    itmin_ext_pad = itmin_ext - order//2
+    itmax_ext_pad = itmax_ext + order//2
+    nsamples_ext_pad = itmax_ext_pad - itmin_ext_pad + 1
+
+    itmin_overlap = max(itmin_data, itmin_ext_pad)
+    itmax_overlap = min(itmax_data, itmax_ext_pad)
+
+    ilo = itmin_overlap - itmin_ext_pad
+    ihi = max(ilo, itmax_overlap - itmin_ext_pad + 1)
+    ilo_data = itmin_overlap - itmin_data
+    ihi_data = max(ilo_data, itmax_overlap - itmin_data + 1)
+
+    data_ext_pad = num.empty(nsamples_ext_pad, dtype=gf_dtype)
+    data_ext_pad[ilo:ihi] = get_data(ilo_data, ihi_data)
+
+    data_ext_pad[:ilo] = begin_value
+    data_ext_pad[ihi:] = end_value
+
+    b = signal.firwin(order + 1, 1. / decimate, window='hamming')
+    a = 1.
+    data_filt_pad = signal.lfilter(b, a, data_ext_pad)
+    data_deci = data_filt_pad[order:order+nsamples_ext:decimate]
+    if data_deci.size >= 1:
+        if itmin_ext <= itmin_data:
+            data_deci[0] = begin_value
+
+        if itmax_ext >= itmax_data:
+            data_deci[-1] = end_value
+
+    return GFTrace(data_deci, itmin_ext//decimate,
+                   deltat*decimate,
+                   begin_value=begin_value, end_value=end_value)
+
+
+def _decimate_gftrace(tr, decimate):
+    '''
+    Decimate a complete GF trace, e.g. an already decimated one.
+    '''
+
+    if tr is None:
+        return None
+
+    if tr.is_zero:
+        return GFTrace(is_zero=True, itmin=tr.itmin//decimate)
+
+    nsamples = tr.data.size
+
+    def get_data(ilo, ihi):
+        return tr.data[ilo:ihi]
+
+    return _decimate_record(
+        get_data, tr.itmin, nsamples, tr.begin_value, tr.end_value,
+        tr.itmin, tr.itmin + nsamples - 1, tr.deltat, decimate)
+
+
 class BaseStore(object):
 
     @staticmethod
@@ -285,7 +508,9 @@ class BaseStore(object):
         return os.path.join(store_dir, 'traces')
 
     @staticmethod
-    def create(store_dir, deltat, nrecords, force=False):
+    def create(store_dir, deltat, nrecords, force=False, compression=None):
+
+        header = make_traces_header(compression)
 
         try:
             util.ensuredir(store_dir)
@@ -304,7 +529,7 @@ class BaseStore(object):
             records.tofile(f)
 
         with open(data_fn, 'wb') as f:
-            f.write(b'\0' * 32)
+            f.write(header)
 
     def __init__(self, store_dir, mode='r', use_memmap=True):
         assert mode in 'rw'
@@ -315,7 +540,9 @@ class BaseStore(object):
         self._deltat = None
         self._f_index = None
         self._f_data = None
+        self._data = None
         self._end_values = None
+        self._compression = None
         self.cstore = None
 
     def open(self):
@@ -358,7 +585,11 @@ class BaseStore(object):
         self._nrecords = nrecords
         self._deltat = deltat
 
+        self._compression = get_traces_compression(
+            self._f_data.read(gf_traces_header_size))
+
         self._load_index()
+        self._load_data()
 
     def __del__(self):
         if self.mode != '':
@@ -402,6 +633,43 @@ class BaseStore(object):
         return self._sum(irecords, delays, weights, itmin, nsamples, decimate,
                          implementation, optimization)
 
+    def sum_many(self, irecords, delays, weights, offsets, itmin=None,
+                 nsamples=None, nthreads=0):
+        '''
+        Compute several weight-and-delay sums of GF traces in one go.
+
+        The summands of stack ``i`` are given by the slice
+        ``offsets[i]:offsets[i+1]`` of ``irecords``, ``delays`` and
+        ``weights``. All stacks share a common time window.
+
+        :param offsets: Start indices of the stacks, with the total number of
+            summands appended, i.e. ``len(offsets) == nstacks + 1``
+        :param itmin: Start time index (start time is ``itmin * dt``),
+            defaults to start of the earliest stack
+        :param nsamples: Number of samples, defaults to span up to the end of
+            the latest stack
+        :param nthreads: Number of threads to use, ``0`` means all available
+        :returns: Tuple ``(itmin, data)`` with ``data`` of shape
+            ``(nstacks, nsamples)``
+        '''
+        return self._sum_many(irecords, delays, weights, offsets, itmin,
+                              nsamples, nthreads)
+
+    def get_stack(self, irecords, itmin=None, nsamples=None):
+        '''
+        Retrieve several GF traces as rows of a single array.
+
+        :param irecords: Low-level record indices
+        :param itmin: Start time index (start time is ``itmin * dt``),
+            defaults to start of earliest trace
+        :param nsamples: Number of samples, defaults to span up to the end of
+            latest trace
+        :returns: Tuple ``(itmin, data)`` with ``data`` of shape
+            ``(len(irecords), nsamples)``. Traces are padded with their begin
+            and end values.
+        '''
+        return self._get_stack(irecords, itmin, nsamples)
+
     def sum_statics(self, irecords, delays, weights, it, ntargets, nthreads=0):
         return self._sum_statics(irecords, delays, weights, it, ntargets,
                                  nthreads)
@@ -419,6 +687,7 @@ class BaseStore(object):
                 self.open()
             self._save_index()
 
+        self._data = None
         if self._f_data:
             self._f_data.close()
             self._f_data = None
@@ -490,54 +759,96 @@ class BaseStore(object):
         if decimate == 1:
             ilo = max(itmin, itmin_data) - itmin_data
             ihi = min(itmin+nsamples, itmin_data+nsamples_data) - itmin_data
-            data = self._get_data(ipos, begin_value, end_value, ilo, ihi)
+            data = self._get_data(
+                ipos, nsamples_data, begin_value, end_value, ilo, ihi)
 
             return GFTrace(data, itmin=itmin_data+ilo, deltat=self._deltat,
                            begin_value=begin_value, end_value=end_value)
 
         else:
-            itmax_data = itmin_data + nsamples_data - 1
+            def get_data(ilo, ihi):
+                return self._get_data(
+                    ipos, nsamples_data, begin_value, end_value, ilo, ihi)
 
-            # put begin and end to multiples of new sampling rate
-            itmin_ext = (max(itmin, itmin_data)//decimate) * decimate
-            itmax_ext = -((-min(itmax, itmax_data))//decimate) * decimate
-            nsamples_ext = itmax_ext - itmin_ext + 1
-
-            # add some padding for the aa filter
-            order = 30
-            itmin_ext_pad = itmin_ext - order//2
-            itmax_ext_pad = itmax_ext + order//2
-            nsamples_ext_pad = itmax_ext_pad - itmin_ext_pad + 1
-
-            itmin_overlap = max(itmin_data, itmin_ext_pad)
-            itmax_overlap = min(itmax_data, itmax_ext_pad)
-
-            ilo = itmin_overlap - itmin_ext_pad
-            ihi = max(ilo, itmax_overlap - itmin_ext_pad + 1)
-            ilo_data = itmin_overlap - itmin_data
-            ihi_data = max(ilo_data, itmax_overlap - itmin_data + 1)
-
-            data_ext_pad = num.empty(nsamples_ext_pad, dtype=gf_dtype)
-            data_ext_pad[ilo:ihi] = self._get_data(
-                ipos, begin_value, end_value, ilo_data, ihi_data)
-
-            data_ext_pad[:ilo] = begin_value
-            data_ext_pad[ihi:] = end_value
-
-            b = signal.firwin(order + 1, 1. / decimate, window='hamming')
-            a = 1.
-            data_filt_pad = signal.lfilter(b, a, data_ext_pad)
-            data_deci = data_filt_pad[order:order+nsamples_ext:decimate]
-            if data_deci.size >= 1:
-                if itmin_ext <= itmin_data:
-                    data_deci[0] = begin_value
-
-                if itmax_ext >= itmax_data:
-                    data_deci[-1] = end_value
-
-            return GFTrace(data_deci, itmin_ext//decimate,
-                           self._deltat*decimate,
-                           begin_value=begin_value, end_value=end_value)
+            return _decimate_record(
+                get_data, itmin_data, nsamples_data, begin_value, end_value,
+                itmin, itmax, self._deltat, decimate)
+
+    def _get_stack(self, irecords, itmin, nsamples):
+        if not self._f_index:
+            self.open()
+
+        if not self.mode == 'r':
+            raise StoreError('store not open in read mode')
+
+        irecords = num.asarray(irecords, dtype=num.int64)
+        if irecords.size and not (
+                0 <= irecords.min() and irecords.max() < self._nrecords):
+            raise StoreError('invalid record number requested')
+
+        records = self._records[irecords]
+        ipos = records['data_offset'].astype(num.int64)
+        itmin_data = records['itmin'].astype(num.int64)
+        nsamples_data = records['nsamples'].astype(num.int64)
+
+        if num.any(ipos == 0):
+            raise StoreError(
+                'missing record requested (irecord = %i)' %
+                irecords[ipos == 0][0])
+
+        nonzero = ipos != 1
+        if itmin is None:
+            if num.any(nonzero):
+                itmin = int(num.min(itmin_data[nonzero]))
+            else:
+                itmin = 0
+
+        if nsamples is None:
+            if num.any(nonzero):
+                nsamples = int(num.max(
+                    (itmin_data + nsamples_data)[nonzero])) - itmin
+            else:
+                nsamples = 0
+
+        nsamples = max(0, nsamples)
+
+        it = num.arange(itmin, itmin+nsamples, dtype=num.int64)
+        isample = num.clip(
+            it[num.newaxis, :] - itmin_data[:, num.newaxis],
+            0, num.maximum(nsamples_data - 1, 0)[:, num.newaxis])
+
+        out = num.zeros((irecords.size, nsamples), dtype=gf_dtype)
+
+        short = ipos == 2
+        if num.any(short):
+            out[short] = num.where(
+                isample[short] == 0,
+                records['begin_value'][short, num.newaxis],
+                records['end_value'][short, num.newaxis])
+
+        full = ipos > 2
+        if num.any(full):
+            if self._data is not None and not num.any(
+                    ipos[full] % gf_dtype_nbytes_per_sample):
+
+                ifirst = ipos[full] // gf_dtype_nbytes_per_sample
+                iall = ifirst[:, num.newaxis] + isample[full]
+                if iall.size and iall.max() >= self._data.size:
+                    raise ShortRead()
+
+                out[full] = self._data[iall]
+
+            else:
+                for irow in num.where(full)[0]:
+                    rec = records[irow]
+                    data = self._get_data(
+                        int(ipos[irow]), int(nsamples_data[irow]),
+                        rec['begin_value'], rec['end_value'], 0,
+                        int(nsamples_data[irow]))
+
+                    out[irow] = data[isample[irow]]
+
+        return itmin, out
 
     def _get_span(self, irecord, decimate=1):
         '''
@@ -588,7 +899,11 @@ class BaseStore(object):
         if ndata > 2:
             self._f_data.seek(0, 2)
             ipos = self._f_data.tell()
-            trace.data.astype(gf_dtype_store).tofile(self._f_data)
+            if self._compression is None:
+                trace.data.astype(gf_dtype_store).tofile(self._f_data)
+            else:
+                self._f_data.write(encode_record(
+                    trace.data, *gf_compressions[self._compression]))
         else:
             ipos = 2
 
@@ -876,6 +1191,40 @@ class BaseStore(object):
 
         return tr
 
+    def _sum_many(self, irecords, delays, weights, offsets, itmin,
+                  nsamples, nthreads):
+
+        if not self._f_index:
+            self.open()
+
+        delays = num.asarray(delays)
+        if delays.size != 0:
+            itoffset = int(num.floor(num.min(delays)/self._deltat))
+        else:
+            itoffset = 0
+
+        if nsamples is None:
+            nsamples = -1
+
+        if itmin is None:
+            itmin = 0
+        else:
+            itmin -= itoffset
+
+        try:
+            data, itmin = store_ext.store_sum_many(
+                self.cstore,
+                num.asarray(irecords, dtype=num.uint64),
+                (delays - itoffset*self._deltat).astype(num.float32),
+                num.asarray(weights, dtype=num.float32),
+                num.asarray(offsets, dtype=num.uint64),
+                int(itmin), int(nsamples), int(nthreads))
+
+        except store_ext.StoreExtError as e:
+            raise StoreError(str(e) + ' in store %s' % self.store_dir)
+
+        return itmin + itoffset, data
+
     def _sum_static_python(self, irecords, weights, implementation,
                            optimization):
 
@@ -927,6 +1276,20 @@ class BaseStore(object):
 
         self._end_values = self._records['end_value']
 
+    def _load_data(self):
+        self._data = None
+        if not self._use_memmap or self.mode != 'r' \
+                or self._compression is not None:
+            return
+
+        nbytes = os.fstat(self._f_data.fileno()).st_size
+        n = nbytes // gf_dtype_nbytes_per_sample
+        if n == 0:
+            return
+
+        self._data = num.memmap(
+            self._f_data, dtype=gf_dtype_store, mode='r', shape=(n,))
+
     def _save_index(self):
         self._f_index.seek(0)
         self._f_index.write(struct.pack(gf_store_header_fmt, self._nrecords,
@@ -939,13 +1302,31 @@ class BaseStore(object):
             self._records.tofile(self._f_index)
             self._f_index.flush()
 
-    def _get_data(self, ipos, begin_value, end_value, ilo, ihi):
+    def _get_data(self, ipos, nsamples, begin_value, end_value, ilo, ihi):
         if ihi - ilo > 0:
             if ipos == 2:
                 data_orig = num.empty(2, dtype=gf_dtype)
                 data_orig[0] = begin_value
                 data_orig[1] = end_value
                 return data_orig[ilo:ihi]
+            elif self._compression is not None:
+                data_orig = self._get_data_compressed(ipos, nsamples)
+                data_orig[0] = begin_value
+                data_orig[-1] = end_value
+                return data_orig[ilo:ihi]
+            elif self._data is not None \
+                    and ipos % gf_dtype_nbytes_per_sample == 0:
+
+                # zero-copy, if store byte order matches native byte order
+                ifirst = int(ipos) // gf_dtype_nbytes_per_sample
+                arr = num.asarray(
+                    self._data[ifirst+int(ilo):ifirst+int(ihi)]).astype(
+                        gf_dtype, copy=False)
+
+                if arr.size != ihi-ilo:
+                    raise ShortRead()
+                return arr
+
             else:
                 self._f_data.seek(
                     int(ipos + ilo*gf_dtype_nbytes_per_sample))
@@ -958,6 +1339,31 @@ class BaseStore(object):
         else:
             return num.empty((0,), dtype=gf_dtype)
 
+    def _get_data_compressed(self, ipos, nsamples):
+        self._f_data.seek(int(ipos))
+        head = self._f_data.read(gf_compression_record_header_size)
+        if len(head) != gf_compression_record_header_size:
+            raise ShortRead()
+
+        nstored, nraw = struct.unpack(gf_compression_record_header_fmt, head)
+        stored = self._f_data.read(nstored)
+        if len(stored) != nstored:
+            raise ShortRead()
+
+        codec, deflate = gf_compressions[self._compression]
+        if deflate:
+            try:
+                raw = zlib.decompress(stored)
+            except zlib.error as e:
+                raise StoreError('cannot decompress record: %s' % e)
+        else:
+            raw = stored
+
+        if len(raw) != nraw:
+            raise StoreError('bad record in compressed store')
+
+        return decode_record(raw, int(nsamples), codec, deflate)
+
     def index_fn(self):
         return BaseStore.index_fn_(self.store_dir)
 
@@ -971,6 +1377,17 @@ class BaseStore(object):
         return num.histogram(self._records['data_offset'],
                              bins=[0, 1, 2, 3, num.uint64(-1)])[0]
 
+    @property
+    def compression(self):
+        '''
+        Name of the compression method or ``None`` for uncompressed stores.
+        '''
+
+        if not self._f_index:
+            self.open()
+
+        return self._compression
+
     @property
     def size_index(self):
         return os.stat(self.index_fn()).st_size
@@ -998,11 +1415,13 @@ class BaseStore(object):
             zero=counter[1],
             size_data=self.size_data,
             size_index=self.size_index,
+            compression=self.compression,
         )
 
         return stats
 
-    stats_keys = 'total inserted empty short zero size_data size_index'.split()
+    stats_keys = 'total inserted empty short zero size_data size_index ' \
+        'compression'.split()
 
 
 def remake_dir(dpath, force):
@@ -1068,7 +1487,7 @@ class Store(BaseStore):
     '''
 
     @staticmethod
-    def create(store_dir, config, force=False, extra=None):
+    def create(store_dir, config, force=False, extra=None, compression=None):
         '''
         Create new GF store.
 
@@ -1090,10 +1509,15 @@ class Store(BaseStore):
         :type force: bool, optional
         :param extra: Extra information, defaults to None
         :type extra: dict, optional
+        :param compression: Compression method for the traces, one of
+            ``'deflate'`` (lossless), ``'float16'``, ``'float16-deflate'``,
+            ``'int16'``, ``'int16-deflate'``, defaults to None (uncompressed)
+        :type compression: str, optional
         '''
 
         Store.create_editables(store_dir, config, force=force, extra=extra)
-        Store.create_dependants(store_dir, force=force)
+        Store.create_dependants(store_dir, force=force,
+                                compression=compression)
 
     @staticmethod
     def create_editables(store_dir, config, force=False, extra=None):
@@ -1125,12 +1549,12 @@ class Store(BaseStore):
         return fns
 
     @staticmethod
-    def create_dependants(store_dir, force=False):
+    def create_dependants(store_dir, force=False, compression=None):
         config_fn = os.path.join(store_dir, 'config')
         config = meta.load(filename=config_fn)
 
         BaseStore.create(store_dir, config.deltat, config.nrecords,
-                         force=force)
+                         force=force, compression=compression)
 
         for sub_dir in ['decimated']:
             dpath = os.path.join(store_dir, sub_dir)
@@ -1264,10 +1688,10 @@ class Store(BaseStore):
         :rtype: :py:class:`pyrocko.gf.store.GFTrace`
         '''
 
-        store, decimate = self._decimated_store(decimate)
+        store, decimate_ = self._decimated_store(decimate)
         if interpolation == 'nearest_neighbor':
             irecord = store.config.irecord(*args)
-            tr = store._get(irecord, itmin, nsamples, decimate,
+            tr = store._get(irecord, itmin, nsamples, decimate_,
                             implementation)
 
         elif interpolation == 'off':
@@ -1275,12 +1699,13 @@ class Store(BaseStore):
             if len(irecords) != 1:
                 raise NotAllowedToInterpolate()
             else:
-                tr = store._get(irecords[0], itmin, nsamples, decimate,
+                tr = store._get(irecords[0], itmin, nsamples, decimate_,
                                 implementation)
 
         elif interpolation == 'multilinear':
+            irecords, weights = store.config.vicinity(*args)
             tr = store._sum(irecords, num.zeros(len(irecords)), weights,
-                            itmin, nsamples, decimate, implementation,
+                            itmin, nsamples, decimate_, implementation,
                             'disable')
 
         # to prevent problems with rounding errors (BaseStore saves deltat
@@ -1353,6 +1778,41 @@ class Store(BaseStore):
         tr.deltat = self.config.deltat * decimate
         return tr
 
+    def get_stack(self, args, itmin=None, nsamples=None, decimate=1):
+        '''
+        Retrieve several GF traces as rows of a single array.
+
+        ``args`` is a tuple of arrays forming the (high-level) indices of the
+        GF traces to be retrieved. The data is gathered from the
+        memory-mapped traces file, without seeking to each record.
+
+        :param args: :py:class:`pyrocko.gf.meta.Config` index tuple, e.g.
+            ``(source_depth, distance, component)`` as in
+            :py:class:`pyrocko.gf.meta.ConfigTypeA`, with arrays as elements.
+        :type args: tuple
+        :param itmin: Start time index (start time is ``itmin * dt``),
+            defaults to start of earliest trace
+        :type itmin: integer, optional
+        :param nsamples: Number of samples, defaults to span up to the end of
+            latest trace
+        :type nsamples: integer, optional
+        :param decimate: Decimation factor, defaults to 1. Only decimated
+            stores are used, no decimation on the fly is done.
+        :type decimate: integer, optional
+        :returns: Tuple ``(itmin, data)`` with ``data`` of shape
+            ``(ntraces, nsamples)``, traces padded with their begin and end
+            values.
+        '''
+
+        store, decimate_ = self._decimated_store(decimate)
+        if decimate_ != 1:
+            raise StoreError(
+                'no decimated store available for decimation factor %i' %
+                decimate)
+
+        irecords = store.config.irecords(*args)
+        return store._get_stack(irecords, itmin, nsamples)
+
     def make_decimated(self, decimate, config=None, force=False,
                        show_progress=False):
         '''
@@ -1368,7 +1828,8 @@ class Store(BaseStore):
         subdirectory within the GF store directory. Holding available decimated
         versions of the GF store can save computation time, IO bandwidth, or
         decrease memory footprint at the cost of increased disk space usage,
-        when computation are done for lower frequency signals.
+        when computation are done for lower frequency signals. Decimated
+        sub-stores use the same compression method as the GF store.
 
         :param decimate: Decimate factor
         :type decimate: integer
@@ -1405,14 +1866,18 @@ class Store(BaseStore):
                 raise CannotCreate('store already exists at %s' % store_dir)
 
         store_dir_incomplete = store_dir + '-incomplete'
-        Store.create(store_dir_incomplete, config, force=force)
+        Store.create(store_dir_incomplete, config, force=force,
+                     compression=self.compression)
 
         decimated = Store(store_dir_incomplete, 'w')
         if show_progress:
             pbar = util.progressbar('decimating store', self.config.nrecords)
 
         for i, args in enumerate(decimated.config.iter_nodes()):
-            tr = self.get(args, decimate=decimate)
+            # always decimate from the full resolution traces
+            irecord = self.config.irecord(*args)
+            tr = self._get(irecord, None, None, decimate, 'reference')
+            tr.deltat = self.config.deltat * decimate
             decimated.put(args, tr)
 
             if show_progress:
@@ -1427,6 +1892,107 @@ class Store(BaseStore):
 
         self._decimated[decimate] = None
 
+    def make_decimated_pyramid(self, decimates=(2, 4, 8), force=False,
+                               show_progress=False):
+        '''
+        Create several decimated versions of GF store in one pass.
+
+        Like :py:meth:`make_decimated`, with the index mapping of the original
+        store, but all decimated sub-stores are filled during a single
+        iteration over the records of the original store. Each record is read
+        once and the decimation is cascaded, e.g. the store decimated by 4 is
+        derived from the one decimated by 2. Targets with a
+        lower sample rate are then automatically routed to the coarsest
+        sub-store which meets their Nyquist frequency (see
+        :py:meth:`seismogram`).
+
+        :param decimates: Decimation factors, defaults to ``(2, 4, 8)``
+        :type decimates: tuple of integers, optional
+        :param force: Force overwrite, defaults to False
+        :type force: bool, optional
+        :param show_progress: Show progress, defaults to False
+        :type show_progress: bool, optional
+        '''
+
+        if not self._f_index:
+            self.open()
+
+        decimates = sorted(set(decimates))
+        for decimate in decimates:
+            if not (2 <= decimate <= 8):
+                raise StoreError(
+                    'decimate argument must be in the range [2,8]')
+
+        assert self.mode == 'r'
+
+        for decimate in decimates:
+            store_dir = self._decimated_store_dir(decimate)
+            if os.path.exists(store_dir) and not force:
+                raise CannotCreate('store already exists at %s' % store_dir)
+
+        decimated = []
+        for decimate in decimates:
+            if decimate in self._decimated:
+                del self._decimated[decimate]
+
+            store_dir = self._decimated_store_dir(decimate)
+            if os.path.exists(store_dir):
+                shutil.rmtree(store_dir)
+
+            config = copy.deepcopy(self.config)
+            config.sample_rate = self.config.sample_rate / decimate
+
+            store_dir_incomplete = store_dir + '-incomplete'
+            Store.create(store_dir_incomplete, config, force=force,
+                         compression=self.compression)
+            decimated.append(Store(store_dir_incomplete, 'w'))
+
+        if show_progress:
+            pbar = util.progressbar(
+                'decimating store (%s)' % ', '.join(
+                    '%i' % decimate for decimate in decimates),
+                self.config.nrecords)
+
+        # each level is decimated from the coarsest finer level whose
+        # factor divides its own, e.g. 1 -> 2 -> 4 -> 8
+        sources = []
+        for idecimate, decimate in enumerate(decimates):
+            isource = None
+            for jdecimate in range(idecimate):
+                if decimate % decimates[jdecimate] == 0:
+                    isource = jdecimate
+
+            sources.append(isource)
+
+        for i, args in enumerate(self.config.iter_nodes()):
+            irecord = self.config.irecord(*args)
+            tr_full = self._get(irecord, None, None, 1, 'reference')
+            trs = []
+            for decimate, isource, store in zip(decimates, sources, decimated):
+                if isource is None:
+                    tr = _decimate_gftrace(tr_full, decimate)
+                else:
+                    tr = _decimate_gftrace(
+                        trs[isource], decimate // decimates[isource])
+
+                if tr is not None:
+                    tr.deltat = self.config.deltat * decimate
+
+                store._put(irecord, tr)
+                trs.append(tr)
+
+            if show_progress:
+                pbar.update(i+1)
+
+        if show_progress:
+            pbar.finish()
+
+        for decimate, store in zip(decimates, decimated):
+            store.close()
+            store_dir = self._decimated_store_dir(decimate)
+            shutil.move(store_dir + '-incomplete', store_dir)
+            self._decimated[decimate] = None
+
     def stats(self):
         stats = BaseStore.stats(self)
         stats['decimated'] = sorted(self._decimated.keys())
@@ -1472,15 +2038,28 @@ class Store(BaseStore):
         return os.path.join(self.store_dir, 'decimated', str(decimate))
 
     def _decimated_store(self, decimate):
-        if decimate == 1 or decimate not in self._decimated:
+        '''
+        Get coarsest available store for a given decimation factor.
+
+        Returns the decimated sub-store with the largest factor dividing
+        ``decimate`` and the remaining factor, which has to be applied on the
+        fly.
+        '''
+
+        available = [
+            d for d in self._decimated
+            if d <= decimate and decimate % d == 0]
+
+        if decimate == 1 or not available:
             return self, decimate
         else:
-            store = self._decimated[decimate]
+            d = max(available)
+            store = self._decimated[d]
             if store is None:
-                store = Store(self._decimated_store_dir(decimate), 'r')
-                self._decimated[decimate] = store
+                store = Store(self._decimated_store_dir(d), 'r')
+                self._decimated[d] = store
 
-            return store, 1
+            return store, decimate // d
 
     def _phase_filename(self, phase_id):
         check_string_id(phase_id)
@@ -1675,16 +2254,25 @@ class Store(BaseStore):
             tlenmax_vred=tlenmax_vred,
             vred=vred)
 
-    def make_ttt(self, force=False):
+    def make_ttt(self, force=False, nworkers=1):
         '''Compute travel time tables.
 
         Travel time tables are computed using the 1D earth model defined in
         :py:attr:`pyrocko.gf.meta.Config.earthmodel_1d` for each defined phase
         in :py:attr:`pyrocko.gf.meta.Config.tabulated_phases`. The accuracy of
         the tablulated times is adjusted to the sampling rate of the store.
+
+        :param force: overwrite existing travel time tables, discarding any
+            checkpoints of unfinished computations
+        :param nworkers: number of worker processes. If there are at least
+            as many phase groups as workers, the phase groups are computed in
+            parallel, otherwise the evaluations within each table are
+            distributed over the workers.
+
+        Interrupted computations are resumed from the checkpoint files which
+        are kept next to the tables until they are complete.
         '''
 
-        from pyrocko import cake
         config = self.config
 
         if not config.tabulated_phases:
@@ -1698,65 +2286,110 @@ class Store(BaseStore):
         if not mod:
             raise StoreError('no earth model found')
 
+        pdefs = []
         for pdef in config.tabulated_phases:
-
-            phase_id = pdef.id
-            phases = pdef.phases
-            horvels = pdef.horizontal_velocities
-
-            fn = os.path.join(self.store_dir, 'phases', '%s.phase' % phase_id)
+            fn = os.path.join(self.store_dir, 'phases', '%s.phase' % pdef.id)
 
             if os.path.exists(fn) and not force:
                 logger.info('file already exists: %s' % fn)
                 continue
 
-            def evaluate(args):
+            if force and os.path.exists(fn + '.checkpoint'):
+                os.unlink(fn + '.checkpoint')
 
-                if len(args) == 2:
-                    zr, zs, x = (config.receiver_depth,) + args
-                elif len(args) == 3:
-                    zr, zs, x = args
-                else:
-                    assert False
+            pdefs.append(pdef)
 
-                t = []
-                if phases:
-                    rays = mod.arrivals(
-                        phases=phases,
-                        distances=[x*cake.m2d],
-                        zstart=zs,
-                        zstop=zr)
+        if nworkers != 1 and len(pdefs) >= nworkers:
+            for _ in parimap(
+                    self._make_ttt_phase, pdefs,
+                    nprocs=nworkers):
+                pass
 
-                    for ray in rays:
-                        t.append(ray.t)
+        else:
+            for pdef in pdefs:
+                self._make_ttt_phase(pdef, nworkers=nworkers)
 
-                for v in horvels:
-                    t.append(x/(v*1000.))
+    def _make_ttt_phase(self, pdef, nworkers=1):
+        from pyrocko import cake
+        config = self.config
+        mod = config.earthmodel_1d
 
-                if t:
-                    return min(t)
-                else:
-                    return None
+        phase_id = pdef.id
+        phases = pdef.phases
+        horvels = pdef.horizontal_velocities
+
+        fn = os.path.join(self.store_dir, 'phases', '%s.phase' % phase_id)
+        fn_checkpoint = fn + '.checkpoint'
 
-            logger.info('making travel time table for phasegroup "%s"' %
-                        phase_id)
+        def evaluate(args):
+
+            if len(args) == 2:
+                zr, zs, x = (config.receiver_depth,) + args
+            elif len(args) == 3:
+                zr, zs, x = args
+            else:
+                assert False
 
+            t = []
+            if phases:
+                rays = mod.arrivals(
+                    phases=phases,
+                    distances=[x*cake.m2d],
+                    zstart=zs,
+                    zstop=zr)
+
+                for ray in rays:
+                    t.append(ray.t)
+
+            for v in horvels:
+                t.append(x/(v*1000.))
+
+            if t:
+                return min(t)
+            else:
+                return None
+
+        logger.info('making travel time table for phasegroup "%s"' %
+                    phase_id)
+
+        util.ensuredirs(fn)
+
+        try:
             ip = spit.SPTree(
                 f=evaluate,
                 ftol=config.deltat*0.5,
                 xbounds=num.transpose((config.mins, config.maxs)),
-                xtols=config.deltas)
+                xtols=config.deltas,
+                nworkers=nworkers,
+                checkpoint_filename=fn_checkpoint)
+
+        except spit.SPTreeError as e:
+            raise StoreError(str(e))
 
-            util.ensuredirs(fn)
-            ip.dump(fn)
+        ip.dump(fn)
+        os.unlink(fn_checkpoint)
 
     def statics(self, source, multi_location, itsnapshot, components,
-                interpolation='nearest_neighbor', nthreads=0):
+                interpolation='nearest_neighbor', nthreads=0,
+                max_pairs=statics_max_pairs):
+        '''
+        Compute static quantities at the locations of a multi-location target.
+
+        The locations are processed in chunks, so that the summation
+        parameters are set up for at most ``max_pairs`` pairs of source
+        elements and locations at a time. This bounds the memory needed for
+        scenes with many pixels. The results of the chunks are written into
+        preallocated output arrays.
+
+        :returns: dict with arrays of the requested components
+        '''
+
         if not self._f_index:
             self.open()
 
         out = {}
         ntargets = multi_location.ntargets
+        source_coords = source.coords5()
         source_terms = source.get_source_terms(self.config.component_scheme)
         delays = source.times.astype(num.float32)
         scheme_desc = meta.component_scheme_to_description[
@@ -1765,29 +2398,41 @@ class Store(BaseStore):
         if ntargets == 0:
             raise StoreError('MultiLocation.coords5 is empty')
 
-        try:
-            sum_params = store_ext.make_sum_params(
-                self.cstore,
-                source.coords5(),
-                source_terms,
-                multi_location.coords5,
-                self.config.component_scheme,
-                interpolation,
-                nthreads or 0)
-        except store_ext.StoreExtError:
-            raise meta.OutOfBounds()
+        receiver_coords = multi_location.coords5
 
+        icomps = []
         for icomp, comp in enumerate(scheme_desc.provided_components):
-            if comp not in components:
-                continue
-            weights, irecords = sum_params[icomp]
-            out[comp] = self.sum_statics(
-                irecords,
-                delays,
-                weights,
-                itsnapshot,
-                ntargets,
-                nthreads or 0)
+            if comp in components:
+                icomps.append((icomp, comp))
+                out[comp] = num.empty(ntargets, dtype=gf_dtype)
+
+        nchunk = max(1, max_pairs // max(1, source_coords.shape[0]))
+        for ilo in range(0, ntargets, nchunk):
+            ihi = min(ilo + nchunk, ntargets)
+            try:
+                sum_params = store_ext.make_sum_params(
+                    self.cstore,
+                    source_coords,
+                    source_terms,
+                    receiver_coords[ilo:ihi],
+                    self.config.component_scheme,
+                    interpolation,
+                    nthreads or 0)
+            except store_ext.StoreExtError:
+                raise meta.OutOfBounds()
+
+            for icomp, comp in icomps:
+                weights, irecords = sum_params[icomp]
+                out[comp][ilo:ihi] = self.sum_statics(
+                    irecords,
+                    delays,
+                    weights,
+                    itsnapshot,
+                    ihi - ilo,
+                    nthreads or 0)
+
+            # release before setting up the next chunk
+            del sum_params
 
         return out
 
@@ -1885,6 +2530,135 @@ class Store(BaseStore):
 
         return out
 
+    def seismograms(self, sources, receivers, components, deltat=None,
+                    itmin=None, nsamples=None,
+                    interpolation='nearest_neighbor', nthreads=0):
+
+        '''
+        Compute base seismograms for many sources and receivers in one go.
+
+        All source-receiver combinations are stacked with a single call to
+        the C extension, on a common time window.
+
+        :param sources: List of :py:class:`pyrocko.gf.meta.DiscretizedSource`
+            objects
+        :param receivers: List of :py:class:`pyrocko.gf.meta.Receiver`
+            objects
+        :param components: Names of the components to compute
+        :param deltat: Sampling interval of a decimated store to use,
+            defaults to the sampling interval of the store
+        :param itmin: Start time index (start time is ``itmin * dt``),
+            defaults to start of earliest stack
+        :param nsamples: Number of samples, defaults to span up to the end of
+            latest stack
+        :param interpolation: Interpolation method
+            ``['nearest_neighbor', 'multilinear']``
+        :param nthreads: Number of threads to use, ``0`` means all available
+        :returns: Tuple ``(itmin, data)`` where ``data`` is a dict with the
+            component names as keys and arrays of shape
+            ``(len(sources), len(receivers), nsamples)`` as values
+        '''
+
+        config = self.config
+
+        if deltat is None:
+            decimate = 1
+        else:
+            decimate = int(round(deltat/config.deltat))
+            if abs(deltat / (decimate * config.deltat) - 1.0) > 0.001:
+                raise StoreError(
+                    'unavailable decimation ratio target.deltat / store.deltat'
+                    ' = %g / %g' % (deltat, config.deltat))
+
+        store, decimate_ = self._decimated_store(decimate)
+        if decimate_ != 1:
+            raise StoreError(
+                'no decimated store available for decimation factor %i' %
+                decimate)
+
+        if not store._f_index:
+            store.open()
+
+        scheme = config.component_scheme
+        scheme_desc = meta.component_scheme_to_description[scheme]
+
+        nsources = len(sources)
+        nreceivers = len(receivers)
+        npoints = num.array([source.nelements for source in sources],
+                            dtype=num.int64)
+        ipoint_offsets = num.concatenate(([0], num.cumsum(npoints)))
+        npoints_total = int(ipoint_offsets[-1])
+
+        source_coords_arr = num.vstack(
+            [source.coords5() for source in sources])
+        source_terms = num.vstack(
+            [source.get_source_terms(scheme) for source in sources])
+        receiver_coords_arr = num.vstack(
+            [receiver.coords5 for receiver in receivers])
+
+        times = num.concatenate([source.times for source in sources])
+
+        try:
+            params = store_ext.make_sum_params(
+                store.cstore,
+                source_coords_arr,
+                source_terms,
+                receiver_coords_arr,
+                scheme,
+                interpolation, nthreads)
+
+        except store_ext.StoreExtError:
+            raise meta.OutOfBounds()
+
+        comps = [comp for comp in scheme_desc.provided_components
+                 if comp in components]
+
+        # stack order: component, receiver, source
+        irecords_all = []
+        weights_all = []
+        delays_all = []
+        offsets_all = [num.zeros(1, dtype=num.uint64)]
+        noffset = 0
+        for icomp, comp in enumerate(scheme_desc.provided_components):
+            if comp not in comps:
+                continue
+
+            weights, irecords = params[icomp]
+            neach = irecords.size // (npoints_total * nreceivers) \
+                if npoints_total * nreceivers else 0
+
+            starts = (
+                num.arange(nreceivers, dtype=num.int64)[:, num.newaxis]
+                * npoints_total
+                + ipoint_offsets[num.newaxis, :-1]) * neach
+
+            offsets_all.append(
+                (noffset + starts + npoints[num.newaxis, :] * neach)
+                .ravel().astype(num.uint64))
+
+            irecords_all.append(irecords)
+            weights_all.append(weights)
+            delays_all.append(num.tile(num.repeat(times, neach), nreceivers))
+            noffset += irecords.size
+
+        itmin, data = store._sum_many(
+            num.concatenate(irecords_all) if irecords_all
+            else num.zeros(0, dtype=num.uint64),
+            num.concatenate(delays_all) if delays_all
+            else num.zeros(0, dtype=num.float32),
+            num.concatenate(weights_all) if weights_all
+            else num.zeros(0, dtype=num.float32),
+            num.concatenate(offsets_all),
+            itmin, nsamples, nthreads)
+
+        data = data.reshape((len(comps), nreceivers, nsources, -1))
+
+        out = {}
+        for icomp, comp in enumerate(comps):
+            out[comp] = data[icomp].transpose((1, 0, 2))
+
+        return itmin, out
+
 
 __all__ = '''
 gf_dtype
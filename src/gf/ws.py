@@ -50,7 +50,7 @@ class InvalidRequest(Exception):
     pass
 
 
-def _request(url, post=False, **kwargs):
+def _request(url, post=False, headers=None, **kwargs):
     logger.debug('Accessing URL %s' % url)
 
     if post:
@@ -70,6 +70,8 @@ def _request(url, post=False, **kwargs):
 
     prep = ses.prepare_request(req)
     prep.headers['Accept'] = '*/*'
+    if headers:
+        prep.headers.update(headers)
 
     resp = ses.send(prep, stream=True)
     resp.raise_for_status()
@@ -167,10 +169,22 @@ def download_gf_store(url=g_url_static, site=g_default_site, majorversion=1,
 
 
 def seismosizer(url=g_url, site=g_default_site, majorversion=1,
-                request=None):
+                request=None, binary=True):
 
     url = fillurl(url, site, 'seismosizer', majorversion)
 
-    from pyrocko.gf import meta
+    from pyrocko.gf import meta, seismosizer as gf_seismosizer
 
-    return meta.load(stream=_request(url, post={'request': request.dump()}))
+    mimetype = gf_seismosizer.binary_response_mimetype
+    if binary:
+        headers = {'Accept': '%s, */*;q=0.5' % mimetype}
+    else:
+        headers = None
+
+    stream = _request(url, post={'request': request.dump()}, headers=headers)
+
+    # servers not supporting the binary format answer with YAML
+    if stream.headers.get('content-type', '').startswith(mimetype):
+        return gf_seismosizer.load_response_binary(stream, request)
+    else:
+        return meta.load(stream=stream)
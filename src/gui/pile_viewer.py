@@ -1448,7 +1448,7 @@ def MakePileViewerMainClass(base):
             if not fns:
                 return
 
-            cache = pyrocko.pile.get_cache(cache_dir)
+            cache = pyrocko.pile.get_index(cache_dir)
 
             t = [time.time()]
 
@@ -68,12 +68,14 @@ class Chain(Processor):
 
     def process(self, trace):
         traces = [trace]
-        xtraces = []
         for p in self._processors:
+            xtraces = []
             for tr in traces:
-                xtraces.extend(p.process(traces))
+                xtraces.extend(p.process(tr))
 
-        return xtraces
+            traces = xtraces
+
+        return traces
 
 
 class Downsampler(Processor):
@@ -81,22 +83,38 @@ class Downsampler(Processor):
     def __init__(self, mapping, deltat):
         Processor.__init__(self)
         self._mapping = mapping
-        self._downsampler = tracemod.co_downsample_to(deltat)
+        self._pipeline = tracemod.StreamPipeline(
+            [tracemod.DownsampleStage(deltat)])
 
     def process(self, trace):
         target_id = self._mapping(trace)
         if target_id is None:
             return []
 
-        ds_trace = self._downsampler.send(trace)
-        ds_trace.set_codes(*target_id)
-        if ds_trace.data_len() == 0:
-            return []
+        ds_traces = []
+        for ds_trace in self._pipeline.send(trace):
+            if ds_trace.data_len() != 0:
+                ds_trace.set_codes(*target_id)
+                ds_traces.append(ds_trace)
 
-        return [ds_trace]
+        return ds_traces
 
-    def __del__(self):
-        self._downsampler.close()
+
+class StreamProcessor(Processor):
+    '''
+    Processor sending the traces through a
+    :py:class:`pyrocko.trace.StreamPipeline`.
+    '''
+
+    def __init__(self, pipeline):
+        Processor.__init__(self)
+        self._pipeline = pipeline
+
+    def process(self, trace):
+        return self._pipeline.send(trace)
+
+    def flush_buffers(self):
+        return self._pipeline.flush()
 
 
 class Grower(Processor):
@@ -184,7 +202,6 @@ class HamsterPile(pile.Pile):
             self.add_file(buf)
             self._buffers[nslc] = buf
 
-        buf.recursive_grow_update([trace])
         trbuf = buf.get_traces()[0]
         if self._fixation_length is not None:
             if trbuf.tmax - trbuf.tmin > self._fixation_length:
@@ -207,7 +224,11 @@ class HamsterPile(pile.Pile):
                 and trbuf.ydata.dtype == trace.ydata.dtype
                 and trbuf.deltat == trace.deltat):
 
+            # the pile indices are sorted by time, so the buffer trace must
+            # not change while it is indexed
+            buf.remove(trbuf)
             trbuf.append(trace.ydata)
+            buf.add(trbuf)
             return buf
 
         return None
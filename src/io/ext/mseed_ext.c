@@ -27,48 +27,18 @@ static struct module_state _state;
 
 
 static PyObject*
-mseed_get_traces (PyObject *m, PyObject *args)
+mstg_to_list (MSTraceGroup *mstg, int unpackdata, struct module_state *st)
 {
-    char          *filename;
-    MSTraceGroup  *mstg = NULL;
     MSTrace       *mst = NULL;
-    int           retcode;
     npy_intp      array_dims[1] = {0};
     PyObject      *array = NULL;
     PyObject      *out_traces = NULL;
     PyObject      *out_trace = NULL;
     int           numpytype;
     char          strbuf[BUFSIZE];
-    PyObject      *unpackdata = NULL;
-
-    struct module_state *st = GETSTATE(m);
-
-    if (!PyArg_ParseTuple(args, "sO", &filename, &unpackdata)) {
-        PyErr_SetString(st->error, "usage get_traces(filename, dataflag)" );
-        return NULL;
-    }
-
-    if (!PyBool_Check(unpackdata)) {
-        PyErr_SetString(st->error, "Second argument must be a boolean" );
-        return NULL;
-    }
-  
-    /* get data from mseed file */
-    retcode = ms_readtraces (&mstg, filename, 0, -1.0, -1.0, 0, 1, (unpackdata == Py_True), 0);
-    if ( retcode < 0 ) {
-        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
-        PyErr_SetString(st->error, strbuf);
-        return NULL;
-    }
-
-    if ( ! mstg ) {
-        snprintf (strbuf, BUFSIZE, "Error reading file");
-        PyErr_SetString(st->error, strbuf);
-        return NULL;
-    }
 
     /* check that there is data in the traces */
-    if (unpackdata == Py_True) {
+    if (unpackdata) {
         mst = mstg->traces;
         while (mst) {
             if (mst->datasamples == NULL) {
@@ -88,7 +58,7 @@ mseed_get_traces (PyObject *m, PyObject *args)
 
     while (mst) {
         
-        if (unpackdata == Py_True) {
+        if (unpackdata) {
             array_dims[0] = mst->numsamples;
             switch (mst->sampletype) {
                 case 'i':
@@ -137,11 +107,184 @@ mseed_get_traces (PyObject *m, PyObject *args)
         mst = mst->next;
     }
 
+    return out_traces;
+}
+
+static PyObject*
+mseed_get_traces (PyObject *m, PyObject *args)
+{
+    char          *filename;
+    MSTraceGroup  *mstg = NULL;
+    int           retcode;
+    PyObject      *out_traces = NULL;
+    char          strbuf[BUFSIZE];
+    PyObject      *unpackdata = NULL;
+    flag          dataflag;
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "sO", &filename, &unpackdata)) {
+        PyErr_SetString(st->error, "usage get_traces(filename, dataflag)" );
+        return NULL;
+    }
+
+    if (!PyBool_Check(unpackdata)) {
+        PyErr_SetString(st->error, "Second argument must be a boolean" );
+        return NULL;
+    }
+  
+    /* get data from mseed file */
+    dataflag = (unpackdata == Py_True);
+    Py_BEGIN_ALLOW_THREADS
+    retcode = ms_readtraces (&mstg, filename, 0, -1.0, -1.0, 0, 1, dataflag, 0);
+    Py_END_ALLOW_THREADS
+    if ( retcode < 0 ) {
+        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
+        PyErr_SetString(st->error, strbuf);
+        return NULL;
+    }
+
+    if ( ! mstg ) {
+        snprintf (strbuf, BUFSIZE, "Error reading file");
+        PyErr_SetString(st->error, strbuf);
+        return NULL;
+    }
+
+    out_traces = mstg_to_list(mstg, (unpackdata == Py_True), st);
+
     mst_freegroup (&mstg);
 
     return out_traces;
 }
 
+static PyObject*
+mseed_get_records (PyObject *m, PyObject *args)
+{
+    char          *filename;
+    MSFileParam   *msfp = NULL;
+    MSRecord      *msr = NULL;
+    off_t         fpos;
+    int           retcode;
+    PyObject      *out_records = NULL;
+    PyObject      *out_record = NULL;
+    char          strbuf[BUFSIZE];
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "s", &filename)) {
+        PyErr_SetString(st->error, "usage get_records(filename)" );
+        return NULL;
+    }
+
+    out_records = Py_BuildValue("[]");
+
+    while ((retcode = ms_readmsr_r (&msfp, &msr, filename, 0, &fpos, NULL, 1, 0, 0)) == MS_NOERROR) {
+        out_record = Py_BuildValue( "(s,s,s,s,L,L,d,L,i)",
+                                    msr->network,
+                                    msr->station,
+                                    msr->location,
+                                    msr->channel,
+                                    msr->starttime,
+                                    msr_endtime(msr),
+                                    msr->samprate,
+                                    (long long)fpos,
+                                    msr->reclen );
+
+        PyList_Append(out_records, out_record);
+        Py_DECREF(out_record);
+    }
+
+    ms_readmsr_r (&msfp, &msr, NULL, 0, NULL, NULL, 0, 0, 0);
+
+    if ( retcode != MS_ENDOFFILE ) {
+        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
+        PyErr_SetString(st->error, strbuf);
+        Py_DECREF(out_records);
+        return NULL;
+    }
+
+    return out_records;
+}
+
+static PyObject*
+mseed_get_traces_from_records (PyObject *m, PyObject *args)
+{
+    char          *filename;
+    PyObject      *in_records = NULL;
+    PyObject      *in_record = NULL;
+    MSTraceGroup  *mstg = NULL;
+    MSRecord      *msr = NULL;
+    PyObject      *out_traces = NULL;
+    long long     offset;
+    int           reclen;
+    int           retcode;
+    int           i, n;
+    char          *record = NULL;
+    FILE          *infile;
+    char          strbuf[BUFSIZE];
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "sO", &filename, &in_records)) {
+        PyErr_SetString(st->error, "usage get_traces_from_records(filename, records)" );
+        return NULL;
+    }
+
+    if (!PySequence_Check(in_records)) {
+        PyErr_SetString(st->error, "Records is not of sequence type." );
+        return NULL;
+    }
+
+    infile = fopen(filename, "rb");
+    if (infile == NULL) {
+        snprintf (strbuf, BUFSIZE, "Cannot open file '%s'", filename);
+        PyErr_SetString(st->error, strbuf);
+        return NULL;
+    }
+
+    mstg = mst_initgroup(NULL);
+    n = PySequence_Length(in_records);
+    for (i=0; i<n; i++) {
+        in_record = PySequence_GetItem(in_records, i);
+        if (in_record == NULL || !PyArg_ParseTuple(in_record, "Li", &offset, &reclen)) {
+            PyErr_SetString(st->error, "Record must be given as tuple (offset, reclen)." );
+            Py_XDECREF(in_record);
+            goto fail;
+        }
+        Py_DECREF(in_record);
+
+        record = realloc(record, reclen);
+        if (record == NULL) {
+            PyErr_SetString(st->error, "Cannot allocate memory." );
+            goto fail;
+        }
+
+        if (fseeko(infile, (off_t)offset, SEEK_SET) != 0 || fread(record, reclen, 1, infile) != 1) {
+            snprintf (strbuf, BUFSIZE, "Cannot read record at offset %lld from file '%s'", offset, filename);
+            PyErr_SetString(st->error, strbuf);
+            goto fail;
+        }
+
+        retcode = msr_unpack(record, reclen, &msr, 1, 0);
+        if (retcode != MS_NOERROR) {
+            snprintf (strbuf, BUFSIZE, "Cannot unpack record at offset %lld from file '%s': %s", offset, filename, ms_errorstr(retcode));
+            PyErr_SetString(st->error, strbuf);
+            goto fail;
+        }
+
+        mst_addmsrtogroup(mstg, msr, 0, -1.0, -1.0);
+    }
+
+    out_traces = mstg_to_list(mstg, 1, st);
+
+fail:
+    fclose(infile);
+    free(record);
+    msr_free(&msr);
+    mst_freegroup(&mstg);
+    return out_traces;
+}
+
 static void record_handler (char *record, int reclen, void *outfile) {    
     if ( fwrite(record, reclen, 1, outfile) != 1 ) {
       fprintf(stderr, "Error writing mseed record to output file\n");
@@ -294,6 +437,23 @@ static PyMethodDef mseed_ext_methods[] = {
     "in libmseed. If dataflag is True, `data` is a numpy array containing the\n"
     "data. If dataflag is False, the data is not unpacked and `data` is None.\n" },
 
+    {"get_records",  mseed_get_records, METH_VARARGS,
+    "get_records(filename)\n"
+    "Get header information of all data records in an mseed file.\n\n"
+    "Returns a list of tuples, one tuple for each record in the file. Each\n"
+    "tuple has 9 elements:\n\n"
+    "  (network, station, location, channel,\n"
+    "    startime, endtime, samprate, offset, reclen)\n\n"
+    "where `offset` is the position of the record in the file in bytes and\n"
+    "`reclen` is its length in bytes. Data is not unpacked.\n" },
+
+    {"get_traces_from_records",  mseed_get_traces_from_records, METH_VARARGS,
+    "get_traces_from_records(filename, records)\n"
+    "Get traces assembled from selected records of an mseed file.\n\n"
+    "`records` is a sequence of (offset, reclen) tuples as returned by\n"
+    "get_records(). Only these records are read and unpacked. Returns a list\n"
+    "of tuples as get_traces() with dataflag set to True.\n" },
+
     {"store_traces",  mseed_store_traces, METH_VARARGS, 
     "store_traces(traces, filename)\n" },
 
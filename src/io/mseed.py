@@ -21,13 +21,13 @@ class CodeTooLong(FileSaveError):
     pass
 
 
-def iload(filename, load_data=True):
+def _iload(filename, get):
     from pyrocko import mseed_ext
 
     have_zero_rate_traces = False
     try:
         traces = []
-        for tr in mseed_ext.get_traces(filename, load_data):
+        for tr in get():
             network, station, location, channel = tr[1:5]
             tmin = float(tr[5])/float(mseed_ext.HPTMODULUS)
             tmax = float(tr[6])/float(mseed_ext.HPTMODULUS)
@@ -55,6 +55,56 @@ def iload(filename, load_data=True):
             '(maybe LOG traces)' % filename)
 
 
+def iload(filename, load_data=True):
+    from pyrocko import mseed_ext
+    return _iload(
+        filename, lambda: mseed_ext.get_traces(filename, load_data))
+
+
+def get_records(filename):
+    '''
+    Get header information of the data records in a miniSEED file.
+
+    Data is not unpacked.
+
+    :param filename: path to the miniSEED file
+    :returns: list of tuples ``(nslc_id, tmin, tmax, offset, reclen)``, one
+        for each record; ``tmin`` and ``tmax`` are the times of the first and
+        last sample in the record, ``offset`` is the position of the record
+        in the file and ``reclen`` its length in bytes
+    '''
+
+    from pyrocko import mseed_ext
+
+    try:
+        records = mseed_ext.get_records(filename)
+    except (OSError, mseed_ext.MSeedError) as e:
+        raise FileLoadError(str(e)+' (file: %s)' % filename)
+
+    hpt = float(mseed_ext.HPTMODULUS)
+    return [
+        (rec[0:4], float(rec[4])/hpt, float(rec[5])/hpt, rec[7], rec[8])
+        for rec in records]
+
+
+def iload_records(filename, records):
+    '''
+    Read traces from selected data records of a miniSEED file.
+
+    Only the given records are read and decoded. Contiguous records are
+    merged into single traces.
+
+    :param filename: path to the miniSEED file
+    :param records: list of ``(offset, reclen)`` tuples, e.g. taken from the
+        output of :py:func:`get_records`
+    '''
+
+    from pyrocko import mseed_ext
+    return _iload(
+        filename,
+        lambda: mseed_ext.get_traces_from_records(filename, records))
+
+
 def as_tuple(tr):
     from pyrocko import mseed_ext
     itmin = int(round(tr.tmin*mseed_ext.HPTMODULUS))
@@ -19,6 +19,11 @@ import sys
 import operator
 import math
 import hashlib
+import sqlite3
+import threading
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
 try:
     import cPickle as pickle
 except ImportError:
@@ -163,6 +168,122 @@ class Sorted(object):
         return len(self._avl)
 
 
+class DataCache(object):
+    '''Keeps track of loaded waveform data across all files.
+
+    Files register their decoded sample arrays here when data is loaded.
+    Without a memory budget (the default), data is released as soon as the
+    last user of a file drops it. When a budget is set with
+    :py:meth:`set_max_bytes`, data of files which are not in use is kept in
+    memory and only evicted, least recently used first, when the total size
+    of loaded data exceeds the budget. Hits, misses and evictions are
+    counted.
+    '''
+
+    instance = None
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._files = OrderedDict()
+        self._lock = threading.RLock()
+        self._nholds = 0
+        self.nbytes = 0
+        self.reset_stats()
+
+    def set_max_bytes(self, max_bytes):
+        '''Set memory budget in bytes (``None`` to disable).'''
+
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def keeps_unused(self):
+        return self.max_bytes is not None
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit(self, file):
+        with self._lock:
+            self.hits += 1
+            if file in self._files:
+                self._files[file] = self._files.pop(file)
+
+    def add(self, file, nbytes):
+        with self._lock:
+            self.misses += 1
+            self.nbytes += nbytes - self._files.pop(file, 0)
+            self._files[file] = nbytes
+
+        self.evict()
+
+    def remove(self, file):
+        with self._lock:
+            self.nbytes -= self._files.pop(file, 0)
+
+    @contextmanager
+    def hold(self):
+        '''Context manager to suspend eviction, e.g. while chopping.'''
+
+        with self._lock:
+            self._nholds += 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._nholds -= 1
+
+            self.evict()
+
+    def evict(self):
+        '''Release data of unused files until the budget is met.'''
+
+        if self.max_bytes is None or self._nholds > 0:
+            return
+
+        with self._lock:
+            for file in list(self._files.keys()):
+                if self.nbytes <= self.max_bytes:
+                    break
+
+                if file.data_use_count <= 0:
+                    file.unload_data()
+                    self.evictions += 1
+
+    def stats(self):
+        '''Get cache statistics as a dict.'''
+
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                nfiles=len(self._files),
+                nbytes=self.nbytes,
+                max_bytes=self.max_bytes)
+
+    def __str__(self):
+        stats = self.stats()
+        return '''DataCache
+files loaded: %(nfiles)i
+bytes loaded: %(nbytes)i
+budget: %(max_bytes)s
+hits: %(hits)i
+misses: %(misses)i
+evictions: %(evictions)i
+''' % stats
+
+
+def get_data_cache():
+    '''Get global DataCache object.'''
+    if DataCache.instance is None:
+        DataCache.instance = DataCache()
+
+    return DataCache.instance
+
+
 class TracesFileCache(object):
     '''Manages trace metainformation cache.
 
@@ -200,6 +321,23 @@ class TracesFileCache(object):
             return dircache[abspath]
         return None
 
+    def get_many(self, abspaths):
+        '''Get several items from the cache.
+
+        :param abspaths: absolute paths of the objects to retrieve
+
+        :returns: dict with the stored objects of the paths found in the
+            cache.
+        '''
+
+        tfiles = {}
+        for abspath in abspaths:
+            tfile = self.get(abspath)
+            if tfile is not None:
+                tfiles[abspath] = tfile
+
+        return tfiles
+
     def put(self, abspath, tfile):
         '''Put an item into the cache.
 
@@ -286,6 +424,7 @@ class TracesFileCache(object):
             trf.by_mtime = None
             trf.data_use_count = 0
             trf.data_loaded = False
+            trf._records = None
             traces = []
             for tr in trf.traces:
                 tr = tr.copy(data=False)
@@ -313,9 +452,328 @@ def get_cache(cachedir):
     return TracesFileCache.caches[cachedir]
 
 
+class TracesFileIndex(object):
+    '''Persistent trace metainformation index in an SQLite database.
+
+    Can be used in place of :py:class:`TracesFileCache`. Instead of one pickle
+    file per directory, the metainformation of all known files is kept in a
+    single database. Entries are read and written per file, so that
+    incremental re-scans only touch the files which have changed, and the
+    index can be queried for time spans and channel codes without
+    instantiating the headers of all files.
+    '''
+
+    indexes = {}
+    schema_version = 1
+
+    # number of paths per query, below sqlite's default variable limit
+    nbatch = 500
+
+    def __init__(self, cachedir, filename='pile-index.sqlite'):
+        '''Open (or create) index.
+
+        :param cachedir: directory to hold the database file.
+        :param filename: name of the database file.
+        '''
+
+        self.cachedir = cachedir
+        util.ensuredir(self.cachedir)
+        self.path = pjoin(self.cachedir, filename)
+
+        # piles are also used from prefetch and viewer threads
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=60., check_same_thread=False)
+        self._conn.text_factory = str
+        self._init_tables()
+
+    def _init_tables(self):
+        conn = self._conn
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, self.schema_version):
+            conn.execute('DROP TABLE IF EXISTS traces')
+            conn.execute('DROP TABLE IF EXISTS files')
+
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                format TEXT NOT NULL,
+                mtime REAL NOT NULL);
+
+            CREATE TABLE IF NOT EXISTS traces (
+                file_id INTEGER NOT NULL,
+                network TEXT NOT NULL,
+                station TEXT NOT NULL,
+                location TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                tmin REAL NOT NULL,
+                tmax REAL NOT NULL,
+                deltat REAL NOT NULL);
+
+            CREATE INDEX IF NOT EXISTS traces_file_id ON traces (file_id);
+            CREATE INDEX IF NOT EXISTS traces_tmin ON traces (tmin);
+            CREATE INDEX IF NOT EXISTS traces_tmax ON traces (tmax);
+        ''')
+        conn.execute('PRAGMA user_version = %i' % self.schema_version)
+        conn.commit()
+
+    def _iter_batches(self, abspaths):
+        abspaths = list(abspaths)
+        for i in range(0, len(abspaths), self.nbatch):
+            batch = abspaths[i:i+self.nbatch]
+            yield batch, ', '.join('?' * len(batch))
+
+    def _get_file_row(self, abspath):
+        return self._conn.execute(
+            'SELECT file_id, format, mtime FROM files WHERE path = ?',
+            (abspath,)).fetchone()
+
+    def get_stamp(self, abspath):
+        '''Get format and modification time recorded for a file.
+
+        :param abspath: absolute path of the file
+        :returns: tuple ``(format, mtime)`` or ``None`` if the file is not in
+            the index.
+        '''
+
+        return self.get_stamps([abspath]).get(abspath, None)
+
+    def get_stamps(self, abspaths):
+        '''Get format and modification time recorded for several files.
+
+        :param abspaths: absolute paths of the files
+        :returns: dict with tuples ``(format, mtime)`` of the paths found in
+            the index.
+        '''
+
+        stamps = {}
+        with self._lock:
+            for batch, placeholders in self._iter_batches(abspaths):
+                for (abspath, format, mtime) in self._conn.execute(
+                        '''
+                        SELECT path, format, mtime FROM files
+                        WHERE path IN (%s)
+                        ''' % placeholders, batch):
+
+                    stamps[abspath] = format, mtime
+
+        return stamps
+
+    def get(self, abspath):
+        '''Try to get an item from the index.
+
+        :param abspath: absolute path of the object to retrieve
+
+        :returns: a :py:class:`TracesFile` object is returned or None if
+            nothing could be found.
+        '''
+
+        return self.get_many([abspath]).get(abspath, None)
+
+    def get_many(self, abspaths):
+        '''Get several items from the index.
+
+        The entries are read with one query per batch of :py:attr:`nbatch`
+        paths.
+
+        :param abspaths: absolute paths of the objects to retrieve
+
+        :returns: dict with :py:class:`TracesFile` objects of the paths found
+            in the index.
+        '''
+
+        stamps = {}
+        traces = {}
+        with self._lock:
+            for batch, placeholders in self._iter_batches(abspaths):
+                for (abspath, format, mtime, network, station, location,
+                        channel, tmin, tmax, deltat) in self._conn.execute(
+                            '''
+                            SELECT files.path, files.format, files.mtime,
+                                traces.network, traces.station,
+                                traces.location, traces.channel,
+                                traces.tmin, traces.tmax, traces.deltat
+                            FROM files LEFT JOIN traces
+                                ON traces.file_id = files.file_id
+                            WHERE files.path IN (%s)
+                            ''' % placeholders, batch):
+
+                    if abspath not in stamps:
+                        stamps[abspath] = format, mtime
+                        traces[abspath] = []
+
+                    if network is not None:
+                        traces[abspath].append(trace.Trace(
+                            network, station, location, channel, tmin, tmax,
+                            deltat, mtime=mtime))
+
+        return dict(
+            (abspath, TracesFile.from_traces(
+                None, abspath, format, traces[abspath], mtime))
+            for (abspath, (format, mtime)) in stamps.items())
+
+    def put(self, abspath, tfile):
+        '''Put an item into the index.
+
+        :param abspath: absolute path of the object to be stored
+        :param tfile: :py:class:`TracesFile` object to be stored
+        '''
+
+        conn = self._conn
+        with self._lock:
+            self._delete(abspath)
+            cursor = conn.execute(
+                'INSERT INTO files (path, format, mtime) VALUES (?, ?, ?)',
+                (abspath, tfile.format, tfile.mtime))
+
+            file_id = cursor.lastrowid
+            conn.executemany(
+                '''
+                INSERT INTO traces (
+                    file_id, network, station, location, channel,
+                    tmin, tmax, deltat)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (file_id, tr.network, tr.station, tr.location,
+                     tr.channel, float(tr.tmin), float(tr.tmax),
+                     float(tr.deltat))
+                    for tr in tfile.traces])
+
+    def _delete(self, abspath):
+        with self._lock:
+            row = self._get_file_row(abspath)
+            if row is not None:
+                file_id = row[0]
+                self._conn.execute(
+                    'DELETE FROM traces WHERE file_id = ?', (file_id,))
+                self._conn.execute(
+                    'DELETE FROM files WHERE file_id = ?', (file_id,))
+
+    def select(self, tmin=None, tmax=None, nslc_patterns=None):
+        '''Get paths of files with traces matching given time span and codes.
+
+        :param tmin: start time or ``None``
+        :param tmax: end time or ``None``
+        :param nslc_patterns: pattern or list of patterns, as understood by
+            :py:func:`pyrocko.util.match_nslc` or ``None``
+
+        :returns: set of absolute paths
+        '''
+
+        conds = []
+        args = []
+        if tmin is not None:
+            conds.append('traces.tmax >= ?')
+            args.append(float(tmin))
+
+        if tmax is not None:
+            conds.append('traces.tmin <= ?')
+            args.append(float(tmax))
+
+        sql = '''
+            SELECT DISTINCT files.path,
+                traces.network, traces.station, traces.location,
+                traces.channel
+            FROM traces JOIN files ON traces.file_id = files.file_id
+        '''
+
+        if conds:
+            sql += ' WHERE ' + ' AND '.join(conds)
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+
+        selected = set()
+        matches = {}
+        for row in rows:
+            abspath, nslc = row[0], row[1:]
+            if nslc_patterns is not None:
+                if nslc not in matches:
+                    matches[nslc] = util.match_nslc(nslc_patterns, nslc)
+
+                if not matches[nslc]:
+                    continue
+
+            selected.add(abspath)
+
+        return selected
+
+    def dump_modified(self):
+        '''Commit any modifications to disk.'''
+
+        with self._lock:
+            self._conn.commit()
+
+    def clean(self):
+        '''Weed out missing files from the index.'''
+
+        self.dump_modified()
+        with self._lock:
+            missing = [
+                abspath for (abspath,) in self._conn.execute(
+                    'SELECT path FROM files')
+                if not os.path.isfile(abspath)]
+
+            for abspath in missing:
+                self._delete(abspath)
+
+        self.dump_modified()
+
+
+def get_index(cachedir):
+    '''Get global TracesFileIndex object for given directory.'''
+    if cachedir not in TracesFileIndex.indexes:
+        TracesFileIndex.indexes[cachedir] = TracesFileIndex(cachedir)
+
+    return TracesFileIndex.indexes[cachedir]
+
+
+def _tfile_selected(tfile, tmin, tmax, nslc_patterns):
+    if (tmin is not None or tmax is not None) and not tfile.is_relevant(
+            tmin if tmin is not None else tfile.tmin,
+            tmax if tmax is not None else tfile.tmax):
+        return False
+
+    if nslc_patterns is not None and not any(
+            util.match_nslc(nslc_patterns, nslc)
+            for nslc in tfile.nslc_ids):
+        return False
+
+    return True
+
+
+def iload_headers(abspath, format, substitutions=None):
+    '''Read trace metainformation from file, skipping duplicate snippets.'''
+
+    def kgen(tr):
+        return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
+
+    ks = set()
+    for tr in io.load(abspath,
+                      format=format,
+                      getdata=False,
+                      substitutions=substitutions):
+
+        k = kgen(tr)
+        if k not in ks:
+            ks.add(k)
+            yield tr
+
+
+def _scan_headers(abspath, format, substitutions):
+    # worker function for parallel header scanning, errors are passed back
+    # as strings to not abort the other jobs
+    try:
+        return list(iload_headers(abspath, format, substitutions)), None
+    except (io.FileLoadError, OSError) as e:
+        return None, str(e)
+
+
 def loader(
         filenames, fileformat, cache, filename_attributes,
-        show_progress=True, update_progress=None):
+        show_progress=True, update_progress=None,
+        tmin=None, tmax=None, nslc_patterns=None, nworkers=1):
 
     if show_progress_force_off:
         show_progress = False
@@ -353,10 +811,17 @@ def loader(
     if filename_attributes:
         regex = re.compile(filename_attributes)
 
+    want_selection = not (tmin is None and tmax is None and
+                          nslc_patterns is None)
+
+    selected = None
+    if want_selection and isinstance(cache, TracesFileIndex):
+        selected = cache.select(tmin, tmax, nslc_patterns)
+
     progress = Progress('Looking at files', len(filenames))
 
     failures = []
-    to_load = []
+    candidates = []
     for i, filename in enumerate(filenames):
         try:
             abspath = os.path.abspath(filename)
@@ -375,17 +840,7 @@ def loader(
                         substitutions[k] = m.groupdict()[k]
 
             mtime = os.stat(filename)[8]
-            tfile = None
-            if cache:
-                tfile = cache.get(abspath)
-
-            mustload = (
-                not tfile or
-                (tfile.format != fileformat and fileformat != 'detect') or
-                tfile.mtime != mtime or
-                substitutions is not None)
-
-            to_load.append((mustload, mtime, abspath, substitutions, tfile))
+            candidates.append((abspath, mtime, substitutions))
 
         except (OSError, FilenameAttributeError) as xerror:
             failures.append(abspath)
@@ -398,6 +853,39 @@ def loader(
 
     progress.update(len(filenames))
 
+    # cache entries are looked up in bulk, not file by file
+    stamps = {}
+    if selected is not None:
+        stamps = cache.get_stamps(
+            abspath for (abspath, _, substitutions) in candidates
+            if abspath not in selected and substitutions is None)
+
+    to_look_up = []
+    for (abspath, mtime, substitutions) in candidates:
+        stamp = stamps.get(abspath, None)
+        if stamp is not None and stamp[1] == mtime and (
+                stamp[0] == fileformat or fileformat == 'detect'):
+
+            # file is known, unchanged and not wanted
+            continue
+
+        to_look_up.append((abspath, mtime, substitutions))
+
+    tfiles = {}
+    if cache:
+        tfiles = cache.get_many(abspath for (abspath, _, _) in to_look_up)
+
+    to_load = []
+    for (abspath, mtime, substitutions) in to_look_up:
+        tfile = tfiles.get(abspath, None)
+        mustload = (
+            not tfile or
+            (tfile.format != fileformat and fileformat != 'detect') or
+            tfile.mtime != mtime or
+            substitutions is not None)
+
+        to_load.append((mustload, mtime, abspath, substitutions, tfile))
+
     to_load.sort(key=lambda x: x[2])
 
     nload = len([1 for x in to_load if x[0]])
@@ -408,16 +896,37 @@ def loader(
         nload = len(to_load)
         count_all = True
 
+    scanned = None
+    if nworkers != 1 and any(x[0] for x in to_load):
+        from .parimap import parimap
+        jobs = [x for x in to_load if x[0]]
+        scanned = parimap(
+            _scan_headers,
+            [x[2] for x in jobs],
+            [fileformat] * len(jobs),
+            [x[3] for x in jobs],
+            nprocs=nworkers)
+
     if to_load:
         progress = Progress('Scanning files', nload)
 
         for (mustload, mtime, abspath, substitutions, tfile) in to_load:
             try:
-                if mustload:
+                if mustload and scanned is not None:
+                    traces, error = next(scanned)
+                    if error is not None:
+                        raise io.FileLoadError(error)
+
+                    tfile = TracesFile.from_traces(
+                        None, abspath, fileformat, traces, mtime,
+                        substitutions=substitutions)
+
+                elif mustload:
                     tfile = TracesFile(
                         None, abspath, fileformat,
                         substitutions=substitutions, mtime=mtime)
 
+                if mustload:
                     if cache and not substitutions:
                         cache.put(abspath, tfile)
 
@@ -431,12 +940,17 @@ def loader(
                 failures.append(abspath)
                 logger.warning(xerror)
             else:
-                yield tfile
+                if not want_selection or _tfile_selected(
+                        tfile, tmin, tmax, nslc_patterns):
+                    yield tfile
 
             abort = progress.update(iload+1)
             if abort:
                 break
 
+        if scanned is not None:
+            scanned.close()
+
         progress.update(nload)
 
     if failures:
@@ -663,6 +1177,9 @@ class MemTracesFile(TracesGroup):
     def load_data(self):
         pass
 
+    def can_load_partial(self):
+        return False
+
     def use_data(self):
         pass
 
@@ -703,6 +1220,10 @@ class MemTracesFile(TracesGroup):
 
 
 class TracesFile(TracesGroup):
+
+    _records = None
+    _prefetched = None
+
     def __init__(
             self, parent, abspath, format,
             substitutions=None, mtime=None):
@@ -717,26 +1238,44 @@ class TracesFile(TracesGroup):
         self.load_headers(mtime=mtime)
         self.mtime = mtime
 
+    @classmethod
+    def from_traces(
+            cls, parent, abspath, format, traces, mtime,
+            substitutions=None):
+
+        '''Create file object from known trace metainformation.
+
+        The file itself is not accessed. Used to restore file objects from
+        :py:class:`TracesFileIndex`.
+        '''
+
+        tfile = cls.__new__(cls)
+        TracesGroup.__init__(tfile, parent)
+        tfile.abspath = abspath
+        tfile.format = format
+        tfile.traces = traces
+        tfile.data_loaded = False
+        tfile.data_use_count = 0
+        tfile.substitutions = substitutions
+        for tr in traces:
+            tr.file = tfile
+
+        tfile.add(traces)
+        tfile.mtime = mtime
+        return tfile
+
     def load_headers(self, mtime=None):
         logger.debug('loading headers from file: %s' % self.abspath)
         if mtime is None:
             self.mtime = os.stat(self.abspath)[8]
 
-        def kgen(tr):
-            return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
-
         self.remove(self.traces)
-        ks = set()
-        for tr in io.load(self.abspath,
-                          format=self.format,
-                          getdata=False,
-                          substitutions=self.substitutions):
+        self._records = None
+        for tr in iload_headers(
+                self.abspath, self.format, self.substitutions):
 
-            k = kgen(tr)
-            if k not in ks:
-                ks.add(k)
-                self.traces.append(tr)
-                tr.file = self
+            self.traces.append(tr)
+            tr.file = self
 
         self.add(self.traces)
 
@@ -745,24 +1284,22 @@ class TracesFile(TracesGroup):
 
     def load_data(self, force=False):
         file_changed = False
-        if not self.data_loaded or force:
-            logger.debug('loading data from file: %s' % self.abspath)
+        if self.data_loaded and not force:
+            get_data_cache().hit(self)
 
+        else:
             def kgen(tr):
                 return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
 
-            traces_ = io.load(self.abspath, format=self.format, getdata=True,
-                              substitutions=self.substitutions)
-
-            # prevent adding duplicate snippets from corrupt mseed files
-            k_loaded = set()
-            traces = []
-            for tr in traces_:
-                k = kgen(tr)
-                if k not in k_loaded:
-                    k_loaded.add(k)
-                    traces.append(tr)
+            traces = self._prefetched
+            self._prefetched = None
+            if traces is None or force:
+                traces = self.read_data()
+            else:
+                logger.debug('using prefetched data of file: %s' %
+                             self.abspath)
 
+            k_loaded = set(kgen(tr) for tr in traces)
             k_current_d = dict((kgen(tr), tr) for tr in self.traces)
             k_current = set(k_current_d)
             k_new = k_loaded - k_current
@@ -789,12 +1326,108 @@ class TracesFile(TracesGroup):
                     ctr.ydata = tr.ydata
 
             self.data_loaded = True
+            get_data_cache().add(self, self.data_nbytes())
 
         if file_changed:
             logger.debug('reloaded (file may have changed): %s' % self.abspath)
 
         return file_changed
 
+    def read_data(self):
+        '''Read and decode the traces of the file.
+
+        The state of the file object is not modified, so this method may be
+        called from a background thread.
+        '''
+
+        logger.debug('loading data from file: %s' % self.abspath)
+
+        def kgen(tr):
+            return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
+
+        traces_ = io.load(self.abspath, format=self.format, getdata=True,
+                          substitutions=self.substitutions)
+
+        # prevent adding duplicate snippets from corrupt mseed files
+        k_loaded = set()
+        traces = []
+        for tr in traces_:
+            k = kgen(tr)
+            if k not in k_loaded:
+                k_loaded.add(k)
+                traces.append(tr)
+
+        return traces
+
+    def prefetch_data(self):
+        '''Read data to be picked up by the next :py:meth:`load_data` call.
+
+        Returns size of the prefetched data in bytes.
+        '''
+
+        if self.data_loaded or self._prefetched is not None:
+            return 0
+
+        traces = self.read_data()
+        self._prefetched = traces
+        return sum(tr.ydata.nbytes for tr in traces if tr.ydata is not None)
+
+    def can_load_partial(self):
+        '''Check if data of this file can be loaded record by record.'''
+
+        return self.format == 'mseed' and not self.substitutions
+
+    def _get_records(self):
+        if self._records is None:
+            from .io import mseed
+            records = {}
+            for (nslc, tmin, tmax, offset, reclen) in mseed.get_records(
+                    self.abspath):
+
+                if nslc not in records:
+                    records[nslc] = []
+
+                records[nslc].append((tmin, tmax, offset, reclen))
+
+            self._records = records
+
+        return self._records
+
+    def load_data_partial(self, tmin, tmax, nslc_ids=None):
+        '''Load data overlapping a time span, decoding only needed records.
+
+        The data of the file is not attached to the file's traces. Instead,
+        new traces holding only the decoded records are returned. The record
+        index of the file is read on first use and kept with the file.
+
+        :param tmin: start time
+        :param tmax: end time
+        :param nslc_ids: if given, restrict to traces with these codes
+        :returns: list of :py:class:`pyrocko.trace.Trace` objects
+        '''
+
+        logger.debug('loading partial data from file: %s' % self.abspath)
+
+        selected = []
+        for nslc, records in self._get_records().items():
+            if nslc_ids is not None and nslc not in nslc_ids:
+                continue
+
+            for (rtmin, rtmax, offset, reclen) in records:
+                if rtmax >= tmin and rtmin <= tmax:
+                    selected.append((offset, reclen))
+
+        if not selected:
+            return []
+
+        from .io import mseed
+        selected.sort()
+        traces = list(mseed.iload_records(self.abspath, selected))
+        for tr in traces:
+            tr.set_mtime(self.mtime)
+
+        return traces
+
     def use_data(self):
         if not self.data_loaded:
             raise Exception('Data not loaded')
@@ -802,17 +1435,34 @@ class TracesFile(TracesGroup):
 
     def drop_data(self):
         if self.data_loaded:
-            if self.data_use_count == 1:
-                logger.debug('forgetting data of file: %s' % self.abspath)
-                for tr in self.traces:
-                    tr.drop_data()
-
-                self.data_loaded = False
+            data_cache = get_data_cache()
+            if self.data_use_count == 1 and not data_cache.keeps_unused():
+                self.unload_data()
 
             self.data_use_count -= 1
+            if self.data_use_count <= 0:
+                data_cache.evict()
         else:
             self.data_use_count = 0
 
+    def unload_data(self):
+        '''Release loaded data, regardless of the use count.'''
+
+        if self.data_loaded:
+            logger.debug('forgetting data of file: %s' % self.abspath)
+            for tr in self.traces:
+                tr.drop_data()
+
+            self.data_loaded = False
+
+        get_data_cache().remove(self)
+
+    def data_nbytes(self):
+        '''Get size of the loaded sample arrays in bytes.'''
+
+        return sum(
+            tr.ydata.nbytes for tr in self.traces if tr.ydata is not None)
+
     def reload_if_modified(self):
         mtime = os.stat(self.abspath)[8]
         if mtime != self.mtime:
@@ -820,6 +1470,7 @@ class TracesFile(TracesGroup):
                 'mtime=%i, reloading file: %s' % (mtime, self.abspath))
 
             self.mtime = mtime
+            self._records = None
             if self.data_loaded:
                 self.load_data(force=True)
             else:
@@ -903,8 +1554,10 @@ class SubPile(TracesGroup):
 
             must_drop = False
             if load_data:
-                file.load_data()
-                file.use_data()
+                with get_data_cache().hold():
+                    file.load_data()
+                    file.use_data()
+
                 must_drop = True
 
             for tr in file.iter_traces():
@@ -943,6 +1596,84 @@ class SubPile(TracesGroup):
         return s
 
 
+class Prefetcher(object):
+    '''Background thread reading file data ahead of a consumer.
+
+    Files handed to :py:meth:`put` are read with
+    :py:meth:`TracesFile.prefetch_data` in a background thread. The data is
+    picked up by the next call of :py:meth:`TracesFile.load_data` on the
+    same file. When ``max_bytes`` is given, the thread pauses while more
+    than this amount of prefetched data is waiting to be picked up.
+    '''
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, files):
+        for file in files:
+            self._queue.put(file)
+
+    def _nbytes_pending(self):
+        for file in list(self._pending.keys()):
+            if file._prefetched is None:
+                del self._pending[file]
+
+        return sum(self._pending.values())
+
+    def notify(self):
+        '''Wake up the thread to re-check the memory limit.'''
+
+        with self._cond:
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            file = self._queue.get()
+            if file is None:
+                break
+
+            with self._cond:
+                while not self._closed and self._max_bytes is not None \
+                        and self._nbytes_pending() > self._max_bytes:
+
+                    self._cond.wait()
+
+                if self._closed:
+                    break
+
+            try:
+                nbytes = file.prefetch_data()
+            except (io.FileLoadError, OSError) as e:
+                # error is raised again when the consumer loads the file
+                logger.debug('prefetching failed: %s' % e)
+                continue
+
+            if nbytes:
+                with self._cond:
+                    self._pending[file] = nbytes
+
+    def close(self):
+        '''Stop the thread and discard data which has not been picked up.'''
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+        self._queue.put(None)
+        self._thread.join()
+        for file in self._pending:
+            file._prefetched = None
+
+        self._pending = {}
+
+
 class Pile(TracesGroup):
     '''Waveform archive lookup, data loading and caching infrastructure.'''
 
@@ -968,12 +1699,41 @@ class Pile(TracesGroup):
             fileformat='mseed',
             cache=None,
             show_progress=True,
-            update_progress=None):
+            update_progress=None,
+            tmin=None,
+            tmax=None,
+            nslc_patterns=None,
+            nworkers=1):
+
+        '''Load files into the pile.
+
+        :param filenames: list of file paths
+        :param filename_attributes: regular expression with named groups
+            ``network``, ``station``, ``location``, ``channel`` to override
+            trace codes with values extracted from the filenames
+        :param fileformat: format of the files
+        :param cache: :py:class:`TracesFileIndex` or
+            :py:class:`TracesFileCache` object or ``None``
+        :param show_progress: show progress bar
+        :param update_progress: progress callback
+        :param tmin: if given, only add files with data after this time
+        :param tmax: if given, only add files with data before this time
+        :param nslc_patterns: if given, only add files with traces matching
+            any of these patterns (see :py:func:`pyrocko.util.match_nslc`)
+        :param nworkers: number of processes to use for reading headers of
+            new or modified files (``None`` to use all cores)
+
+        When time span or code selections are given and ``cache`` is a
+        :py:class:`TracesFileIndex`, files known to be irrelevant are skipped
+        without loading their metainformation.
+        '''
 
         load = loader(
             filenames, fileformat, cache, filename_attributes,
             show_progress=show_progress,
-            update_progress=update_progress)
+            update_progress=update_progress,
+            tmin=tmin, tmax=tmax, nslc_patterns=nslc_patterns,
+            nworkers=nworkers)
 
         self.add_files(load)
 
@@ -1038,16 +1798,36 @@ class Pile(TracesGroup):
             trace_selector=None,
             snap=(round, round),
             include_last=False,
-            load_data=True):
+            load_data=True,
+            load_partial=False):
+
+        # data must not be evicted before all relevant files are chopped
+        with get_data_cache().hold():
+            return self._chop(
+                tmin, tmax, group_selector, trace_selector, snap,
+                include_last, load_data, load_partial)
+
+    def _chop(
+            self, tmin, tmax, group_selector, trace_selector, snap,
+            include_last, load_data, load_partial):
 
         chopped = []
         used_files = set()
+        partial_files = set()
 
         traces = self.relevant(tmin, tmax, group_selector, trace_selector)
         if load_data:
             files_changed = False
             for tr in traces:
-                if tr.file and tr.file not in used_files:
+                if tr.file and tr.file not in used_files \
+                        and tr.file not in partial_files:
+
+                    if load_partial and not tr.file.data_loaded \
+                            and tr.file.can_load_partial():
+
+                        partial_files.add(tr.file)
+                        continue
+
                     if tr.file.load_data():
                         files_changed = True
 
@@ -1058,6 +1838,20 @@ class Pile(TracesGroup):
                 traces = self.relevant(
                     tmin, tmax, group_selector, trace_selector)
 
+            if partial_files:
+                file_nslc_ids = {}
+                for tr in traces:
+                    if tr.file in partial_files:
+                        file_nslc_ids.setdefault(
+                            tr.file, set()).add(tr.nslc_id)
+
+                traces = [tr for tr in traces if tr.file not in partial_files]
+                for file in partial_files:
+                    traces.extend(
+                        tr for tr in file.load_data_partial(
+                            tmin, tmax, file_nslc_ids.get(file, set()))
+                        if trace_selector is None or trace_selector(tr))
+
         for tr in traces:
             if not load_data and tr.ydata is not None:
                 tr = tr.copy(data=False)
@@ -1116,7 +1910,8 @@ class Pile(TracesGroup):
             group_selector=None, trace_selector=None,
             want_incomplete=True, degap=True, maxgap=5, maxlap=None,
             keep_current_files_open=False, accessor_id=None,
-            snap=(round, round), include_last=False, load_data=True):
+            snap=(round, round), include_last=False, load_data=True,
+            load_partial=False, prefetch=0, prefetch_max_bytes=None):
 
         '''
         Get iterator for shifting window wise data extraction from waveform
@@ -1152,6 +1947,14 @@ class Pile(TracesGroup):
         :param load_data: whether to load the waveform data. If set to
             ``False``, traces with no data samples, but with correct
             meta-information are returned
+        :param load_partial: if ``True``, only the records overlapping the
+            requested window are decoded from miniSEED files which are not
+            already loaded, instead of loading complete files
+        :param prefetch: number of windows for which the file data is read
+            ahead in a background thread, while the consumer is processing
+            the current window
+        :param prefetch_max_bytes: limit on the amount of data read ahead
+            and not yet used
         :returns: itererator yielding a list of :py:class:`pyrocko.trace.Trace`
             objects for every extracted time window
         '''
@@ -1178,38 +1981,80 @@ class Pile(TracesGroup):
 
         open_files = self.open_files[accessor_id]
 
+        prefetcher = None
+        if prefetch and load_data:
+            prefetcher = Prefetcher(prefetch_max_bytes)
+
+        eps = tinc*1e-6
+
+        def window(iwin):
+            return tmin+iwin*tinc, min(tmin+(iwin+1)*tinc, tmax)
+
         iwin = 0
-        while True:
-            chopped = []
-            wmin, wmax = tmin+iwin*tinc, min(tmin+(iwin+1)*tinc, tmax)
-            eps = tinc*1e-6
-            if wmin >= tmax-eps:
-                break
+        iwin_prefetched = 0
+        prefetched_files = set()
+        try:
+            while True:
+                chopped = []
+                wmin, wmax = window(iwin)
+                if wmin >= tmax-eps:
+                    break
 
-            chopped, used_files = self.chop(
-                wmin-tpad, wmax+tpad, group_selector, trace_selector, snap,
-                include_last, load_data)
+                if prefetcher is not None:
+                    while iwin_prefetched <= iwin + prefetch:
+                        pmin, pmax = window(iwin_prefetched)
+                        if pmin >= tmax-eps:
+                            break
 
-            for file in used_files - open_files:
-                # increment datause counter on newly opened files
-                file.use_data()
+                        files = set(
+                            tr.file for tr in self.relevant(
+                                pmin-tpad, pmax+tpad, group_selector,
+                                trace_selector)
+                            if tr.file is not None and not (
+                                load_partial and tr.file.can_load_partial()))
 
-            open_files.update(used_files)
+                        prefetcher.put(sorted(
+                            files - prefetched_files,
+                            key=lambda file: file.tmin))
 
-            processed = self._process_chopped(
-                chopped, degap, maxgap, maxlap, want_incomplete, wmax, wmin,
-                tpad)
+                        prefetched_files.update(files)
+                        iwin_prefetched += 1
 
-            yield processed
+                # use counts must be taken before the cache may evict again,
+                # also when a single window exceeds the memory budget
+                with get_data_cache().hold():
+                    chopped, used_files = self._chop(
+                        wmin-tpad, wmax+tpad, group_selector, trace_selector,
+                        snap, include_last, load_data, load_partial)
 
-            unused_files = open_files - used_files
+                    for file in used_files - open_files:
+                        # increment datause counter on newly opened files
+                        file.use_data()
 
-            while unused_files:
-                file = unused_files.pop()
-                file.drop_data()
-                open_files.remove(file)
+                open_files.update(used_files)
+
+                processed = self._process_chopped(
+                    chopped, degap, maxgap, maxlap, want_incomplete, wmax,
+                    wmin, tpad)
+
+                if prefetcher is not None:
+                    prefetcher.notify()
+
+                yield processed
+
+                unused_files = open_files - used_files
+
+                while unused_files:
+                    file = unused_files.pop()
+                    file.drop_data()
+                    open_files.remove(file)
+                    prefetched_files.discard(file)
+
+                iwin += 1
 
-            iwin += 1
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
 
         if not keep_current_files_open:
             while open_files:
@@ -1383,7 +2228,8 @@ class Pile(TracesGroup):
 def make_pile(
         paths=None, selector=None, regex=None,
         fileformat='mseed',
-        cachedirname=None, show_progress=True):
+        cachedirname=None, show_progress=True,
+        tmin=None, tmax=None, nslc_patterns=None, nworkers=1):
 
     '''Create pile from given file and directory names.
 
@@ -1398,6 +2244,15 @@ def make_pile(
     :param cachedirname: loader cache is stored under this directory. It is
         created as neccessary.
     :param show_progress: show progress bar and other progress information
+    :param tmin: if given, only include files with data after this time
+    :param tmax: if given, only include files with data before this time
+    :param nslc_patterns: if given, only include files with traces matching
+        any of these patterns (see :py:func:`pyrocko.util.match_nslc`)
+    :param nworkers: number of processes to use for reading headers of new or
+        modified files (``None`` to use all cores)
+
+    Trace metainformation is kept in a persistent
+    :py:class:`TracesFileIndex` in ``cachedirname``.
     '''
 
     if show_progress_force_off:
@@ -1415,13 +2270,15 @@ def make_pile(
     fns = util.select_files(
         paths, selector, regex, show_progress=show_progress)
 
-    cache = get_cache(cachedirname)
+    cache = get_index(cachedirname)
     p = Pile()
     p.load_files(
         sorted(fns),
         cache=cache,
         fileformat=fileformat,
-        show_progress=show_progress)
+        show_progress=show_progress,
+        tmin=tmin, tmax=tmax, nslc_patterns=nslc_patterns,
+        nworkers=nworkers)
 
     return p
 
@@ -4,10 +4,14 @@
 # ---|P------/S----------~Lg----------
 from __future__ import division
 from builtins import range
+import os
 import struct
 import logging
 import numpy as num
 
+from pyrocko.parimap import parimap
+from pyrocko import spit_ext
+
 logger = logging.getLogger('pyrocko.spit')
 
 or_ = num.logical_or
@@ -21,6 +25,10 @@ class OutOfBounds(Exception):
     pass
 
 
+class SPTreeError(Exception):
+    pass
+
+
 class Cell(object):
     def __init__(self, tree, index, f=None):
         self.tree = tree
@@ -203,7 +211,8 @@ def bread(f, fmt):
 class SPTree(object):
 
     def __init__(self, f=None, ftol=None, xbounds=None, xtols=None,
-                 filename=None, addargs=()):
+                 filename=None, addargs=(), nworkers=1,
+                 checkpoint_filename=None):
 
         '''Create n-dimensional space partitioning interpolator.
 
@@ -212,8 +221,19 @@ class SPTree(object):
         :param xbounds: bounds of x, shape (n, 2)
         :param xtols: target coarsenesses in x, vector of size n
         :param addargs: additional arguments to pass to f
+        :param nworkers: number of worker processes used to evaluate f.
+            The new test points of each refinement step are evaluated in
+            one batch.
+        :param checkpoint_filename: if given, all evaluations of f are
+            appended to this file. Evaluations found in an existing
+            checkpoint file are reused, so that an interrupted construction
+            can be resumed.
         '''
 
+        self._root = None
+        self._records = None
+        self._links = None
+
         if filename is None:
             assert all(v is not None for v in (f, ftol, xbounds, xtols))
 
@@ -222,6 +242,7 @@ class SPTree(object):
             self.f_values = {}
             self.ncells = 0
             self.addargs = addargs
+            self.nworkers = nworkers
 
             self.xbounds = num.asarray(xbounds, dtype=num.float)
             assert self.xbounds.ndim == 2
@@ -252,24 +273,40 @@ class SPTree(object):
 
             self.nothing_found_yet = True
 
-            self.root = Cell(self, self.ones_int)
-            self.ncells += 1
-
-            self.fraction_bad = 0.0
-            self.nbad = 0
-            self.cells_to_continue = []
-            for clipdepth in range(0, num.max(self.maxdepths)+1):
-                self.clipdepth = clipdepth
-                self.tested = 0
-                if self.clipdepth == 0:
-                    self._fill(self.root)
-                else:
-                    self._continue_fill()
-
-                self.status()
-
-                if not self.cells_to_continue:
-                    break
+            self._checkpoint_file = None
+            try:
+                if checkpoint_filename is not None:
+                    self._open_checkpoint(checkpoint_filename)
+
+                self._prefetch(num.where(
+                    num.array(list(num.ndindex(*[2]*self.ndim))),
+                    self.xbounds[:, 1], self.xbounds[:, 0]))
+
+                self.root = Cell(self, self.ones_int)
+                self.ncells += 1
+
+                self.fraction_bad = 0.0
+                self.nbad = 0
+                self.cells_to_continue = []
+                self.cells_to_fill = []
+                for clipdepth in range(0, num.max(self.maxdepths)+1):
+                    self.clipdepth = clipdepth
+                    self.tested = 0
+                    if self.clipdepth == 0:
+                        self.cells_to_fill.append(self.root)
+                        self._fill_queued()
+                    else:
+                        self._continue_fill()
+
+                    self.status()
+
+                    if not self.cells_to_continue:
+                        break
+
+            finally:
+                if self._checkpoint_file is not None:
+                    self._checkpoint_file.close()
+                    self._checkpoint_file = None
 
         else:
             self._load(filename)
@@ -284,21 +321,79 @@ class SPTree(object):
         logger.info('at level %2i: %s covered, %6i cell%s' % (
             self.clipdepth, s, self.ncells, ['s', ''][self.ncells == 1]))
 
+    @property
+    def root(self):
+        if self._root is None and self._records is not None:
+            self._root = self._cells_from_records()
+
+        return self._root
+
+    @root.setter
+    def root(self, cell):
+        self._root = cell
+        self._records = None
+        self._links = None
+
     def __iter__(self):
         return iter(self.root)
 
     def __len__(self):
         return self.ncells
 
+    def _record_dtype(self):
+        return num.dtype([
+            ('index', '<i4', (self.ndim,)),
+            ('f', '<f8', (2**self.ndim,))])
+
+    def _get_records(self):
+        '''Get flat cell records in depth-first order, as stored in file.'''
+
+        if self._records is None:
+            dtype = self._record_dtype()
+            records = num.empty(self.ncells, dtype=dtype)
+            for icell, cell in enumerate(self._root):
+                records['index'][icell] = cell.index
+                records['f'][icell] = cell.f.ravel()
+
+            self._records = records.view(num.uint8).reshape(
+                (self.ncells, dtype.itemsize))
+
+        return self._records
+
+    def _get_links(self):
+        if self._links is None:
+            self._links = spit_ext.spit_link(self._get_records(), self.ndim)
+
+        return self._links
+
+    def _cells_from_records(self):
+        records = self._records.reshape(-1).view(self._record_dtype())
+        first_child, next_sibling = self._get_links()
+        cells = [
+            Cell(self, index, f.reshape([2]*self.ndim))
+            for (index, f) in zip(records['index'], records['f'])]
+
+        for icell, cell in enumerate(cells):
+            ichild = first_child[icell]
+            while ichild != -1:
+                cell.children.append(cells[ichild])
+                ichild = next_sibling[ichild]
+
+        return cells[0]
+
     def dump(self, filename):
-        with open(filename, 'wb') as file:
+        # write to temporary file first: the old file may be memory-mapped
+        fn_temp = filename + '.tmp'
+        with open(fn_temp, 'wb') as file:
             version = 1
             file.write(b'SPITREE ')
             file.write(struct.pack(
                 '<QQQd', version, self.ndim, self.ncells, self.ftol))
             self.xbounds.astype('<f8').tofile(file)
             self.xtols.astype('<f8').tofile(file)
-            self.root.dump(file)
+            self._get_records().tofile(file)
+
+        os.rename(fn_temp, filename)
 
     def _load(self, filename):
         with open(filename, 'rb') as file:
@@ -311,49 +406,131 @@ class SPTree(object):
             self.xtols = num.fromfile(
                 file, dtype='<f8', count=self.ndim)
 
-            path = []
-            for icell in range(self.ncells):
-                index = num.fromfile(
-                    file, dtype='<i4', count=self.ndim)
-                f = num.fromfile(
-                    file, dtype='<f8', count=2**self.ndim).reshape(
-                        [2]*self.ndim)
-
-                cell = Cell(self, index, f)
-                if not path:
-                    self.root = cell
-                    path.append(cell)
+            offset = file.tell()
 
-                else:
-                    while not any_(path[-1].index == (cell.index >> 1)):
-                        path.pop()
-
-                    path[-1].children.append(cell)
-                    path.append(cell)
+        self._records = num.memmap(
+            filename, dtype=num.uint8, mode='r', offset=offset,
+            shape=(self.ncells, self._record_dtype().itemsize))
 
     def _f_cached(self, x):
         return getset(
             self.f_values, tuple(float(xx) for xx in x), self.f, self.addargs)
 
+    def _open_checkpoint(self, filename):
+        header = struct.pack('<8sQd', b'SPITCKPT', self.ndim, self.ftol) \
+            + self.xbounds.astype('<f8').tobytes() \
+            + self.xtols.astype('<f8').tobytes()
+
+        if os.path.exists(filename):
+            with open(filename, 'rb') as file:
+                if file.read(len(header)) != header:
+                    raise SPTreeError(
+                        'checkpoint file does not match: %s' % filename)
+
+                values = num.fromfile(file, dtype='<f8')
+
+            nrows = values.size // (self.ndim + 1)
+            values = values[:nrows*(self.ndim+1)].reshape(
+                (nrows, self.ndim + 1))
+
+            for row in values:
+                self.f_values[tuple(float(xx) for xx in row[:-1])] = \
+                    float(row[-1])
+
+            logger.info('resuming from checkpoint with %i evaluations' % nrows)
+
+            self._checkpoint_file = open(filename, 'r+b')
+            self._checkpoint_file.seek(
+                len(header) + nrows*(self.ndim+1)*8)
+            self._checkpoint_file.truncate()
+
+        else:
+            self._checkpoint_file = open(filename, 'wb')
+            self._checkpoint_file.write(header)
+
+    def _prefetch(self, xs):
+        keys = []
+        seen = set()
+        for x in xs:
+            k = tuple(float(xx) for xx in x)
+            if k not in self.f_values and k not in seen:
+                seen.add(k)
+                keys.append(k)
+
+        if not keys:
+            return
+
+        if self.nworkers == 1:
+            values = [self.f(k, *self.addargs) for k in keys]
+        else:
+            chunksize = max(1, len(keys) // (self.nworkers * 4))
+            chunks = [
+                keys[i:i+chunksize] for i in range(0, len(keys), chunksize)]
+
+            values = []
+            for chunk_values in parimap(
+                    evaluate_many, chunks,
+                    nprocs=self.nworkers,
+                    pshared=dict(f=self.f, addargs=self.addargs)):
+
+                values.extend(chunk_values)
+
+        values = num.array(values, dtype=num.float)
+        for k, v in zip(keys, values):
+            self.f_values[k] = float(v)
+
+        if self._checkpoint_file is not None:
+            rows = num.empty((len(keys), self.ndim + 1))
+            rows[:, :-1] = keys
+            rows[:, -1] = values
+            rows.astype('<f8').tofile(self._checkpoint_file)
+            self._checkpoint_file.flush()
+
+    def _fill_queued(self):
+        while self.cells_to_fill:
+            cells, self.cells_to_fill = self.cells_to_fill, []
+            self._prefetch(num.concatenate([
+                num.sum(cell.xbounds * self.pointmaker_masked, axis=-1)
+                for cell in cells]))
+
+            for cell in cells:
+                self._fill(cell)
+
     def interpolate(self, x):
         x = num.asarray(x, dtype=num.float)
         assert x.ndim == 1 and x.size == self.ndim
         if not all_(and_(self.xbounds[:, 0] <= x, x <= self.xbounds[:, 1])):
             raise OutOfBounds()
 
-        return self.root.interpolate(x)
+        v = self.interpolate_many(x[num.newaxis, :])[0]
+        if num.isfinite(v):
+            return float(v)
+        else:
+            return None
 
     def __call__(self, x):
         return self.interpolate(x)
 
     def interpolate_many(self, x):
-        return self.root.interpolate_many(x)
+        '''Interpolate at many points.
+
+        :param x: points, array of shape ``(npoints, ndim)``
+        :returns: interpolated values, NaN where undefined or out of bounds
+        '''
+
+        first_child, next_sibling = self._get_links()
+        return spit_ext.spit_interpolate_many(
+            self._get_records(), first_child, next_sibling,
+            num.ascontiguousarray(self.xbounds, dtype=num.float),
+            num.ascontiguousarray(x, dtype=num.float))
 
     def _continue_fill(self):
         cells_to_continue, self.cells_to_continue = self.cells_to_continue, []
         for cell in cells_to_continue:
             self._deepen_cell(cell)
 
+        self._fill_queued()
+
     def _fill(self, cell):
 
         self.tested += 1
@@ -386,7 +563,7 @@ class SPTree(object):
                 for idim in range(self.ndim):
                     dimcorners = [slice(None, None, 2)] * self.ndim
                     dimcorners[idim] = 1
-                    if all_(works_full[dimcorners]):
+                    if all_(works_full[tuple(dimcorners)]):
                         deepen[idim] = 0
 
             if not any_(deepen):
@@ -418,7 +595,7 @@ class SPTree(object):
             child = Cell(self, index_child)
             self.ncells += 1
             cell.children.append(child)
-            self._fill(child)
+            self.cells_to_fill.append(child)
 
     def plot_2d(self, axes=None, x=None, dims=None):
         assert self.ndim >= 2
@@ -471,6 +648,12 @@ class SPTree(object):
             plt.show()
 
 
+def evaluate_many(xs, pshared):
+    f = pshared['f']
+    addargs = pshared['addargs']
+    return [f(x, *addargs) for x in xs]
+
+
 def getset(d, k, f, addargs):
     try:
         return d[k]
@@ -507,7 +690,6 @@ if __name__ == '__main__':
     tree = SPTree(f, 0.01, [[0., 1.], [0., 1.], [0., 1.]], [0.025, 0.05, 0.1])
 
     import tempfile
-    import os
     fid, fn = tempfile.mkstemp()
     tree.dump(fn)
     tree = SPTree(filename=fn)
@@ -14,6 +14,8 @@ import time
 import math
 import copy
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 import numpy as num
 from scipy import signal
@@ -1377,6 +1379,9 @@ class Trace(object):
         :param cut_off_fading: whether to cut off rise/fall interval in output
             trace.
         :param invert: set to True to do a deconvolution
+
+        The whole trace is transformed at once. For very long time series, see
+        :py:func:`co_transfer`.
         '''
 
         if transfer_function is None:
@@ -1821,6 +1826,68 @@ def minmaxtime(traces, key=None):
     return ranges
 
 
+def _degapper_join(ydata, merges, nsamples, fillmethod, deoverlap):
+    '''
+    Join sample arrays as planned by :py:func:`degapper`.
+
+    :param ydata: samples of the first trace of the chain
+    :param merges: list of ``(trace, idist)`` tuples for the traces to be
+        appended, ``idist`` being the offset in samples from the end of the
+        data accumulated so far
+    :param nsamples: number of samples of the joined array
+
+    :returns: joined array, allocated once
+    '''
+
+    out = num.empty(nsamples, dtype=ydata.dtype)
+    out[:ydata.size] = ydata
+    ipos = ydata.size
+    for b, idist in merges:
+        bdata = b.ydata
+        nb = bdata.size
+        if idist > 1:
+            if fillmethod == 'interpolate':
+                out[ipos:ipos+idist-1] = out[ipos-1] + (
+                    ((1.0 + num.arange(idist-1, dtype=num.float))
+                     / idist) * (bdata[0]-out[ipos-1])
+                ).astype(ydata.dtype)
+            elif fillmethod == 'zeros':
+                out[ipos:ipos+idist-1] = 0
+            else:
+                assert False, 'unknown fillmethod'
+
+            ipos += idist-1
+            out[ipos:ipos+nb] = bdata
+            ipos += nb
+
+        elif idist == 1:
+            out[ipos:ipos+nb] = bdata
+            ipos += nb
+
+        else:
+            n = -idist+1
+            if deoverlap == 'use_second':
+                out[ipos-n:ipos-n+nb] = bdata
+            elif deoverlap in ('use_first', 'crossfade_cos'):
+                out[ipos:ipos+nb-n] = bdata[n:]
+            elif deoverlap == 'add':
+                out[ipos-n:ipos] += bdata[:n]
+                out[ipos:ipos+nb-n] = bdata[n:]
+            else:
+                assert False, 'unknown deoverlap method'
+
+            if deoverlap == 'crossfade_cos':
+                taper = 0.5-0.5*num.cos(
+                    (1.+num.arange(n))/(1.+n)*num.pi)
+                out[ipos-n:ipos] *= 1.-taper
+                out[ipos-n:ipos] += bdata[:n] * taper
+
+            ipos += nb-n
+
+    assert ipos == nsamples
+    return out
+
+
 def degapper(
         traces,
         maxgap=5,
@@ -1835,7 +1902,12 @@ def degapper(
     station, location and channel attributes. Overlapping parts are handled
     according to the ``deoverlap`` argument.
 
-    :param traces: input traces, must be sorted by their full_id attribute.
+    The traces are first sorted by their full_id attribute. The output spans
+    are then determined in a single pass through the traces, before the data
+    of each connected output trace is copied into an array allocated only
+    once. The run time is linear in the total number of samples.
+
+    :param traces: input traces, should be sorted by their full_id attribute.
     :param maxgap: maximum number of samples to interpolate.
     :param fillmethod: what to put into the gaps: 'interpolate' or 'zeros'.
     :param deoverlap: how to handle overlaps: 'use_second' to use data from
@@ -1847,15 +1919,17 @@ def degapper(
     :returns:           list of traces
     '''
 
-    in_traces = traces
-    out_traces = []
+    in_traces = sorted(traces, key=lambda tr: tr.full_id)
     if not in_traces:
-        return out_traces
-    out_traces.append(in_traces.pop(0))
-    while in_traces:
+        return []
 
-        a = out_traces[-1]
-        b = in_traces.pop(0)
+    # chains of connected traces: [first trace, number of samples, merges]
+    chains = []
+    a = in_traces[0]
+    chains.append([a, a.data_len(), []])
+    for b in in_traces[1:]:
+        chain = chains[-1]
+        a, na, merges = chain
 
         avirt, bvirt = a.ydata is None, b.ydata is None
         assert avirt == bvirt, \
@@ -1863,83 +1937,268 @@ def degapper(
             'no data.'
 
         virtual = avirt and bvirt
+        nb = b.data_len()
 
         if (a.nslc_id == b.nslc_id and a.deltat == b.deltat
-                and a.data_len() >= 1 and b.data_len() >= 1
+                and na >= 1 and nb >= 1
                 and (virtual or a.ydata.dtype == b.ydata.dtype)):
 
-            dist = (b.tmin-(a.tmin+(a.data_len()-1)*a.deltat))/a.deltat
+            dist = (b.tmin-(a.tmin+(na-1)*a.deltat))/a.deltat
             idist = int(round(dist))
             if abs(dist - idist) > 0.05 and idist <= maxgap:
                 # logger.warning('Cannot degap traces with displaced sampling '
                 #                '(%s, %s, %s, %s)' % a.nslc_id)
                 pass
             else:
-                if 1 < idist <= maxgap:
-                    if not virtual:
-                        if fillmethod == 'interpolate':
-                            filler = a.ydata[-1] + (
-                                ((1.0 + num.arange(idist-1, dtype=num.float))
-                                 / idist) * (b.ydata[0]-a.ydata[-1])
-                            ).astype(a.ydata.dtype)
-                        elif fillmethod == 'zeros':
-                            filler = num.zeros(idist-1, dtype=a.ydist.dtype)
-                        a.ydata = num.concatenate((a.ydata, filler, b.ydata))
-                    a.tmax = b.tmax
-                    if a.mtime and b.mtime:
-                        a.mtime = max(a.mtime, b.mtime)
-                    continue
-
-                elif idist == 1:
-                    if not virtual:
-                        a.ydata = num.concatenate((a.ydata, b.ydata))
-                    a.tmax = b.tmax
-                    if a.mtime and b.mtime:
-                        a.mtime = max(a.mtime, b.mtime)
-                    continue
+                merge = False
+                if 1 < idist <= maxgap or idist == 1:
+                    merge = True
+                    na += idist-1 + nb
 
                 elif idist <= 0 and (maxlap is None or -maxlap < idist):
                     if b.tmax > a.tmax:
-                        if not virtual:
-                            na = a.ydata.size
-                            n = -idist+1
-                            if deoverlap == 'use_second':
-                                a.ydata = num.concatenate(
-                                    (a.ydata[:-n], b.ydata))
-                            elif deoverlap in ('use_first', 'crossfade_cos'):
-                                a.ydata = num.concatenate(
-                                    (a.ydata, b.ydata[n:]))
-                            elif deoverlap == 'add':
-                                a.ydata[-n:] += b.ydata[:n]
-                                a.ydata = num.concatenate(
-                                    (a.ydata, b.ydata[n:]))
-                            else:
-                                assert False, 'unknown deoverlap method'
-
-                            if deoverlap == 'crossfade_cos':
-                                n = -idist+1
-                                taper = 0.5-0.5*num.cos(
-                                    (1.+num.arange(n))/(1.+n)*num.pi)
-                                a.ydata[na-n:na] *= 1.-taper
-                                a.ydata[na-n:na] += b.ydata[:n] * taper
-
-                        a.tmax = b.tmax
-                        if a.mtime and b.mtime:
-                            a.mtime = max(a.mtime, b.mtime)
-                        continue
+                        merge = True
+                        na += nb - (-idist+1)
                     else:
                         # make short second trace vanish
                         continue
 
-        if b.data_len() >= 1:
-            out_traces.append(b)
+                if merge:
+                    merges.append((b, idist))
+                    a.tmax = b.tmax
+                    if a.mtime and b.mtime:
+                        a.mtime = max(a.mtime, b.mtime)
+
+                    chain[1] = a.data_len() if virtual else na
+                    continue
+
+        if nb >= 1:
+            chains.append([b, nb, []])
+
+    out_traces = []
+    for a, na, merges in chains:
+        if merges and a.ydata is not None:
+            a.ydata = _degapper_join(
+                a.ydata, merges, na, fillmethod, deoverlap)
 
-    for tr in out_traces:
-        tr._update_ids()
+        a._update_ids()
+        out_traces.append(a)
 
     return out_traces
 
 
+# minimum number of samples in a batch for which the ``*_many`` functions use
+# a thread pool
+batch_threading_min_size = 2**20
+
+
+def _batches(traces):
+    '''
+    Group traces with equal sampling interval and number of samples.
+
+    :returns: list of lists of indices into ``traces``
+    '''
+
+    groups = {}
+    keys = []
+    for i, tr in enumerate(traces):
+        k = (tr.deltat, tr.ydata.size)
+        if k not in groups:
+            groups[k] = []
+            keys.append(k)
+
+        groups[k].append(i)
+
+    return [groups[k] for k in keys]
+
+
+def _map_rows(func, data, nthreads):
+    '''
+    Apply function to blocks of rows of a 2D array, in threads if it is large.
+    '''
+
+    if nthreads == 0:
+        nthreads = multiprocessing.cpu_count()
+
+    nrows = data.shape[0]
+    nthreads = min(nthreads, nrows)
+    if nthreads <= 1 or data.size < batch_threading_min_size:
+        return func(data)
+
+    bounds = num.linspace(0, nrows, nthreads+1).astype(num.int)
+    pool = ThreadPool(nthreads)
+    try:
+        results = pool.map(
+            func, [data[ilo:ihi] for (ilo, ihi) in zip(bounds, bounds[1:])])
+    finally:
+        pool.close()
+        pool.join()
+
+    return num.vstack(results)
+
+
+def _lfilter_many(traces, order, corners, btype, demean, nthreads):
+    for indices in _batches(traces):
+        batch = [traces[i] for i in indices]
+        deltat = batch[0].deltat
+        (b, a) = _get_cached_filter_coefs(
+            order, [corner*2.0*deltat for corner in corners], btype=btype)
+
+        if btype != 'band' and (len(a) != order+1 or len(b) != order+1):
+            logger.warning(
+                'Erroneous filter coefficients returned by '
+                'scipy.signal.butter(). You may need to downsample the '
+                'signal before filtering.')
+
+        data = num.empty((len(batch), batch[0].ydata.size), dtype=num.float64)
+        for irow, tr in enumerate(batch):
+            data[irow] = tr.ydata
+
+        if demean:
+            data -= num.mean(data, axis=1)[:, num.newaxis]
+
+        data = _map_rows(
+            lambda x: signal.lfilter(b, a, x, axis=1), data, nthreads)
+
+        for tr, row in zip(batch, data):
+            tr.drop_growbuffer()
+            tr.ydata = row
+
+
+def lowpass_many(traces, order, corner, nyquist_warn=True,
+                 nyquist_exception=False, demean=True, nthreads=1):
+    '''
+    Apply Butterworth lowpass to many traces.
+
+    Batched version of :py:meth:`Trace.lowpass`. Traces with equal sampling
+    interval and number of samples are stacked into a 2D array and filtered
+    in one go. The data of the traces is replaced by rows of that array.
+
+    :param traces: list of :py:class:`Trace` objects
+    :param order: order of the filter
+    :param corner: corner frequency of the filter
+    :param nthreads: number of threads to use for large batches, ``0`` means
+        one per CPU
+
+    Mean is removed before filtering.
+    '''
+
+    for tr in traces:
+        tr.nyquist_check(
+            corner, 'Corner frequency of lowpass', nyquist_warn,
+            nyquist_exception)
+
+    _lfilter_many(traces, order, [corner], 'low', demean, nthreads)
+
+
+def highpass_many(traces, order, corner, nyquist_warn=True,
+                  nyquist_exception=False, demean=True, nthreads=1):
+    '''
+    Apply Butterworth highpass to many traces.
+
+    Batched version of :py:meth:`Trace.highpass`, see
+    :py:func:`lowpass_many`.
+    '''
+
+    for tr in traces:
+        tr.nyquist_check(
+            corner, 'Corner frequency of highpass', nyquist_warn,
+            nyquist_exception)
+
+    _lfilter_many(traces, order, [corner], 'high', demean, nthreads)
+
+
+def bandpass_many(traces, order, corner_hp, corner_lp, demean=True,
+                  nthreads=1):
+    '''
+    Apply Butterworth bandpass to many traces.
+
+    Batched version of :py:meth:`Trace.bandpass`, see
+    :py:func:`lowpass_many`.
+    '''
+
+    for tr in traces:
+        tr.nyquist_check(corner_hp, 'Lower corner frequency of bandpass')
+        tr.nyquist_check(corner_lp, 'Higher corner frequency of bandpass')
+
+    _lfilter_many(
+        traces, order, [corner_hp, corner_lp], 'band', demean, nthreads)
+
+
+def transfer_many(traces, tfade=0., freqlimits=None, transfer_function=None,
+                  cut_off_fading=True, invert=False, nthreads=1):
+    '''
+    Apply transfer function to many traces.
+
+    Batched version of :py:meth:`Trace.transfer`. Traces with equal sampling
+    interval and number of samples are padded into a 2D array, which is
+    transformed in one go. The tapered transfer function coefficients are
+    computed only once per batch.
+
+    :param traces: list of :py:class:`Trace` objects
+    :param nthreads: number of threads to use for large batches, ``0`` means
+        one per CPU
+
+    See :py:meth:`Trace.transfer` for the other arguments.
+
+    :returns: list of new :py:class:`Trace` objects
+    '''
+
+    if transfer_function is None:
+        transfer_function = FrequencyResponse()
+
+    for tr in traces:
+        if tr.tmax - tr.tmin <= tfade*2.:
+            raise TraceTooShort(
+                'Trace %s.%s.%s.%s too short for fading length setting. '
+                'trace length = %g, fading length = %g'
+                % (tr.nslc_id + (tr.tmax-tr.tmin, tfade)))
+
+    outputs = [None] * len(traces)
+    for indices in _batches(traces):
+        batch = [traces[i] for i in indices]
+        tr0 = batch[0]
+        ndata = tr0.ydata.size
+        ntrans = nextpow2(ndata*1.2)
+        coefs = tr0._get_tapered_coefs(
+            ntrans, freqlimits, transfer_function, invert=invert)
+
+        data_pad = num.zeros((len(batch), ntrans), dtype=num.float)
+        for irow, tr in enumerate(batch):
+            data_pad[irow, :ndata] = tr.ydata - tr.ydata.mean()
+
+        if tfade != 0.0:
+            data_pad[:, :ndata] *= costaper(
+                0., tfade, tr0.deltat*(ndata-1)-tfade, tr0.deltat*ndata,
+                ndata, tr0.deltat)
+
+        def work(x):
+            fdata = num.fft.rfft(x, axis=1)
+            fdata *= coefs
+            return num.ascontiguousarray(
+                num.fft.irfft(fdata, axis=1)[:, :ndata])
+
+        ddata = _map_rows(work, data_pad, nthreads)
+        del data_pad
+
+        for i, tr, row in zip(indices, batch, ddata):
+            output = tr.copy(data=False)
+            output.ydata = row
+            if cut_off_fading and tfade != 0.0:
+                try:
+                    output.chop(
+                        output.tmin+tfade, output.tmax-tfade, inplace=True)
+                except NoData:
+                    raise TraceTooShort(
+                        'Trace %s.%s.%s.%s too short for fading length '
+                        'setting. trace length = %g, fading length = %g'
+                        % (tr.nslc_id + (tr.tmax-tr.tmin, tfade)))
+
+            outputs[i] = output
+
+    return outputs
+
+
 def rotate(traces, azimuth, in_channels, out_channels):
     '''
     2D rotation of traces.
@@ -3355,6 +3614,578 @@ def co_downsample_to(target, deltat):
             g.close()
 
 
+class _OverlapSave(object):
+    '''
+    Streaming FIR convolution with the overlap-save method.
+
+    The filter is centered, i.e. the output sample ``j`` depends on the input
+    samples up to ``j + delay``. Before the first sample, the input is
+    continued with the value of the first sample, at the end with the value
+    of the last sample.
+    '''
+
+    def __init__(self, fir, delay, nfft):
+        self._nfir = fir.size
+        self._delay = delay
+        self._nfft = nfft
+        self._fir_f = num.fft.rfft(fir, nfft)
+        self._buf = None
+        self._last = None
+
+    def process(self, ydata):
+        x = num.asarray(ydata, dtype=num.float)
+        if x.size == 0:
+            return x
+
+        if self._buf is None:
+            self._buf = num.empty(self._nfir - 1 - self._delay)
+            self._buf.fill(x[0])
+
+        self._last = x[-1]
+
+        nfir, nfft = self._nfir, self._nfft
+        buf = num.concatenate((self._buf, x))
+        outs = []
+        ipos = 0
+        while buf.size - ipos >= nfir:
+            seg = buf[ipos:ipos+nfft]
+            nvalid = seg.size - nfir + 1
+            y = num.fft.irfft(num.fft.rfft(seg, nfft) * self._fir_f, nfft)
+            outs.append(y[nfir-1:nfir-1+nvalid])
+            ipos += nvalid
+
+        self._buf = buf[ipos:].copy()
+        if outs:
+            return num.concatenate(outs)
+        else:
+            return num.zeros(0)
+
+    def flush(self):
+        if self._buf is None or self._delay == 0:
+            return num.zeros(0)
+
+        x = num.empty(self._delay)
+        x.fill(self._last)
+        return self.process(x)
+
+
+def _transfer_fir(tr, tfilter, freqlimits, transfer_function, invert):
+    '''
+    Get windowed, centered FIR equivalent of a tapered transfer function.
+    '''
+
+    nfir = nextpow2(int(math.ceil(tfilter / tr.deltat)))
+    coefs = tr._get_tapered_coefs(
+        nfir, freqlimits, transfer_function, invert=invert)
+
+    fir = num.roll(num.fft.irfft(coefs, nfir), nfir//2)
+    fir *= costaper(
+        0., 0.1*nfir, 0.9*nfir, float(nfir), nfir, 1.0)
+
+    return fir, nfir//2
+
+
+@coroutine
+def co_transfer(target, transfer_function=None, freqlimits=None,
+                invert=False, tfilter=None, nfft=None):
+    '''
+    Successively apply transfer function to broken continuous trace data
+    (coroutine).
+
+    Streaming version of :py:meth:`Trace.transfer`. The tapered transfer
+    function is converted into a finite impulse response of duration
+    ``tfilter``, which is applied with the overlap-save method in blocks of
+    ``nfft`` samples. This way, the memory needed stays bounded, even for
+    very long time series, which are split into many successive traces (e.g.
+    the windows of :py:meth:`pyrocko.pile.Pile.chopper`). The output has no
+    artifacts at the boundaries between the input traces.
+
+    The output is delayed by half the filter length: each output trace covers
+    the time span of the input which has been seen before, minus
+    ``tfilter/2``. The remaining samples are sent when the coroutine is
+    closed or when a gap occurs. States are kept *per channel*, like for
+    :py:func:`co_lfilter`.
+
+    :param target: coroutine receiving the output :py:class:`Trace` objects
+    :param transfer_function: :py:class:`FrequencyResponse` object
+    :param freqlimits: 4-tuple with corner frequencies in Hz
+    :param invert: set to True to do a deconvolution
+    :param tfilter: duration of the impulse response in seconds, defaults to
+        ten times the period of the second corner frequency in
+        ``freqlimits``
+    :param nfft: FFT block size in samples, defaults to four times the
+        filter length
+
+    Use it like this::
+
+      from pyrocko.trace import co_transfer, co_list_append
+
+      restituted = []
+      pipe = co_transfer(
+          co_list_append(restituted), transfer_function=resp,
+          freqlimits=(0.005, 0.01, 20., 40.), invert=True)
+
+      for traces in p.chopper(tinc=3600.):
+          for trace in traces:
+              pipe.send(trace)
+
+      pipe.close()
+    '''
+
+    if transfer_function is None:
+        transfer_function = FrequencyResponse()
+
+    if tfilter is None:
+        if freqlimits is None:
+            raise ValueError('either freqlimits or tfilter must be given')
+
+        tfilter = 10.0 / freqlimits[1]
+
+    firs = {}
+    states = {}
+
+    def send(template, tmin, ydata):
+        if ydata.size:
+            output = template.copy(data=False)
+            output.tmin = tmin
+            output.set_ydata(ydata)
+            output._update_ids()
+            target.send(output)
+
+    def flush(k):
+        _, _, filt, tout, template = states.pop(k)
+        send(template, tout, filt.flush())
+
+    try:
+        while True:
+            tr = (yield)
+
+            k = tr.nslc_id
+            if k in states:
+                tnext, deltat, filt, tout, _ = states[k]
+                if not (near(tnext, tr.tmin, deltat/100.)
+                        and near(deltat, tr.deltat, deltat/10000.)):
+                    flush(k)
+
+            if k not in states:
+                if tr.deltat not in firs:
+                    firs[tr.deltat] = _transfer_fir(
+                        tr, tfilter, freqlimits, transfer_function, invert)
+
+                fir, delay = firs[tr.deltat]
+                filt = _OverlapSave(fir, delay, nfft or 4*fir.size)
+                tout = tr.tmin
+            else:
+                _, _, filt, tout, _ = states[k]
+
+            ydata = filt.process(tr.get_ydata())
+            template = tr.copy(data=False)
+            template.ydata = None
+            states[k] = (
+                tr.tmax + tr.deltat, tr.deltat, filt,
+                tout + ydata.size * tr.deltat, template)
+
+            send(template, tout, ydata)
+
+    except GeneratorExit:
+        for k in list(states.keys()):
+            flush(k)
+
+        target.close()
+
+
+@coroutine
+def co_butterworth(target, order, corners, btype):
+    '''
+    Successively apply Butterworth filter to broken continuous trace data
+    (coroutine).
+
+    Like :py:func:`co_lfilter`, but the filter coefficients are computed for
+    each sampling rate occuring in the input traces. ``corners`` is a list
+    with one (``btype='low'`` or ``'high'``) or two (``btype='band'``) corner
+    frequencies in Hz.
+    '''
+
+    filters = {}
+    try:
+        while True:
+            tr = (yield)
+            if tr.deltat not in filters:
+                (b, a) = _get_cached_filter_coefs(
+                    order, [corner*2.0*tr.deltat for corner in corners],
+                    btype=btype)
+
+                filters[tr.deltat] = co_lfilter(target, b, a)
+
+            filters[tr.deltat].send(tr)
+
+    except GeneratorExit:
+        for g in filters.values():
+            g.close()
+
+        target.close()
+
+
+@coroutine
+def co_demean(target, tmean):
+    '''
+    Successively remove running mean from broken continuous trace data
+    (coroutine).
+
+    The mean is estimated with an exponential moving average with time
+    constant ``tmean`` (in seconds), which is started at the value of the
+    first sample. This is the streaming counterpart of removing the mean or
+    trend of a trace before filtering. States are kept *per channel*, like
+    for :py:func:`co_lfilter`.
+    '''
+
+    try:
+        states = States()
+        while True:
+            tr = (yield)
+            ydata = tr.get_ydata().astype(num.float64)
+            c = math.exp(-tr.deltat / tmean)
+            zi = states.get(tr)
+            if zi is None:
+                zi = num.array([c * ydata[0]]) if ydata.size else num.zeros(1)
+
+            mean, zf = signal.lfilter([1.0 - c], [1.0, -c], ydata, zi=zi)
+            output = tr.copy(data=False)
+            output.set_ydata(ydata - mean)
+            states.set(tr, zf)
+            target.send(output)
+
+    except GeneratorExit:
+        target.close()
+
+
+@coroutine
+def co_sta_lta(target, tshort, tlong):
+    '''
+    Successively compute recursive STA/LTA of broken continuous trace data
+    (coroutine).
+
+    Short and long term averages of the squared signal are computed with
+    exponential moving averages with time constants ``tshort`` and
+    ``tlong``, both started at the energy of the first sample. The output
+    traces contain the ratio STA/LTA (zero where the LTA vanishes). States
+    are kept *per channel*, like for :py:func:`co_lfilter`.
+    '''
+
+    try:
+        states = States()
+        while True:
+            tr = (yield)
+            energy = tr.get_ydata().astype(num.float64)**2
+            cs = math.exp(-tr.deltat / tshort)
+            cl = math.exp(-tr.deltat / tlong)
+            zi = states.get(tr)
+            if zi is None:
+                e0 = energy[0] if energy.size else 0.0
+                zi = (num.array([cs * e0]), num.array([cl * e0]))
+
+            sta, zfs = signal.lfilter([1.0 - cs], [1.0, -cs], energy, zi=zi[0])
+            lta, zfl = signal.lfilter([1.0 - cl], [1.0, -cl], energy, zi=zi[1])
+            ratio = num.zeros(energy.size)
+            num.divide(sta, lta, out=ratio, where=lta > 0.0)
+
+            output = tr.copy(data=False)
+            output.set_ydata(ratio)
+            states.set(tr, (zfs, zfl))
+            target.send(output)
+
+    except GeneratorExit:
+        target.close()
+
+
+class StreamStage(object):
+    '''
+    Base class for the stages of a :py:class:`StreamPipeline`.
+
+    Subclasses implement :py:meth:`make_coroutine`, which should create a
+    coroutine taking :py:class:`Trace` objects, keeping its states *per
+    channel* and sending its output traces to ``target``. Each stage counts
+    the traces and samples it receives and the time spent processing them.
+    '''
+
+    def __init__(self):
+        self.reset_stats()
+
+    def make_coroutine(self, target):
+        raise NotImplementedError
+
+    def reset_stats(self):
+        self.ntraces = 0
+        self.nsamples = 0
+        self.tinclusive = 0.0
+
+    @property
+    def name(self):
+        return self.__class__.__name__
+
+
+class ButterworthStage(StreamStage):
+    '''
+    Butterworth filter stage, see :py:func:`co_butterworth`.
+
+    :param order: order of the filter
+    :param corner: corner frequency in Hz, for ``btype='band'`` a tuple
+        ``(corner_hp, corner_lp)``
+    :param btype: ``'low'``, ``'high'`` or ``'band'``
+    '''
+
+    def __init__(self, order, corner, btype='low'):
+        StreamStage.__init__(self)
+        if btype == 'band':
+            self._corners = list(corner)
+        else:
+            self._corners = [corner]
+
+        self._order = order
+        self._btype = btype
+
+    def make_coroutine(self, target):
+        return co_butterworth(
+            target, self._order, self._corners, self._btype)
+
+
+class DownsampleStage(StreamStage):
+    '''
+    Downsampling stage, see :py:func:`co_downsample_to`.
+
+    :param deltat: sampling interval of the output in seconds
+    '''
+
+    def __init__(self, deltat):
+        StreamStage.__init__(self)
+        self._deltat = deltat
+
+    def make_coroutine(self, target):
+        return co_downsample_to(target, self._deltat)
+
+
+class DemeanStage(StreamStage):
+    '''
+    Running mean removal stage, see :py:func:`co_demean`.
+
+    :param tmean: time constant of the moving average in seconds
+    '''
+
+    def __init__(self, tmean):
+        StreamStage.__init__(self)
+        self._tmean = tmean
+
+    def make_coroutine(self, target):
+        return co_demean(target, self._tmean)
+
+
+class TransferStage(StreamStage):
+    '''
+    Response removal or application stage, see :py:func:`co_transfer`.
+
+    The arguments are passed on to :py:func:`co_transfer`.
+    '''
+
+    def __init__(self, transfer_function=None, freqlimits=None, invert=False,
+                 tfilter=None, nfft=None):
+        StreamStage.__init__(self)
+        self._kwargs = dict(
+            transfer_function=transfer_function,
+            freqlimits=freqlimits,
+            invert=invert,
+            tfilter=tfilter,
+            nfft=nfft)
+
+    def make_coroutine(self, target):
+        return co_transfer(target, **self._kwargs)
+
+
+class StaLtaStage(StreamStage):
+    '''
+    Recursive STA/LTA stage, see :py:func:`co_sta_lta`.
+
+    :param tshort: time constant of the short term average in seconds
+    :param tlong: time constant of the long term average in seconds
+    '''
+
+    def __init__(self, tshort, tlong):
+        StreamStage.__init__(self)
+        self._tshort = tshort
+        self._tlong = tlong
+
+    def make_coroutine(self, target):
+        return co_sta_lta(target, self._tshort, self._tlong)
+
+
+@coroutine
+def _co_meter(target, stage):
+    try:
+        while True:
+            tr = (yield)
+            t0 = time.time()
+            target.send(tr)
+            stage.tinclusive += time.time() - t0
+            stage.ntraces += 1
+            stage.nsamples += tr.data_len()
+
+    except GeneratorExit:
+        t0 = time.time()
+        target.close()
+        stage.tinclusive += time.time() - t0
+
+
+class StreamPipeline(object):
+    '''
+    Chain of stateful processing stages for continuous trace data.
+
+    The traces sent through the pipeline may be successive pieces of long
+    continuous time series of many channels, as they are produced by
+    :py:meth:`pyrocko.pile.Pile.chopper` or by realtime acquisition. All
+    stages keep their states *per channel*, so that no artifacts are produced
+    at the boundaries between the pieces. States are reset when gaps occur.
+
+    :param stages: list of :py:class:`StreamStage` objects
+    :param target: optional callable, which is called with each output
+        trace
+
+    Use it like this::
+
+      from pyrocko import trace
+
+      pipeline = trace.StreamPipeline([
+          trace.DemeanStage(tmean=100.),
+          trace.ButterworthStage(order=4, corner=(1., 10.), btype='band'),
+          trace.DownsampleStage(deltat=0.05),
+          trace.StaLtaStage(tshort=1., tlong=30.)])
+
+      for traces in pipeline.chopper(p, tinc=3600.):
+          ...
+
+    With realtime acquisition, the pipeline can be registered as a listener
+    to a :py:class:`pyrocko.streaming.serial_hamster.SerialHamster`, or
+    :py:meth:`send` can be called from ``got_trace()``. Give
+    ``target=pile.insert_trace`` to feed the output into a
+    :py:class:`pyrocko.hamster_pile.HamsterPile`.
+    '''
+
+    def __init__(self, stages, target=None):
+        self._stages = list(stages)
+        self._target = target
+        self._outputs = []
+        self._pipe = None
+
+    @property
+    def stages(self):
+        return list(self._stages)
+
+    def _get_pipe(self):
+        if self._pipe is None:
+            pipe = co_list_append(self._outputs)
+            for stage in self._stages[::-1]:
+                pipe = _co_meter(stage.make_coroutine(pipe), stage)
+
+            self._pipe = pipe
+
+        return self._pipe
+
+    def _take_outputs(self):
+        outputs = self._outputs[:]
+        del self._outputs[:]
+        if self._target is not None:
+            for tr in outputs:
+                self._target(tr)
+
+        return outputs
+
+    def send(self, tr):
+        '''
+        Send trace through the pipeline.
+
+        :returns: list of output traces which have been completed
+        '''
+
+        self._get_pipe().send(tr)
+        return self._take_outputs()
+
+    def process(self, traces):
+        '''
+        Send traces through the pipeline.
+
+        :returns: list of output traces which have been completed
+        '''
+
+        pipe = self._get_pipe()
+        for tr in traces:
+            pipe.send(tr)
+
+        return self._take_outputs()
+
+    def insert_trace(self, tr):
+        self.send(tr)
+
+    def flush(self):
+        '''
+        Flush all stages and reset their states.
+
+        :returns: list of remaining output traces
+        '''
+
+        if self._pipe is not None:
+            self._pipe.close()
+            self._pipe = None
+
+        return self._take_outputs()
+
+    def chopper(self, pile, **kwargs):
+        '''
+        Process waveform archive window by window.
+
+        Iterates over :py:meth:`pyrocko.pile.Pile.chopper` with the given
+        arguments and yields the lists of output traces for each window. The
+        output which is held back by the stages is flushed and yielded at the
+        end. Padding cannot be used, because the windows have to be
+        contiguous.
+        '''
+
+        if kwargs.get('tpad', 0.):
+            raise ValueError('tpad must be zero')
+
+        for traces in pile.chopper(**kwargs):
+            yield self.process(traces)
+
+        yield self.flush()
+
+    def reset_stats(self):
+        for stage in self._stages:
+            stage.reset_stats()
+
+    def get_stats(self):
+        '''
+        Get throughput statistics of the stages.
+
+        :returns: list with one dict per stage with entries ``name``,
+            ``ntraces`` and ``nsamples`` (input counts), ``time``
+            (processing time in seconds, without the time spent in
+            subsequent stages) and ``rate`` (input samples per second)
+        '''
+
+        stats = []
+        for i, stage in enumerate(self._stages):
+            t = stage.tinclusive
+            if i + 1 < len(self._stages):
+                t -= self._stages[i+1].tinclusive
+
+            t = max(t, 0.0)
+            stats.append(dict(
+                name=stage.name,
+                ntraces=stage.ntraces,
+                nsamples=stage.nsamples,
+                time=t,
+                rate=stage.nsamples / t if t > 0.0 else None))
+
+        return stats
+
+
 class DomainChoice(StringChoice):
     choices = [
         'time_domain',
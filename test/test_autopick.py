@@ -0,0 +1,134 @@
+from __future__ import division, print_function, absolute_import
+import math
+import unittest
+import numpy as num
+
+from pyrocko import util, trace, autopick
+
+
+def recursive_stalta_ref(data, deltat, tshort, tlong, level_on, level_off):
+    cs = math.exp(-deltat / tshort)
+    cl = math.exp(-deltat / tlong)
+    sta = lta = data[0]**2
+    active = False
+    ion = 0
+    peak = 0.0
+    triggers = []
+    ratio = num.zeros(data.size)
+    for i, x in enumerate(data):
+        sta = cs*sta + (1.0-cs)*x**2
+        lta = cl*lta + (1.0-cl)*x**2
+        r = sta/lta if lta > 0.0 else 0.0
+        ratio[i] = r
+        if active:
+            peak = max(peak, r)
+            if r < level_off:
+                triggers.append((ion, i, peak))
+                active = False
+
+        elif r >= level_on:
+            active = True
+            ion = i
+            peak = r
+
+    return triggers, ratio
+
+
+def make_events_data(nchannels, nsamples, seed=0):
+    rstate = num.random.RandomState(seed)
+    data = rstate.normal(size=(nchannels, nsamples))
+    for ichannel in range(nchannels):
+        for ievent in range(rstate.randint(0, 5)):
+            i = rstate.randint(0, nsamples-300)
+            data[ichannel, i:i+200] *= rstate.uniform(3., 20.)
+
+    return data
+
+
+class AutopickTestCase(unittest.TestCase):
+
+    def test_recursive_stalta_many(self):
+        deltat = 0.01
+        tmin = 100.
+        args = (0.5, 10., 3., 1.5)
+        data = make_events_data(20, 10000)
+
+        for nparallel in (1, 4):
+            triggers, state, ratio = autopick.recursive_stalta_many(
+                data, deltat, *args, tmin=tmin, want_ratio=True,
+                nparallel=nparallel)
+
+            assert triggers.dtype == autopick.stalta_trigger_dtype
+            assert num.all(num.diff(triggers['tmin']) >= 0.)
+
+            nref = 0
+            for ichannel in range(data.shape[0]):
+                ref_triggers, ref_ratio = recursive_stalta_ref(
+                    data[ichannel], deltat, *args)
+
+                num.testing.assert_allclose(ratio[ichannel], ref_ratio)
+                trs = triggers[triggers['ichannel'] == ichannel]
+                assert len(trs) == len(ref_triggers)
+                for t, (ion, ioff, peak) in zip(trs, ref_triggers):
+                    assert abs(t['tmin'] - (tmin + ion*deltat)) < 1e-6
+                    assert abs(t['tmax'] - (tmin + ioff*deltat)) < 1e-6
+                    assert abs(t['peak'] - peak) < 1e-5 * peak
+
+                nref += len(ref_triggers)
+
+            assert nref == len(triggers) > 0
+
+    def test_stalta_detector(self):
+        deltat = 0.01
+        nchannels = 10
+        nsamples = 10000
+        args = (0.5, 10., 3., 1.5)
+        data = make_events_data(nchannels, nsamples, seed=1)
+        triggers_ref, _, _ = autopick.recursive_stalta_many(
+            data, deltat, *args)
+
+        detector = autopick.StaLtaDetector(*args)
+        triggers = []
+        for i in range(0, nsamples, 777):
+            triggers.append(detector.process([
+                trace.Trace(
+                    station='S%i' % ichannel, deltat=deltat, tmin=i*deltat,
+                    ydata=data[ichannel, i:i+777])
+                for ichannel in range(nchannels)]))
+
+        triggers.append(detector.finish())
+        triggers = num.concatenate(triggers)
+
+        ichannels = [
+            int(detector.nslc_ids[ichannel][1][1:])
+            for ichannel in triggers['ichannel']]
+
+        got = set(zip(ichannels, num.round(triggers['tmin'] / deltat)))
+        want = set(zip(
+            triggers_ref['ichannel'],
+            num.round(triggers_ref['tmin'] / deltat)))
+
+        # triggers still active at the end are added by finish()
+        assert want.issubset(got)
+        assert len(got - want) <= nchannels
+
+        # gap closes active trigger
+        detector = autopick.StaLtaDetector(*args)
+        y = num.ones(1000)
+        y[500:600] = 10.
+        triggers = detector.process([
+            trace.Trace(station='A', deltat=deltat, tmin=0., ydata=y[:550])])
+
+        assert len(triggers) == 0
+
+        triggers = detector.process([
+            trace.Trace(station='A', deltat=deltat, tmin=10., ydata=y[550:])])
+
+        assert len(triggers) == 1
+        assert abs(triggers[0]['tmax'] - 549*deltat) < 1e-6
+        assert len(detector.finish()) == 0
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_autopick', 'warning')
+    unittest.main()
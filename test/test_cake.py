@@ -2,6 +2,9 @@
 from __future__ import division, print_function, absolute_import
 from builtins import range
 
+import os
+import struct
+import tempfile
 import unittest
 import numpy as num
 from io import BytesIO
@@ -184,6 +187,99 @@ Phase definition "P<(cmb)(moho)pP<(cmb)(moho)p":
         assert abs(rays1[0].t - 915.9) < 0.1
         assert abs(rays2[0].t - 915.9) < 0.1
 
+    def test_arrivals_many(self):
+        mod = cake.load_model()
+        phases = cake.PhaseDef.classic('P') + cake.PhaseDef.classic('S') + \
+            cake.PhaseDef.classic('Pdiff')
+
+        distances = num.array([0., 5., 33.3, 70., 70., 120.])
+        zstarts = num.array([10*km, 0., 10*km, 25*km, 10*km, 500.])
+
+        irequests, iphases, ps, ts = mod.arrivals_many(
+            distances, zstarts, 0., phases)
+
+        assert num.all(num.diff(irequests) >= 0)
+
+        for irequest, (distance, zstart) in enumerate(
+                zip(distances, zstarts)):
+
+            for iphase, phase in enumerate(phases):
+                sel = num.logical_and(
+                    irequests == irequest, iphases == iphase)
+
+                rays = mod.arrivals(
+                    phases=phase, distances=[distance], zstart=zstart)
+
+                tref = sorted(set(round(ray.t, 6) for ray in rays))
+                t = sorted(set(num.round(ts[sel], 6)))
+                assert len(t) == len(tref)
+                assert num.all(num.abs(
+                    num.array(t) - num.array(tref)) < 1e-4)
+
+        _, _, _, ts_refined = mod.arrivals_many(
+            [70.], 10*km, 0., cake.PhaseDef('P'))
+        _, _, _, ts_unrefined = mod.arrivals_many(
+            [70.], 10*km, 0., cake.PhaseDef('P'), refine=False)
+
+        assert ts_refined.size == ts_unrefined.size == 1
+        assert abs(ts_refined[0] - ts_unrefined[0]) < 0.5
+
+    def test_traveltime_table(self):
+        mod = cake.load_model()
+        km = 1000.
+        ttt = cake.TravelTimeTable(
+            mod, 'P,S', zbounds=(0., 30*km), xbounds=(1., 10.),
+            ttol=0.1, zdelta_min=5*km, xdelta_min=0.1)
+
+        assert ttt.nphases == 2
+        assert ttt.terr <= 1.0
+
+        # near the lower distance bound, branches of S cross, which the
+        # table cannot resolve (see TravelTimeTable docs)
+        rstate = num.random.RandomState(123)
+        distances = rstate.uniform(2., 10., 50)
+        zstarts = rstate.uniform(0., 30*km, 50)
+
+        irequests, iphases, _, ts = mod.arrivals_many(
+            distances, zstarts, 0., 'P,S')
+
+        tref = num.empty((2, 50))
+        tref.fill(num.inf)
+        num.minimum.at(tref, (iphases, irequests), ts)
+
+        t = ttt.interpolate_many(distances, zstarts)
+        mask = num.logical_and(num.isfinite(t), num.isfinite(tref))
+        assert num.sum(mask) > 50
+        assert num.max(num.abs(t - tref)[mask]) <= ttt.ttol
+
+        tfirst = ttt.first_arrivals(distances, zstarts)
+        assert num.all(tfirst == num.nanmin(t, axis=0))
+
+        assert num.all(num.isnan(ttt.interpolate_many(
+            [0.5, 11.0], 10*km, 'P')))
+
+        fd, fn = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            ttt.dump(fn)
+            ttt2 = cake.TravelTimeTable(filename=fn)
+            assert ttt2.shape == ttt.shape
+            assert [pdef.definition() for pdef in ttt2.phases] == ['P', 'S']
+            t2 = ttt2.interpolate_many(distances, zstarts, cake.PhaseDef('S'))
+            assert num.array_equal(
+                t2[mask[1]], ttt.interpolate_many(
+                    distances, zstarts, phase=1)[mask[1]])
+
+            with open(fn, 'r+b') as f:
+                f.seek(8)
+                f.write(struct.pack('<Q', 2))
+
+            with self.assertRaises(cake.LayeredModelError):
+                cake.TravelTimeTable(filename=fn)
+
+        finally:
+            os.unlink(fn)
+
     def test_path(self):
         mod = cake.load_model()
         phase = cake.PhaseDef('P')
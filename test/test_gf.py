@@ -5,6 +5,7 @@ import time
 import sys
 import random
 import math
+import os
 import unittest
 import logging
 import numpy as num
@@ -12,7 +13,7 @@ import shutil
 from tempfile import mkdtemp
 
 from pyrocko import guts
-from pyrocko import gf, util, cake, ahfullgreen, trace
+from pyrocko import gf, util, cake, ahfullgreen, trace, spit, moment_tensor
 from pyrocko.fomosto import ahfullgreen as fomosto_ahfullgreen
 
 from .common import Benchmark
@@ -369,6 +370,116 @@ class GFTestCase(unittest.TestCase):
 
         store.close()
 
+    def test_get_stack(self):
+        nrecords = 20
+        random.seed(0)
+        num.random.seed(0)
+
+        store = gf.BaseStore(self.create(nrecords=nrecords))
+        irecords = num.array([3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5])
+
+        for itmin, nsamples in [(None, None), (0, 30), (5, 3), (-4, 2)]:
+            itmin_stack, data = store.get_stack(irecords, itmin, nsamples)
+            self.assertEqual(data.shape[0], irecords.size)
+            if itmin is not None:
+                self.assertEqual(itmin_stack, itmin)
+                self.assertEqual(data.shape[1], nsamples)
+
+            for irow, irecord in enumerate(irecords):
+                tr = store.get(irecord)
+                if tr.is_zero:
+                    assert num.all(data[irow] == 0.0)
+                    continue
+
+                for isample in range(data.shape[1]):
+                    it = itmin_stack + isample
+                    if it < tr.itmin:
+                        v = tr.begin_value
+                    elif it >= tr.itmin + tr.data.size:
+                        v = tr.end_value
+                    else:
+                        v = tr.data[it - tr.itmin]
+
+                    assert_ae(data[irow, isample], v)
+
+        with self.assertRaises(gf.StoreError):
+            store.get_stack([nrecords])
+
+        store.close()
+
+    def test_compressed_store(self):
+        nrecords = 20
+        random.seed(0)
+        num.random.seed(0)
+
+        datas = []
+        for i in range(nrecords):
+            n = random.randint(1, 1000)
+            t = num.arange(n)
+            datas.append(
+                (num.sin(t * 0.1) * num.exp(-t / 200.) +
+                 0.01 * num.random.normal(size=n)).astype(gf.gf_dtype))
+
+        for compression in sorted(gf.store.gf_compressions.keys()):
+            d = mkdtemp(prefix='gfstore')
+            self.tempdirs.append(d)
+            gf.BaseStore.create(d, 1.0, nrecords, force=True,
+                                compression=compression)
+
+            store = gf.BaseStore(d, mode='w')
+            for i, data in enumerate(datas):
+                store.put(i, gf.GFTrace(data=data, itmin=i))
+
+            store.close()
+
+            store = gf.BaseStore(d)
+            assert store.compression == compression
+
+            lossless = compression == 'deflate'
+            for i, data in enumerate(datas):
+                for _ in range(2):
+                    tr1 = store.get(i)
+                    tr2 = store.get(i, implementation='reference')
+                    num.testing.assert_array_equal(tr1.data, tr2.data)
+
+                self.assertEqual(tr1.itmin, i)
+                self.assertEqual(tr1.data[0], data[0])
+                self.assertEqual(tr1.data[-1], data[-1])
+                if lossless:
+                    num.testing.assert_array_equal(tr1.data, data)
+                else:
+                    assert num.max(num.abs(tr1.data - data)) \
+                        <= 1e-3 * num.max(num.abs(data))
+
+                tr3 = store.get(i, itmin=i+1, nsamples=5)
+                num.testing.assert_array_equal(tr3.data, tr1.data[1:6])
+
+            irecords = num.arange(nrecords)
+            _, stack = store.get_stack(irecords, 0, 100)
+            for irecord in irecords:
+                tr = store.get(irecord)
+                num.testing.assert_array_equal(
+                    stack[irecord, irecord:irecord+tr.data.size],
+                    tr.data[:max(0, 100-irecord)])
+
+            weights = num.random.random(nrecords)
+            delays = num.random.random(nrecords) * 10.
+            a = store.sum(irecords, delays, weights)
+            b = store.sum(irecords, delays, weights,
+                          implementation='reference')
+            self.assertEqual(a.itmin, b.itmin)
+            num.testing.assert_array_almost_equal(a.data, b.data, 4)
+
+            if not lossless:
+                assert store.size_data < sum(data.nbytes for data in datas)
+
+            store.close()
+
+        d = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(d)
+        with self.assertRaises(gf.StoreError):
+            gf.BaseStore.create(d, 1.0, 1, force=True, compression='lzma')
+
     def test_sum(self):
 
         nrecords = 8
@@ -552,6 +663,64 @@ class GFTestCase(unittest.TestCase):
 
         self.assertTrue(numeq(trs[0].ydata, trs[1].ydata, 0.01))
 
+    def test_pulse_decimated_pyramid(self):
+        store_dir = self._create_pulse_store()
+
+        store = gf.Store(store_dir)
+        store.make_decimated(2)
+
+        # only factor 2 available: coarsest store for factor 4 is the 2 one
+        store_, decimate_ = store._decimated_store(4)
+        assert store_.config.sample_rate == store.config.sample_rate / 2.
+        assert decimate_ == 2
+
+        with self.assertRaises(gf.CannotCreate):
+            store.make_decimated_pyramid()
+
+        store.make_decimated_pyramid(force=True)
+        assert store.stats()['decimated'] == [2, 4, 8]
+
+        for decimate in [2, 4, 8]:
+            store_, decimate_ = store._decimated_store(decimate)
+            assert decimate_ == 1
+            assert store_.config.sample_rate == \
+                store.config.sample_rate / decimate
+
+            for args in list(store.config.iter_nodes())[::97]:
+                irecord = store.config.irecord(*args)
+                tr1 = store._get(irecord, None, None, decimate, 'reference')
+                tr2 = store_.get(args)
+                assert tr1.itmin == tr2.itmin
+
+                # levels are decimated in a cascade: 1 -> 2 -> 4 -> 8
+                tr_ref = store._get(irecord, None, None, 2, 'reference')
+                for _ in range(int(round(math.log(decimate, 2))) - 1):
+                    tr_ref = gf.store._decimate_gftrace(tr_ref, 2)
+
+                assert tr_ref.itmin == tr2.itmin
+                assert numeq(tr_ref.data, tr2.data, 1e-6)
+
+        store_, decimate_ = store._decimated_store(16)
+        assert store_.config.sample_rate == store.config.sample_rate / 8.
+        assert decimate_ == 2
+
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+        source = gf.ExplosionSource(time=0.0, depth=100., moment=1.0)
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '%s' % sample_rate, 'N'),
+                sample_rate=sample_rate,
+                north_shift=500.,
+                east_shift=0.,
+                store_id='pulse')
+            for sample_rate in [
+                store.config.sample_rate / 8.,
+                store.config.sample_rate / 16.]]
+
+        response = engine.process(source, targets)
+        for target, tr in zip(targets, response.pyrocko_traces()):
+            assert abs(tr.deltat * target.sample_rate - 1.0) < 1e-6
+
     def test_stf_pre_post(self):
         store_dir = self.get_pulse_store_dir()
         engine = gf.LocalEngine(store_dirs=[store_dir])
@@ -709,6 +878,191 @@ class GFTestCase(unittest.TestCase):
             self.assertEqual(tr1.tmin, tr2.tmin)
             self.assertTrue(numeq(tr1.ydata, tr2.ydata, 0.0001))
 
+    def test_process_array(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.RectangularExplosionSource(
+                time=time,
+                depth=depth,
+                moment=moment,
+                length=100.,
+                width=0.,
+                nucleation_x=-1,
+                stf=stf)
+
+            for (time, depth, moment, stf) in [
+                (0.0025, 100., 1.0, None),
+                (0.0, 200., 2.0, gf.BoxcarSTF(duration=0.02)),
+                (10.0013, 300., 0.5, gf.TriangularSTF(duration=0.05))]
+        ]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '%g' % depth, component),
+                north_shift=500.,
+                east_shift=125.,
+                depth=depth,
+                interpolation='multilinear',
+                store_id='pulse')
+
+            for component in 'ZNE' for depth in [0., 5., 10]]
+
+        tmins, deltat, data = engine.process_array(sources, targets)
+        self.assertEqual(data.shape[:2], (len(sources), len(targets)))
+
+        resp = engine.process(sources, targets)
+        for isource, source in enumerate(sources):
+            for itarget, target in enumerate(targets):
+                tr = resp.results_list[isource][itarget].trace.pyrocko_trace()
+                ioff = int(round((tr.tmin - tmins[isource]) / deltat))
+                self.assertTrue(ioff >= 0)
+                n = min(tr.ydata.size, data.shape[2] - ioff)
+                self.assertTrue(n > 0)
+                amax = num.max(num.abs(tr.ydata))
+                self.assertTrue(numeq(
+                    data[isource, itarget, ioff:ioff+n] / amax,
+                    tr.ydata[:n] / amax, 0.0001))
+
+        with self.assertRaises(gf.BadRequest):
+            engine.process_array(
+                sources, targets + [gf.Target(store_id='pulse', tmin=0.)])
+
+    def test_process_nworkers(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.ExplosionSource(
+                time=time,
+                depth=depth,
+                magnitude=moment_tensor.moment_to_magnitude(moment))
+
+            for depth in [100., 200., 300.] for time in [0.0, 0.0025]
+            for moment in [1.0, 2.0]]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '%g' % north_shift, component),
+                north_shift=north_shift,
+                east_shift=125.,
+                store_id='pulse')
+
+            for component in 'ZNE' for north_shift in [300., 500.]]
+
+        resp1 = engine.process(sources, targets)
+        resp2 = engine.process(sources, targets, nworkers=3)
+
+        for isource in range(len(sources)):
+            for itarget in range(len(targets)):
+                tr1 = resp1.results_list[isource][itarget].trace
+                tr2 = resp2.results_list[isource][itarget].trace
+                self.assertEqual(tr1.codes, tr2.codes)
+                self.assertEqual(tr1.tmin, tr2.tmin)
+                self.assertTrue(numeq(tr1.data, tr2.data, 1e-6))
+
+        # sources sharing a GF stack but differing in amplitude
+        for isource in range(0, len(sources), 2):
+            for itarget in range(len(targets)):
+                tr1 = resp2.results_list[isource][itarget].trace
+                tr2 = resp2.results_list[isource+1][itarget].trace
+                self.assertTrue(num.max(num.abs(tr1.data)) > 0.0)
+                self.assertTrue(numeq(2.0 * tr1.data, tr2.data, 1e-6))
+
+    def test_response_binary(self):
+        from io import BytesIO
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.ExplosionSource(time=0.0, depth=depth, moment=1.0)
+            for depth in [100., 200.]]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '%g' % north_shift, component),
+                north_shift=north_shift,
+                east_shift=125.,
+                store_id='pulse')
+
+            for component in 'ZNE' for north_shift in [300., 500.]]
+
+        resp = engine.process(sources, targets)
+
+        f = BytesIO()
+        resp.dump_binary(f)
+        f.seek(0)
+        yielded = list(gf.iload_response_binary(f))
+        assert len(yielded) == len(sources) * len(targets) + 1
+        assert yielded[-1][:2] == (None, None)
+
+        f.seek(0)
+        resp2 = gf.load_response_binary(f, resp.request)
+        self.assertEqual(resp2.stats.n_results, resp.stats.n_results)
+
+        for isource in range(len(sources)):
+            for itarget in range(len(targets)):
+                res1 = resp.results_list[isource][itarget]
+                res2 = resp2.results_list[isource][itarget]
+                self.assertEqual(
+                    res1.n_records_stacked, res2.n_records_stacked)
+                tr1, tr2 = res1.trace, res2.trace
+                self.assertEqual(tr1.codes, tr2.codes)
+                self.assertEqual(tr1.tmin, tr2.tmin)
+                self.assertEqual(tr1.deltat, tr2.deltat)
+                assert num.all(tr1.data == tr2.data)
+
+        f = BytesIO(f.getvalue()[:-20])
+        with self.assertRaises(gf.SeismosizerError):
+            gf.load_response_binary(f, resp.request)
+
+    def test_dsource_cache(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir], dsource_cache_size=2)
+
+        source = gf.RectangularExplosionSource(
+            depth=200., moment=1.0, length=100., width=0., nucleation_x=-1)
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '', component),
+                north_shift=500.,
+                east_shift=125.,
+                store_id='pulse')
+            for component in 'ZNE']
+
+        resp1 = engine.process(source, targets)
+        stats = engine.dsource_cache_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['nentries'], 1)
+
+        resp2 = engine.process(source.clone(time=1.0), targets[:1])
+        stats = engine.dsource_cache_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+        tr1 = resp1.results_list[0][0].trace
+        tr2 = resp2.results_list[0][0].trace
+        self.assertTrue(numeq(tr1.data, tr2.data, 1e-6))
+        self.assertAlmostEqual(tr2.tmin - tr1.tmin, 1.0)
+
+        source3 = gf.RectangularExplosionSource(
+            depth=200., moment=2.0, length=100., width=0., nucleation_x=-1)
+
+        resp3 = engine.process(source3, targets[:1])
+        self.assertEqual(engine.dsource_cache_stats()['misses'], 2)
+        tr3 = resp3.results_list[0][0].trace
+        self.assertTrue(numeq(tr3.data, 2.0 * tr1.data, 1e-6))
+
+        engine.process(source.clone(depth=300.), targets[:1])
+        stats = engine.dsource_cache_stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['nentries'], 2)
+
+        engine.clear_dsource_cache()
+        self.assertEqual(engine.dsource_cache_stats()['nentries'], 0)
+
     def test_timing_defs(self):
 
         for s, d in [
@@ -779,6 +1133,131 @@ class GFTestCase(unittest.TestCase):
             store.t('{cake:P}', args) + store.t('{vel_surface:10}', args),
             0.1)
 
+    def test_make_ttt_parallel_resume(self):
+        store_dir = self.get_regional_ttt_store_dir()
+        store = gf.Store(store_dir)
+
+        fns = [
+            os.path.join(store_dir, 'phases', '%s.phase' % pdef.id)
+            for pdef in store.config.tabulated_phases]
+
+        def read_all():
+            ds = []
+            for fn in fns:
+                with open(fn, 'rb') as f:
+                    ds.append(f.read())
+
+            return ds
+
+        ref = read_all()
+
+        for nworkers in (2, 8):
+            store.make_ttt(force=True, nworkers=nworkers)
+            assert read_all() == ref
+            for fn in fns:
+                assert not os.path.exists(fn + '.checkpoint')
+
+        # interrupt computation of one table, then resume
+        pdef = store.config.tabulated_phases[2]
+        fn = fns[2]
+
+        nevaluated = []
+        prefetch_orig = spit.SPTree._prefetch
+
+        def prefetch_counting(tree, xs):
+            n = len(tree.f_values)
+            prefetch_orig(tree, xs)
+            nevaluated.append(len(tree.f_values) - n)
+
+        def prefetch_interrupted(tree, xs):
+            if len(nevaluated) == 3:
+                raise KeyboardInterrupt()
+
+            prefetch_counting(tree, xs)
+
+        try:
+            spit.SPTree._prefetch = prefetch_counting
+            store._make_ttt_phase(pdef)
+            nfull = sum(nevaluated)
+
+            os.unlink(fn)
+            del nevaluated[:]
+            spit.SPTree._prefetch = prefetch_interrupted
+            with self.assertRaises(KeyboardInterrupt):
+                store.make_ttt()
+
+            assert not os.path.exists(fn)
+            assert os.path.exists(fn + '.checkpoint')
+            ninterrupted = sum(nevaluated)
+
+            del nevaluated[:]
+            spit.SPTree._prefetch = prefetch_counting
+            store.make_ttt()
+            nresumed = sum(nevaluated)
+
+        finally:
+            spit.SPTree._prefetch = prefetch_orig
+
+        assert read_all() == ref
+        assert not os.path.exists(fn + '.checkpoint')
+        assert 0 < ninterrupted < nfull
+        assert ninterrupted + nresumed == nfull
+
+    def test_lookup_ireceivers(self):
+        rstate = num.random.RandomState(123)
+        nreceivers = 2000
+        lats = rstate.uniform(-1., 1., nreceivers)
+        lons = rstate.uniform(10., 12., nreceivers)
+
+        receivers = [
+            gf.Receiver(lat=float(lat), lon=float(lon))
+            for (lat, lon) in zip(lats, lons)]
+
+        receivers.append(gf.Receiver(lat=0., lon=11., depth=5*km))
+        receivers.append(gf.Receiver(
+            lat=0., lon=11., north_shift=10*km, east_shift=-5*km))
+
+        conf = gf.ConfigTypeC(
+            id='receivers_c',
+            receivers=receivers,
+            source_origin=gf.Location(lat=0., lon=11.),
+            source_depth_min=0.,
+            source_depth_max=10*km,
+            source_depth_delta=1*km,
+            source_east_shift_min=-10*km,
+            source_east_shift_max=10*km,
+            source_east_shift_delta=1*km,
+            source_north_shift_min=-10*km,
+            source_north_shift_max=10*km,
+            source_north_shift_delta=1*km,
+            sample_rate=1.0,
+            component_scheme='elastic18')
+
+        targets = [
+            gf.Receiver(lat=rec.lat, lon=rec.lon, depth=rec.depth,
+                        north_shift=rec.north_shift,
+                        east_shift=rec.east_shift)
+            for rec in receivers]
+
+        assert num.all(
+            conf.lookup_ireceivers(targets) == num.arange(len(receivers)))
+
+        # close enough, and equivalent to the shifted receiver
+        lat, lon = receivers[-1].effective_latlon
+        assert conf.lookup_ireceiver(
+            gf.Receiver(lat=lat, lon=lon+1e-5)) == len(receivers) - 1
+
+        assert conf.lookup_ireceiver(
+            gf.Receiver(lat=0., lon=11., depth=5*km+10.)) \
+            == len(receivers) - 2
+
+        with self.assertRaises(gf.OutOfBounds):
+            conf.lookup_ireceiver(gf.Receiver(lat=0., lon=11., depth=2*km))
+
+        with self.assertRaises(gf.OutOfBounds):
+            conf.lookup_ireceivers(targets[:5] + [
+                gf.Receiver(lat=45., lon=11.)])
+
     def dummy_store(self):
         if self._dummy_store is None:
 
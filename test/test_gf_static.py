@@ -242,6 +242,52 @@ mantle
         # self.plot_static_los_result(ml)
         # print benchmark
 
+    def test_statics_chunked(self):
+        store = gf.Store(self.get_pscmp_store_dir())
+        ntargets = 500
+
+        source = gf.RectangularSource(
+            lat=0., lon=0.,
+            north_shift=0., east_shift=0., depth=6.5*km,
+            width=2*km, length=5*km,
+            dip=90., rake=90., strike=90.,
+            slip=1.)
+
+        phi = num.full(ntargets, num.deg2rad(192.))
+        theta = num.full(ntargets, num.deg2rad(90.-23.))
+
+        sattarget = gf.SatelliteTarget(
+            north_shifts=(random.rand(ntargets)-.5) * 25. * km,
+            east_shifts=(random.rand(ntargets)-.5) * 25. * km,
+            tsnapshot=20,
+            phi=phi,
+            theta=theta)
+
+        dsource = source.discretize_basesource(store, sattarget)
+        components = ['displacement.%s' % c for c in 'ned']
+        for interpolation in ['nearest_neighbor', 'multilinear']:
+            ref = store.statics(
+                dsource, sattarget, 1, components, interpolation,
+                max_pairs=dsource.nelements * ntargets)
+
+            for max_pairs in [1, dsource.nelements * 7]:
+                res = store.statics(
+                    dsource, sattarget, 1, components, interpolation,
+                    max_pairs=max_pairs)
+
+                for comp in components:
+                    num.testing.assert_equal(res[comp], ref[comp])
+
+        engine = gf.LocalEngine(store_dirs=[self.get_pscmp_store_dir()])
+        res = engine.process(source, sattarget).results_list[0][0].result
+
+        los_fac = sattarget.get_los_factors()
+        num.testing.assert_allclose(
+            res['displacement.los'],
+            los_fac[:, 0] * -res['displacement.d'] +
+            los_fac[:, 1] * res['displacement.e'] +
+            los_fac[:, 2] * res['displacement.n'])
+
     @staticmethod
     def plot_static_los_result(result):
         import matplotlib.pyplot as plt
@@ -96,6 +96,39 @@ class GFSTFTestCase(unittest.TestCase):
             d2 = stf.effective_duration
             assert abs(d2 - d1) < 1e-4
 
+    def test_discretize_t_cached(self):
+        deltat = 0.1
+        for stf in [
+                gf.STF(),
+                gf.HalfSinusoidSTF(duration=2.0),
+                gf.TriangularSTF(duration=2.0, peak_ratio=0.3),
+                gf.BoxcarSTF(duration=1.55)]:
+
+            for tref in [0., 0.05, 10.02, -3.333, 1234567890.123]:
+                t1, a1 = stf.discretize_t(deltat, tref)
+                for i in range(2):
+                    t2, a2 = stf.discretize_t_cached(deltat, tref)
+                    assert numeq(t1, t2, 1e-6 * max(1.0, abs(tref)))
+                    assert numeq(a1, a2, 1e-6)
+
+                    a2 *= 2.0
+
+    def test_convolve_stf(self):
+        data = num.random.random((3, 1000))
+        for nsamples in [1, 2, 10, 511, 512, 1000]:
+            amplitudes = num.random.random(nsamples)
+            amplitudes /= num.sum(amplitudes)
+            out = gf.seismosizer.convolve_stf(amplitudes, data)
+            self.assertEqual(out.shape, (3, 1000 + nsamples - 1))
+            for irow in range(3):
+                padded = num.concatenate(
+                    (data[irow], num.repeat(data[irow, -1], nsamples)))
+                ref = num.convolve(amplitudes, padded)[:-nsamples]
+                assert numeq(out[irow], ref, 1e-9)
+                assert numeq(
+                    gf.seismosizer.convolve_stf(amplitudes, data[irow]),
+                    ref, 1e-9)
+
 
 if __name__ == '__main__':
     plot = True
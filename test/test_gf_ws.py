@@ -1,12 +1,17 @@
 from __future__ import division, print_function, absolute_import
+import sys
 import unittest
 import shutil
 import os
-import asyncore
 import threading
 import logging
 import tempfile
+from io import BytesIO
 
+import numpy as num
+import requests
+
+from pyrocko import gf
 from pyrocko.gf import server, LocalEngine, ws, store
 from pyrocko import util
 from pyrocko.fomosto import ahfullgreen
@@ -14,6 +19,12 @@ from pyrocko.fomosto import ahfullgreen
 op = os.path
 logger = logging.getLogger('pyrocko.test.test_gf_ws')
 
+km = 1000.
+
+
+need_asyncio = unittest.skipIf(
+    sys.version_info < (3, 7), 'asyncio server requires Python 3.7 or later')
+
 
 class GFWSTestCase(unittest.TestCase):
 
@@ -38,23 +49,29 @@ class GFWSTestCase(unittest.TestCase):
         shutil.rmtree(cls.serve_dir)
         shutil.rmtree(cls.dl_dir)
 
-    def test_local_server(self):
-
-        class ServerThread(threading.Thread):
-            def __init__(self, serve_dir):
-                threading.Thread.__init__(self)
-                self.engine = LocalEngine(
-                    store_dirs=[serve_dir])
-                self.s = server.Server(
-                    'localhost', 32483, server.SeismosizerHandler, self.engine)
-
-            def run(self):
-                asyncore.loop(1., use_poll=True)
-
-        t_ws = ServerThread(self.serve_dir)
+    def start_server(self, port, handler=None, **kwargs):
+        engine = LocalEngine(store_dirs=[self.serve_dir])
+        s = server.Server(
+            'localhost', port, handler or server.SeismosizerHandler, engine,
+            **kwargs)
+        t_ws = threading.Thread(target=s.run)
         t_ws.start()
+        assert s.ready.wait(10.)
+        return s, t_ws
 
+    def stop_server(self, s, t_ws):
+        s.stop()
+        t_ws.join(10.)
+
+    @need_asyncio
+    def test_local_server(self):
+        import asyncio
+        s, t_ws = self.start_server(32483, max_requests=1)
         try:
+            # downloads must not wait for seismosizer request slots
+            asyncio.run_coroutine_threadsafe(
+                s.request_slots.acquire(), s._loop).result(10.)
+
             ws.download_gf_store(
                 site='http://localhost:32483',
                 store_id=self.store_id,
@@ -62,11 +79,141 @@ class GFWSTestCase(unittest.TestCase):
             gfstore = store.Store(self.store_id)
             gfstore.check()
 
+            assert s.stats.get('static')['count'] > 0
+            assert s.stats.get('static')['errors'] == 0
+
+        finally:
+            self.stop_server(s, t_ws)
+
+    @need_asyncio
+    def test_remote_process(self):
+        s, t_ws = self.start_server(32484, nworkers=2, max_requests=2)
+        try:
+            source = gf.DCSource(lat=0., lon=0., depth=5*km)
+            targets = [
+                gf.Target(
+                    quantity='displacement',
+                    codes=('', 'STA', '', cha),
+                    north_shift=north*km,
+                    east_shift=5*km,
+                    store_id=self.store_id)
+                for north in (5., 10.)
+                for cha in 'NEZ']
+
+            engine_remote = gf.RemoteEngine(site='http://localhost:32484')
+            engine_local = LocalEngine(store_dirs=[self.serve_dir])
+
+            results = []
+            for _ in range(3):
+                results.append(engine_remote.process(
+                    sources=[source], targets=targets))
+
+            request = gf.Request(sources=[source], targets=targets)
+            results.append(ws.seismosizer(
+                site='http://localhost:32484', request=request,
+                binary=False))
+
+            ref = engine_local.process(sources=[source], targets=targets)
+
+            for resp in results:
+                for tr, tr_ref in zip(
+                        resp.pyrocko_traces(), ref.pyrocko_traces()):
+
+                    assert tr.nslc_id == tr_ref.nslc_id
+                    num.testing.assert_allclose(
+                        tr.ydata, tr_ref.ydata, rtol=1e-5)
+
+            d = s.stats.get('process')
+            assert d['count'] == 4
+            assert d['errors'] == 0
+            assert d['min'] <= d['p50'] <= d['max']
+
+            r = requests.get('http://localhost:32484/gfws/metrics')
+            assert r.status_code == 200
+            assert 'process' in r.text
+
+        finally:
+            self.stop_server(s, t_ws)
+
+    @need_asyncio
+    def test_remote_process_streamed(self):
+
+        class Handler(server.SeismosizerHandler):
+            nresults_part = 4
+
+        s, t_ws = self.start_server(32486, handler=Handler, nworkers=0)
+        try:
+            sources = [
+                gf.DCSource(lat=0., lon=0., depth=depth*km)
+                for depth in (4., 5., 6.)]
+
+            targets = [
+                gf.Target(
+                    quantity='displacement',
+                    codes=('', 'STA', '', cha),
+                    north_shift=north*km,
+                    east_shift=5*km,
+                    store_id=self.store_id)
+                for north in (5., 10.)
+                for cha in 'NEZ']
+
+            request = gf.Request(sources=sources, targets=targets)
+
+            r = requests.post(
+                'http://localhost:32486/gfws/seismosizer/1/query',
+                data={'request': request.dump()},
+                headers={'Accept': gf.binary_response_mimetype})
+
+            assert r.headers['Transfer-Encoding'] == 'chunked'
+            resp = gf.load_response_binary(BytesIO(r.content), request)
+            ref = LocalEngine(store_dirs=[self.serve_dir]).process(
+                sources=sources, targets=targets)
+
+            # statistics of all parts are combined
+            assert resp.stats.n_records_stacked > 0
+            assert resp.stats.t_wallclock > 0.0
+
+            for tr, tr_ref in zip(
+                    resp.pyrocko_traces(), ref.pyrocko_traces()):
+
+                assert tr.nslc_id == tr_ref.nslc_id
+                assert tr.tmin == tr_ref.tmin
+                num.testing.assert_allclose(
+                    tr.ydata, tr_ref.ydata, rtol=1e-5)
+
+        finally:
+            self.stop_server(s, t_ws)
+
+    @unittest.skipIf(
+        sys.version_info >= (3, 12), 'asyncore not available')
+    def test_local_server_asyncore(self):
+        import asyncore
+        from pyrocko.gf import server_asyncore
+
+        engine = LocalEngine(store_dirs=[self.serve_dir])
+        s = server_asyncore.Server(
+            'localhost', 32485, server_asyncore.SeismosizerHandler, engine)
+
+        t_ws = threading.Thread(
+            target=asyncore.loop, kwargs=dict(timeout=0.1, use_poll=True))
+        t_ws.start()
+
+        try:
+            source = gf.DCSource(lat=0., lon=0., depth=5*km)
+            target = gf.Target(
+                north_shift=5*km, east_shift=5*km, store_id=self.store_id)
+
+            resp = gf.RemoteEngine(site='http://localhost:32485').process(
+                sources=[source], targets=[target])
+
+            ref = engine.process(sources=[source], targets=[target])
+            tr, = resp.pyrocko_traces()
+            tr_ref, = ref.pyrocko_traces()
+            num.testing.assert_allclose(tr.ydata, tr_ref.ydata, rtol=1e-5)
+
         finally:
-            # import time
-            # time.sleep(100)
-            t_ws.s.close()
-            t_ws.join(1.)
+            s.close()
+            t_ws.join(10.)
 
 
 if __name__ == '__main__':
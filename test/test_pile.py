@@ -7,6 +7,7 @@ import numpy as num
 import tempfile
 import random
 import os
+import threading
 from random import choice as rc
 from os.path import join as pjoin
 
@@ -109,6 +110,255 @@ class PileTestCase(unittest.TestCase):
         pile.get_cache(cachedir).clean()
         shutil.rmtree(datadir)
 
+    def testIndex(self):
+        import shutil
+        nfiles = 20
+        nsamples = 1000
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['aaaa', 'bbbb'], ['bhz'], tmin)
+
+        filenames = util.select_files([datadir], show_progress=False)
+        cachedir = pjoin(datadir, '_cache_')
+
+        p1 = pile.Pile()
+        p1.load_files(filenames=filenames, cache=pile.get_index(cachedir),
+                      show_progress=False)
+
+        index = pile.TracesFileIndex(cachedir)
+        p2 = pile.Pile()
+        p2.load_files(filenames=filenames, cache=index, show_progress=False)
+
+        assert p1.tmin == p2.tmin and p1.tmax == p2.tmax
+        assert set(p1.nslc_ids) == set(p2.nslc_ids)
+        for tfile in p2.iter_files():
+            assert tfile.format == 'mseed'
+            assert tfile.mtime == index.get_stamp(tfile.abspath)[1]
+
+        trs1, used1 = p1.chop(tmin+500, tmin+5500)
+        trs2, used2 = p2.chop(tmin+500, tmin+5500)
+        assert sorted(tr.nslc_id for tr in trs1) \
+            == sorted(tr.nslc_id for tr in trs2)
+
+        assert len(index.select(tmin+500, tmin+1500)) == 2
+        selected = index.select(nslc_patterns='*.aaaa.*.*')
+        p3 = pile.Pile()
+        p3.load_files(filenames=filenames, cache=index, show_progress=False,
+                      nslc_patterns='*.aaaa.*.*')
+        assert set(f.abspath for f in p3.iter_files()) == selected
+        assert set(p3.stations) == set(['aaaa'])
+
+        p4 = pile.Pile()
+        p4.load_files(filenames=filenames, cache=index, show_progress=False,
+                      tmin=tmin+500, tmax=tmin+1500)
+        assert len(list(p4.iter_files())) == 2
+
+        abspaths = [os.path.abspath(fn) for fn in filenames]
+        index.nbatch = 7
+        tfiles = index.get_many(abspaths + ['/nonexistent'])
+        assert sorted(tfiles.keys()) == sorted(abspaths)
+        for tfile in p2.iter_files():
+            assert tfiles[tfile.abspath].nslc_ids == tfile.nslc_ids
+            assert (tfiles[tfile.abspath].tmin, tfiles[tfile.abspath].tmax) \
+                == (tfile.tmin, tfile.tmax)
+
+        # the index may be used from other threads
+        stamps = []
+        t = threading.Thread(
+            target=lambda: stamps.append(index.get_stamps(abspaths)))
+        t.start()
+        t.join()
+        assert len(stamps[0]) == len(abspaths)
+
+        os.unlink(filenames[0])
+        index.clean()
+        assert index.get(os.path.abspath(filenames[0])) is None
+
+        shutil.rmtree(datadir)
+
+    def testParallelScan(self):
+        import shutil
+        nfiles = 50
+        nsamples = 100
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['aaaa', 'bbbb'], ['bhz', 'bhn'], tmin)
+
+        with open(pjoin(datadir, 'broken.mseed'), 'wb') as f:
+            f.write(b'x' * 1000)
+
+        filenames = util.select_files([datadir], show_progress=False)
+
+        p1 = pile.Pile()
+        p1.load_files(filenames=filenames, show_progress=False)
+
+        cache = pile.get_index(pjoin(datadir, '_cache_'))
+        p2 = pile.Pile()
+        p2.load_files(filenames=filenames, cache=cache, show_progress=False,
+                      nworkers=4)
+
+        files1 = list(p1.iter_files())
+        files2 = list(p2.iter_files())
+        assert len(files1) == len(files2) == nfiles
+        assert sorted(f.abspath for f in files1) \
+            == sorted(f.abspath for f in files2)
+
+        for tfile in files2:
+            assert cache.get_stamp(tfile.abspath) is not None
+
+        assert p1.tmin == p2.tmin and p1.tmax == p2.tmax
+        assert set(p1.nslc_ids) == set(p2.nslc_ids)
+
+        s = 0
+        for traces in p2.chopper(tmax=p2.tmax+1., degap=False):
+            for tr in traces:
+                s += num.sum(tr.ydata)
+
+        assert int(round(s)) == nfiles*nsamples
+
+        shutil.rmtree(datadir)
+
+    def testPartialLoad(self):
+        import shutil
+        datadir = tempfile.mkdtemp()
+        tmin = 1234567890.
+        traces = [
+            trace.Trace(
+                'xx', 'sta', '', cha, tmin=tmin, deltat=0.01,
+                ydata=num.arange(200000, dtype=num.int32))
+            for cha in ('bhz', 'bhn')]
+
+        fn = pjoin(datadir, 'data.mseed')
+        io.save(traces, fn)
+
+        p = pile.Pile()
+        p.load_files([fn], show_progress=False)
+        tfile = list(p.iter_files())[0]
+
+        for wmin, wmax in [(tmin+100., tmin+110.), (tmin, tmin+5.),
+                           (tmin+1990., tmin+2010.)]:
+
+            trs1, used1 = p.chop(wmin, wmax, load_partial=True)
+            assert not used1 and not tfile.data_loaded
+
+            trs2, used2 = p.chop(wmin, wmax)
+            for file in used2:
+                file.use_data()
+                file.drop_data()
+
+            trs1.sort(key=lambda tr: tr.nslc_id)
+            trs2.sort(key=lambda tr: tr.nslc_id)
+            assert len(trs1) == len(trs2) == 2
+            for tr1, tr2 in zip(trs1, trs2):
+                assert tr1.nslc_id == tr2.nslc_id
+                assert abs(tr1.tmin - tr2.tmin) < 1e-6
+                assert num.all(tr1.ydata == tr2.ydata)
+
+        trs, _ = p.chop(
+            tmin+100., tmin+110., load_partial=True,
+            trace_selector=lambda tr: tr.channel == 'bhz')
+
+        assert [tr.channel for tr in trs] == ['bhz']
+
+        s = 0
+        for traces in p.chopper(tinc=100., load_partial=True, degap=False,
+                                tmax=p.tmax+1.):
+            for tr in traces:
+                s += num.sum(tr.ydata.astype(num.float))
+
+        assert s == 2 * num.sum(num.arange(200000, dtype=num.float))
+
+        shutil.rmtree(datadir)
+
+    def testDataCache(self):
+        import shutil
+        nfiles = 10
+        nsamples = 1000
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['aaaa'], ['bhz'], tmin)
+
+        filenames = util.select_files([datadir], show_progress=False)
+        p = pile.Pile()
+        p.load_files(filenames=filenames, show_progress=False)
+
+        data_cache = pile.get_data_cache()
+        nbytes_file = nsamples * 8
+        data_cache.set_max_bytes(3 * nbytes_file)
+        data_cache.reset_stats()
+        try:
+            for ifile in [0, 1, 0, 2, 3, 4, 0, 4]:
+                trs, _ = p.chop(
+                    tmin + ifile*nsamples, tmin + (ifile+1)*nsamples - 1)
+                assert len(trs) == 1
+                assert num.all(trs[0].ydata == 1.0)
+                assert data_cache.nbytes <= 3 * nbytes_file
+
+            stats = data_cache.stats()
+            assert stats['misses'] == 6
+            assert stats['hits'] == 2
+            assert stats['evictions'] == 3
+            assert stats['nfiles'] == 3
+
+            s = 0
+            for traces in p.chopper(tmax=p.tmax+1., tinc=333., degap=False):
+                for tr in traces:
+                    s += num.sum(tr.ydata)
+
+                assert data_cache.nbytes <= 3 * nbytes_file
+
+            assert int(round(s)) == nfiles*nsamples
+
+            # budget smaller than one window
+            data_cache.set_max_bytes(nbytes_file)
+            s = 0
+            for traces in p.chopper(tmax=p.tmax+1., tinc=2500., degap=False):
+                for tr in traces:
+                    s += num.sum(tr.ydata)
+
+            assert int(round(s)) == nfiles*nsamples
+            assert data_cache.nbytes <= nbytes_file
+
+        finally:
+            data_cache.set_max_bytes(None)
+            for tfile in p.iter_files():
+                tfile.unload_data()
+
+        assert data_cache.nbytes == 0
+        shutil.rmtree(datadir)
+
+    def testPrefetch(self):
+        import shutil
+        nfiles = 20
+        nsamples = 1000
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['aaaa', 'bbbb'], ['bhz'], tmin)
+
+        filenames = util.select_files([datadir], show_progress=False)
+        p = pile.Pile()
+        p.load_files(filenames=filenames, show_progress=False)
+
+        def digest(**kwargs):
+            return [
+                [(tr.nslc_id, tr.tmin, tr.tmax, num.sum(tr.ydata))
+                 for tr in traces]
+                for traces in p.chopper(
+                    tmax=p.tmax+1., tinc=700., degap=False, **kwargs)]
+
+        ref = digest()
+        assert digest(prefetch=3) == ref
+        assert digest(prefetch=1, prefetch_max_bytes=nsamples*8) == ref
+
+        for i, traces in enumerate(p.chopper(tinc=700., prefetch=5)):
+            if i == 2:
+                break
+
+        for tfile in p.iter_files():
+            assert tfile._prefetched is None
+
+        shutil.rmtree(datadir)
+
     def testMemTracesFile(self):
         tr = trace.Trace(ydata=num.arange(100, dtype=num.float))
 
@@ -118,6 +368,112 @@ class PileTestCase(unittest.TestCase):
         for tr in p.iter_all(include_last=True):
             assert numeq(tr.ydata, num.arange(100, dtype=num.float), 0.001)
 
+    def testStreamPipelineChopper(self):
+        deltat = 0.01
+        traces = [
+            trace.Trace(
+                station=sta, tmin=1234567890., deltat=deltat,
+                ydata=num.random.normal(size=10000) + 100.)
+            for sta in ('A', 'B')]
+
+        p = pile.Pile()
+        p.add_file(pile.MemTracesFile(None, [tr.copy() for tr in traces]))
+
+        def make_pipeline():
+            return trace.StreamPipeline([
+                trace.DemeanStage(tmean=10.),
+                trace.ButterworthStage(order=4, corner=5.)])
+
+        pipeline = make_pipeline()
+        ref = pipeline.process(traces) + pipeline.flush()
+
+        pipeline = make_pipeline()
+        out = []
+        for traces_window in pipeline.chopper(
+                p, tmax=p.tmax + deltat, tinc=7.77):
+            out.extend(traces_window)
+
+        assert pipeline.get_stats()[0]['nsamples'] == 20000
+
+        for tr_ref in ref:
+            outsta = [tr for tr in out if tr.station == tr_ref.station]
+            for tr1, tr2 in zip(outsta[:-1], outsta[1:]):
+                assert abs(tr2.tmin - (tr1.tmax + deltat)) < deltat * 0.01
+
+            assert abs(outsta[0].tmin - tr_ref.tmin) < deltat * 0.01
+            num.testing.assert_allclose(
+                num.concatenate([tr.ydata for tr in outsta]), tr_ref.ydata,
+                rtol=1e-6, atol=1e-9)
+
+        with self.assertRaises(ValueError):
+            list(pipeline.chopper(p, tinc=7.77, tpad=1.))
+
+    def testHamsterPileProcessors(self):
+        from pyrocko import hamster_pile
+
+        deltat = 0.01
+        tmin = 1234567890.
+        ydata = num.random.normal(size=10000)
+
+        def chunks():
+            for i in range(0, ydata.size, 333):
+                yield trace.Trace(
+                    station='A', channel='Z', tmin=tmin + i*deltat,
+                    deltat=deltat, ydata=ydata[i:i+333])
+
+        def get_traces(p):
+            return list(p.iter_all(include_last=True))
+
+        # renamed and downsampled
+        pipeline = trace.StreamPipeline([trace.DownsampleStage(0.1)])
+        ref = pipeline.process(
+            [trace.Trace(
+                station='A', channel='Z', tmin=tmin, deltat=deltat,
+                ydata=ydata)])
+
+        chain = hamster_pile.Chain(
+            hamster_pile.Renamer(lambda tr: ('', 'B', '', 'Z')),
+            hamster_pile.Downsampler(lambda tr: ('', 'B', '', 'LZ'), 0.1))
+
+        p = hamster_pile.HamsterPile(processors=[chain])
+        for tr in chunks():
+            p.insert_trace(tr)
+
+        out = get_traces(p)
+        assert len(out) == 1
+        assert out[0].nslc_id == ('', 'B', '', 'LZ')
+        assert out[0].deltat == 0.1
+        assert abs(out[0].tmin - ref[0].tmin) < deltat * 0.01
+        n = min(out[0].data_len(), ref[0].data_len())
+        assert n > 900
+        num.testing.assert_allclose(
+            out[0].ydata[:n], ref[0].ydata[:n], rtol=1e-6, atol=1e-9)
+
+        # arbitrary pipeline
+        def make_pipeline():
+            return trace.StreamPipeline([
+                trace.DemeanStage(tmean=10.),
+                trace.ButterworthStage(order=4, corner=5.)])
+
+        pipeline = make_pipeline()
+        ref = pipeline.process(
+            [trace.Trace(
+                station='A', channel='Z', tmin=tmin, deltat=deltat,
+                ydata=ydata)])
+
+        processor = hamster_pile.StreamProcessor(make_pipeline())
+        p = hamster_pile.HamsterPile(processors=[processor])
+        for tr in chunks():
+            p.insert_trace(tr)
+
+        assert processor.flush_buffers() == []
+
+        out = get_traces(p)
+        assert len(out) == 1
+        assert abs(out[0].tmin - tmin) < deltat * 0.01
+        num.testing.assert_allclose(
+            out[0].ydata, ref[0].ydata, rtol=1e-6, atol=1e-9)
+
 
 if __name__ == "__main__":
     util.setup_logging('test_pile', 'warning')
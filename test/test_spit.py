@@ -0,0 +1,72 @@
+from __future__ import division, print_function, absolute_import
+
+import os
+import unittest
+import tempfile
+import numpy as num
+
+from pyrocko import spit, util
+
+
+def f(x):
+    x0 = num.array([0.5, 0.5, 0.5])
+    r = 0.5
+    if num.sqrt(num.sum((num.asarray(x)-x0)**2)) < r:
+        return x[2]**4 + x[1]
+
+    return None
+
+
+class SpitTestCase(unittest.TestCase):
+
+    def test_interpolate_many(self):
+        tree = spit.SPTree(
+            f, 0.01, [[0., 1.], [0., 1.], [0., 1.]], [0.05, 0.1, 0.2])
+
+        rstate = num.random.RandomState(1)
+        x = rstate.uniform(0., 1., size=(1000, 3))
+
+        t1 = tree.interpolate_many(x)
+        t2 = tree.root.interpolate_many(x)
+
+        assert num.all(num.isnan(t1) == num.isnan(t2))
+        mask = num.isfinite(t1)
+        assert num.sum(mask) > 100
+        assert num.all(num.abs(t1[mask] - t2[mask]) < 1e-12)
+
+        for xx, tt in zip(x[:50], t1):
+            v = tree.interpolate(xx)
+            if num.isfinite(tt):
+                assert abs(v - tt) < 1e-12
+            else:
+                assert v is None
+
+        assert num.isnan(tree.interpolate_many([[0.5, 0.5, 1.5]])[0])
+        with self.assertRaises(spit.OutOfBounds):
+            tree.interpolate([0.5, 0.5, 1.5])
+
+        fid, fn = tempfile.mkstemp()
+        os.close(fid)
+        try:
+            tree.dump(fn)
+            tree2 = spit.SPTree(filename=fn)
+            assert len(tree2) == len(tree)
+            t3 = tree2.interpolate_many(x)
+            assert num.all(num.isnan(t3) == num.isnan(t1))
+            assert num.all(t3[mask] == t1[mask])
+
+            assert len(list(tree2)) == len(tree)
+            fn2 = fn + '.copy'
+            tree2.dump(fn2)
+            with open(fn, 'rb') as f1, open(fn2, 'rb') as f2:
+                assert f1.read() == f2.read()
+
+            os.unlink(fn2)
+
+        finally:
+            os.unlink(fn)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_spit', 'warning')
+    unittest.main()
@@ -25,6 +25,109 @@ def floats(l):
     return num.array(l, dtype=num.float)
 
 
+def degapper_sequential(
+        traces, maxgap=5, fillmethod='interpolate', deoverlap='use_second',
+        maxlap=None):
+
+    '''
+    Straightforward (quadratic time) degapper used as reference.
+    '''
+
+    in_traces = traces
+    out_traces = []
+    if not in_traces:
+        return out_traces
+    out_traces.append(in_traces.pop(0))
+    while in_traces:
+
+        a = out_traces[-1]
+        b = in_traces.pop(0)
+
+        virtual = a.ydata is None
+
+        if (a.nslc_id == b.nslc_id and a.deltat == b.deltat
+                and a.data_len() >= 1 and b.data_len() >= 1
+                and (virtual or a.ydata.dtype == b.ydata.dtype)):
+
+            dist = (b.tmin-(a.tmin+(a.data_len()-1)*a.deltat))/a.deltat
+            idist = int(round(dist))
+            if not (abs(dist - idist) > 0.05 and idist <= maxgap):
+                if 1 < idist <= maxgap or idist == 1:
+                    if not virtual:
+                        if fillmethod == 'interpolate':
+                            filler = a.ydata[-1] + (
+                                ((1.0 + num.arange(idist-1, dtype=num.float))
+                                 / idist) * (b.ydata[0]-a.ydata[-1])
+                            ).astype(a.ydata.dtype)
+                        else:
+                            filler = num.zeros(idist-1, dtype=a.ydata.dtype)
+                        a.ydata = num.concatenate((a.ydata, filler, b.ydata))
+                    a.tmax = b.tmax
+                    if a.mtime and b.mtime:
+                        a.mtime = max(a.mtime, b.mtime)
+                    continue
+
+                elif idist <= 0 and (maxlap is None or -maxlap < idist):
+                    if b.tmax > a.tmax:
+                        if not virtual:
+                            na = a.ydata.size
+                            n = -idist+1
+                            if deoverlap == 'use_second':
+                                a.ydata = num.concatenate(
+                                    (a.ydata[:-n], b.ydata))
+                            elif deoverlap in ('use_first', 'crossfade_cos'):
+                                a.ydata = num.concatenate(
+                                    (a.ydata, b.ydata[n:]))
+                            elif deoverlap == 'add':
+                                a.ydata[-n:] += b.ydata[:n]
+                                a.ydata = num.concatenate(
+                                    (a.ydata, b.ydata[n:]))
+
+                            if deoverlap == 'crossfade_cos':
+                                taper = 0.5-0.5*num.cos(
+                                    (1.+num.arange(n))/(1.+n)*num.pi)
+                                a.ydata[na-n:na] *= 1.-taper
+                                a.ydata[na-n:na] += b.ydata[:n] * taper
+
+                        a.tmax = b.tmax
+                        if a.mtime and b.mtime:
+                            a.mtime = max(a.mtime, b.mtime)
+                        continue
+                    else:
+                        continue
+
+        if b.data_len() >= 1:
+            out_traces.append(b)
+
+    for tr in out_traces:
+        tr._update_ids()
+
+    return out_traces
+
+
+def make_gappy_traces(nrecords, virtual=False, seed=0):
+    rstate = num.random.RandomState(seed)
+    traces = []
+    for sta in ['A', 'B']:
+        tmin = sometime
+        for irecord in range(nrecords):
+            nsamples = rstate.randint(1, 30)
+            tmin += rstate.choice([-5., -3., -1., 0., 1., 1., 2., 3., 6., 0.5])
+            tr = trace.Trace(
+                station=sta, tmin=tmin, deltat=1.0,
+                ydata=rstate.normal(size=nsamples),
+                mtime=float(rstate.randint(1000)))
+
+            if virtual:
+                tr.drop_data()
+
+            traces.append(tr)
+            tmin += nsamples - 1
+
+    traces.sort(key=lambda tr: tr.full_id)
+    return traces
+
+
 class TraceTestCase(unittest.TestCase):
 
     def testIntegrationDifferentiation(self):
@@ -125,6 +228,50 @@ class TraceTestCase(unittest.TestCase):
                 assert x.ydata.size == 18
                 assert numeq(x.ydata[8:10], res, 1e-6)
 
+    def testDegappingMany(self):
+        for virtual in [False, True]:
+            for fillmethod in ['interpolate', 'zeros']:
+                for deoverlap in ['use_second', 'use_first', 'crossfade_cos',
+                                  'add']:
+                    for maxlap in [None, 3]:
+                        traces1 = make_gappy_traces(300, virtual=virtual)
+                        traces2 = [tr.copy(data=not virtual)
+                                   for tr in traces1]
+
+                        kwargs = dict(
+                            fillmethod=fillmethod, deoverlap=deoverlap,
+                            maxlap=maxlap)
+
+                        xs1 = degapper_sequential(traces1, **kwargs)
+                        xs2 = trace.degapper(traces2, **kwargs)
+
+                        assert len(xs1) == len(xs2)
+                        for x1, x2 in zip(xs1, xs2):
+                            assert x1.full_id == x2.full_id
+                            assert x1.tmax == x2.tmax
+                            assert x1.mtime == x2.mtime
+                            if not virtual:
+                                num.testing.assert_array_equal(
+                                    x1.ydata, x2.ydata)
+
+    def benchmark_degapper(self):
+        for nrecords in [1000, 4000, 16000]:
+            traces = []
+            for irecord in range(nrecords):
+                traces.append(trace.Trace(
+                    tmin=sometime + irecord*100., deltat=1.0,
+                    ydata=num.random.normal(size=100)))
+
+            traces2 = [tr.copy() for tr in traces]
+
+            t0 = time.time()
+            degapper_sequential(traces)
+            t1 = time.time()
+            trace.degapper(traces2)
+            t2 = time.time()
+            print('%6i records, sequential: %8.3f s, degapper: %8.3f s' % (
+                nrecords, t1 - t0, t2 - t1))
+
     def testRotation(self):
         s2 = math.sqrt(2.)
         ndata = num.array([s2, s2], dtype=num.float)
@@ -684,6 +831,149 @@ class TraceTestCase(unittest.TestCase):
         tr2.ydata += tr1.ydata.mean()
         assert numeq(tr1.ydata, tr2.ydata, 0.01)
 
+    def test_filter_many(self):
+        traces = []
+        for i in range(10):
+            for deltat, n in [(0.01, 1000), (0.01, 777), (0.05, 1000)]:
+                traces.append(trace.Trace(
+                    station='S%i' % i, deltat=deltat, tmin=sometime,
+                    ydata=num.random.normal(size=n)))
+
+        batch_threading_min_size = trace.batch_threading_min_size
+        try:
+            for nthreads in [1, 2]:
+                trace.batch_threading_min_size = 0
+                for method, args in [
+                        ('lowpass', (4, 5.)),
+                        ('highpass', (4, 0.5)),
+                        ('bandpass', (4, 0.5, 5.))]:
+
+                    traces1 = [tr.copy() for tr in traces]
+                    traces2 = [tr.copy() for tr in traces]
+                    for tr in traces1:
+                        getattr(tr, method)(*args)
+
+                    getattr(trace, method + '_many')(
+                        traces2, *args, nthreads=nthreads)
+
+                    for tr1, tr2 in zip(traces1, traces2):
+                        num.testing.assert_allclose(
+                            tr1.ydata, tr2.ydata, rtol=1e-8, atol=1e-8)
+
+                resp = trace.ButterworthResponse(
+                    corner=2., order=4, type='low')
+
+                for kwargs in [
+                        dict(tfade=1.),
+                        dict(tfade=1., freqlimits=(0.1, 0.2, 5., 8.),
+                             transfer_function=resp, invert=True),
+                        dict(tfade=1., cut_off_fading=False)]:
+
+                    traces1 = [tr.transfer(**kwargs) for tr in traces]
+                    traces2 = trace.transfer_many(
+                        traces, nthreads=nthreads, **kwargs)
+
+                    for tr1, tr2 in zip(traces1, traces2):
+                        assert tr1.nslc_id == tr2.nslc_id
+                        assert tr1.tmin == tr2.tmin
+                        num.testing.assert_allclose(
+                            tr1.ydata, tr2.ydata, rtol=1e-8, atol=1e-8)
+
+        finally:
+            trace.batch_threading_min_size = batch_threading_min_size
+
+    def test_co_transfer(self):
+        deltat = 0.01
+        n = 20000
+        ydata = num.random.normal(size=n)
+        tr = trace.Trace(
+            station='S', deltat=deltat, tmin=sometime, ydata=ydata)
+
+        resp = trace.ButterworthResponse(corner=5., order=4, type='low')
+        freqlimits = (0.5, 1., 10., 20.)
+        ref = tr.transfer(
+            freqlimits=freqlimits, transfer_function=resp, invert=True)
+
+        results = []
+        for nchunk in [n, 777]:
+            out = []
+            pipe = trace.co_transfer(
+                trace.co_list_append(out), transfer_function=resp,
+                freqlimits=freqlimits, invert=True)
+
+            for i in range(0, n, nchunk):
+                pipe.send(trace.Trace(
+                    station='S', deltat=deltat, tmin=sometime + i*deltat,
+                    ydata=ydata[i:i+nchunk]))
+
+            pipe.close()
+
+            assert out[0].tmin == sometime
+            for tr1, tr2 in zip(out[:-1], out[1:]):
+                assert abs(tr2.tmin - (tr1.tmax + deltat)) < deltat * 0.01
+
+            results.append(num.concatenate([x.ydata for x in out]))
+
+        assert results[0].size == n
+        num.testing.assert_allclose(results[0], results[1], atol=1e-9)
+
+        amax = num.max(num.abs(ref.ydata))
+        assert num.max(num.abs(
+            results[0][2000:-2000] - ref.ydata[2000:-2000])) < 0.01 * amax
+
+    def test_stream_pipeline(self):
+        deltat = 0.01
+        n = 30000
+        ydata = num.random.normal(size=n) + 100.
+
+        def make_pipeline():
+            return trace.StreamPipeline([
+                trace.DemeanStage(tmean=10.),
+                trace.ButterworthStage(order=4, corner=(0.5, 10.),
+                                       btype='band'),
+                trace.DownsampleStage(deltat=0.05),
+                trace.StaLtaStage(tshort=1., tlong=20.)])
+
+        results = []
+        for nchunk in [n, 1111]:
+            pipeline = make_pipeline()
+            out = []
+            for i in range(0, n, nchunk):
+                out.extend(pipeline.process([
+                    trace.Trace(
+                        station=sta, deltat=deltat, tmin=sometime + i*deltat,
+                        ydata=ydata[i:i+nchunk] * fac)
+                    for (sta, fac) in [('A', 1.0), ('B', 2.0)]]))
+
+            out.extend(pipeline.flush())
+            assert pipeline.flush() == []
+
+            for sta in 'AB':
+                outsta = [tr for tr in out if tr.station == sta]
+                for tr1, tr2 in zip(outsta[:-1], outsta[1:]):
+                    assert tr2.deltat == 0.05
+                    assert abs(tr2.tmin - (tr1.tmax + tr1.deltat)) \
+                        < tr1.deltat * 0.01
+
+                results.append(num.concatenate([tr.ydata for tr in outsta]))
+
+            stats = pipeline.get_stats()
+            assert [s['name'] for s in stats] == [
+                'DemeanStage', 'ButterworthStage', 'DownsampleStage',
+                'StaLtaStage']
+
+            assert stats[0]['nsamples'] == 2*n
+            assert stats[0]['ntraces'] == 2*len(range(0, n, nchunk))
+            assert stats[3]['nsamples'] == results[-1].size * 2
+
+        # STA/LTA is independent of amplitude and of chunking
+        num.testing.assert_allclose(
+            results[0], results[1], rtol=1e-6, atol=1e-9)
+        num.testing.assert_allclose(
+            results[0], results[2], rtol=1e-6, atol=1e-9)
+        num.testing.assert_allclose(
+            results[0], results[3], rtol=1e-6, atol=1e-9)
+
     def test_muliply_taper(self):
 
         taper = trace.CosTaper(0., 1., 2., 3.)